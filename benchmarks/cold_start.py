@@ -0,0 +1,80 @@
+''' Cold start benchmark of the api function.
+
+    Every run starts a fresh interpreter and measures how long it takes to import the
+    app and to load what each kind of request needs, in the order a cold container
+    loads them. A -X importtime run lists the slowest modules.
+
+    Usage: python benchmarks/cold_start.py [--runs 10] [--output cold_start.json]
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+from report import ROOT, summarise, write
+
+ENV = {**os.environ, 'SERVICE_NAME': 'rebound-ctrl', 'STAGE': 'dev', 'AWS_DEFAULT_REGION': 'us-east-1'}
+
+# Stages are cumulative: each one only pays for the modules the previous ones did not load
+STAGES_SCRIPT = '''
+import sys, json, time
+times = {}
+start = time.perf_counter()
+import src.index
+times['import_app'] = time.perf_counter() - start
+
+start = time.perf_counter()
+src.index.app.test_client().get('/favicon.ico')
+times['first_request'] = time.perf_counter() - start
+
+from src.app import controller
+start = time.perf_counter()
+controller.service.MAX_HOST_WORKERS
+times['load_service'] = time.perf_counter() - start
+
+start = time.perf_counter()
+import paramiko
+times['load_ssh'] = time.perf_counter() - start
+
+start = time.perf_counter()
+controller.service.models.SimulationModel
+times['load_models'] = time.perf_counter() - start
+
+print(json.dumps({'times': times, 'modules': len(sys.modules)}))
+'''
+
+def run_stages():
+    output = subprocess.run([sys.executable, '-c', STAGES_SCRIPT], cwd=ROOT, env=ENV, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+def import_profile(module, top):
+    ''' Slowest modules (cumulative microseconds) when importing module, from python -X importtime. '''
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=ENV, capture_output=True, text=True, check=True)
+    modules = []
+    for line in output.stderr.splitlines():
+        if(not line.startswith('import time:') or 'cumulative' in line):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    return sorted(modules, key=lambda m: m['cumulative_us'], reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start benchmark of the api function.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules listed in the import profile')
+    parser.add_argument('--output', help='JSON file with the results (printed if not set)')
+    args = parser.parse_args()
+
+    runs = [run_stages() for _ in range(args.runs)]
+    stages = {stage: summarise([run['times'][stage] for run in runs]) for stage in runs[0]['times']}
+    results = {
+        'runs': args.runs,
+        'seconds': stages,
+        'import_profile': import_profile('src.index', args.top),
+    }
+    metrics = {f'{stage}.seconds': values['median'] for stage, values in stages.items()}
+    write('cold_start', results, metrics, args.output)
+
+
+if(__name__ == '__main__'):
+    main()
\ No newline at end of file
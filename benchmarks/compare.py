@@ -0,0 +1,53 @@
+''' Compare the metrics of a benchmark report with a baseline report of the same benchmark.
+
+    Metrics ending in _per_second regress when they go down, every other metric
+    (seconds, MB) when it goes up. Exits with status 1 when a metric is worse
+    than the baseline by more than the threshold, so it can gate a deploy.
+
+    Usage: python benchmarks/compare.py baseline.json current.json [--threshold 0.2]
+'''
+import sys
+import json
+import argparse
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def change(name, baseline, current):
+    ''' Relative change of the metric, positive when it got worse. '''
+    if(baseline == 0):
+        return 0.0
+    ratio = (current - baseline) / baseline
+    return -ratio if name.endswith('_per_second') else ratio
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a benchmark report with a baseline.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change considered a regression')
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    if(baseline['benchmark'] != current['benchmark']):
+        raise Exception(f'Reports are of different benchmarks: {baseline["benchmark"]} and {current["benchmark"]}.')
+
+    regressions = []
+    for name, value in current['metrics'].items():
+        if(name not in baseline['metrics']):
+            print(f'{name:<60} {value:>12.4g}  (new)')
+            continue
+        previous = baseline['metrics'][name]
+        flag = 'REGRESSION' if change(name, previous, value) > args.threshold else ''
+        relative = (value - previous) / previous if previous else 0.0
+        print(f'{name:<60} {previous:>12.4g} -> {value:<12.4g} {relative:+8.1%} {flag}')
+        if(flag):
+            regressions.append(name)
+
+    if(regressions):
+        print(f'{len(regressions)} metrics regressed more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if(__name__ == '__main__'):
+    main()
\ No newline at end of file
@@ -0,0 +1,195 @@
+''' Latency benchmark of the control plane.
+
+    Runs create_simulation and check_simulations_status of the service against
+    local infrastructure instead of AWS:
+
+    - an SSH server where simulations are deployed (e.g. sshd on localhost or the
+      linuxserver/openssh-server container, with python3 and rebound installed),
+    - moto server for S3 and Secrets Manager, started by the benchmark,
+    - DynamoDB Local (docker run -p 8000:8000 amazon/dynamodb-local), or moto
+      with --dynamodb-endpoint moto.
+
+    Tables, bucket and app secret are created from serverless.yml. Every create
+    probes the host again, otherwise the cores reserved by previous creates would
+    queue the next ones. Hosts without a free core (by load average) queue
+    simulations instead of deploying them, so creates are reported by status.
+    Simulations are tiny grids, so status checks see them
+    finish and harvest. Created simulations are deleted at the end.
+
+    Usage: python benchmarks/control_plane.py --ssh-host localhost --ssh-port 2222 --ssh-user user --ssh-password pass
+           [--dynamodb-endpoint http://localhost:8000] [--simulations 10] [--rounds 5] [--output control_plane.json]
+'''
+import os
+import sys
+import json
+import time
+import getpass
+import logging
+import argparse
+from report import ROOT, summarise, write
+
+STAGE = 'benchmark'
+
+def configure_environment(args):
+    ''' Point the AWS clients of the service to local endpoints. Must run before the service is imported. '''
+    from moto.server import ThreadedMotoServer
+    server = ThreadedMotoServer(port=args.moto_port, verbose=False)
+    server.start()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # Request log of moto server
+    moto_url = f'http://127.0.0.1:{args.moto_port}'
+
+    os.environ.update({
+        'SERVICE_NAME': 'rebound-ctrl',
+        'STAGE': STAGE,
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_ENDPOINT_URL_S3': moto_url,
+        'AWS_ENDPOINT_URL_SECRETS_MANAGER': moto_url,
+        'AWS_ENDPOINT_URL_DYNAMODB': moto_url if args.dynamodb_endpoint == 'moto' else args.dynamodb_endpoint,
+    })
+    os.environ.pop('HARVEST_QUEUE_URL', None)               # Harvest jobs run in a background thread
+    os.chdir(ROOT)                                          # The boilerplate is bundled from src/boilerplate
+    sys.path.insert(0, ROOT)
+    return server
+
+def load_resources():
+    ''' CloudFormation resources of serverless.yml, with the service and stage variables replaced. '''
+    import yaml
+
+    class Loader(yaml.SafeLoader):
+        pass
+    Loader.add_multi_constructor('!', lambda loader, suffix, node: None)
+
+    with open(os.path.join(ROOT, 'serverless.yml')) as f:
+        content = f.read().replace('${self:service}', 'rebound-ctrl').replace('${self:provider.stage}', STAGE)
+    return yaml.load(content, Loader=Loader)['resources']['Resources']
+
+def create_resources(args):
+    ''' Simulations table, files bucket and app secret with the credentials of the SSH server. '''
+    from src.lib import utils
+    from src.lib.adapters import aws_clients
+    resources = load_resources()
+
+    dynamodb = aws_clients.get_client('dynamodb')
+    table = resources['SimulationsTable']['Properties']
+    if(table['TableName'] in dynamodb.list_tables()['TableNames']):
+        dynamodb.delete_table(TableName=table['TableName'])
+        dynamodb.get_waiter('table_not_exists').wait(TableName=table['TableName'])
+    dynamodb.create_table(**table)
+    dynamodb.get_waiter('table_exists').wait(TableName=table['TableName'])
+
+    aws_clients.get_client('s3').create_bucket(Bucket=resources['ProjectBucket']['Properties']['BucketName'])
+
+    credentials = {'username': args.ssh_user, 'password': args.ssh_password, 'port': args.ssh_port}
+    secret = aws_clients.get_client('secretsmanager').create_secret(
+        Name=resources['AppSecret']['Properties']['Name'],
+        SecretString=json.dumps({'ssh_keys': {args.ssh_host: credentials}}),
+    )
+    utils.app_secrets.secret_name = secret['ARN']
+
+def simulation_payload(args, i):
+    return {
+        'name': f'benchmark {i}',
+        'host': args.ssh_host,
+        'simulation_type': 'grid',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': args.years,
+        'num_logs': 1,
+        'ejection_max_distance': 100,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2, 'e': 0.048}],
+        'grid': {'N': 2, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}},
+    }
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def bench_create(service, args):
+    latencies, simulations = [], []
+    for i in range(args.simulations):
+        service.host_capacity.clear()
+        simulation, seconds = timed(service.create_simulation, simulation_payload(args, i))
+        latencies.append(seconds)
+        simulations.append(simulation)
+    return simulations, latencies
+
+def bench_check_status(service, simulations, args):
+    ''' Check every simulation together, as the dashboard does, once per round. '''
+    latencies, statuses = [], []
+    for _ in range(args.rounds):
+        simulations, seconds = timed(service.check_simulations_status, [dict(simulation) for simulation in simulations])
+        latencies.append(seconds)
+        statuses.append(count(simulation['status'] for simulation in simulations))
+        time.sleep(args.interval)
+    return latencies, statuses
+
+def count(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of the control plane.')
+    parser.add_argument('--ssh-host', default='localhost')
+    parser.add_argument('--ssh-port', type=int, default=22)
+    parser.add_argument('--ssh-user', default=getpass.getuser())
+    parser.add_argument('--ssh-password')
+    parser.add_argument('--dynamodb-endpoint', default='http://localhost:8000', help='DynamoDB Local URL, or moto')
+    parser.add_argument('--moto-port', type=int, default=5005)
+    parser.add_argument('--simulations', type=int, default=10, help='Simulations created')
+    parser.add_argument('--years', type=float, default=1, help='Years integrated by each simulation')
+    parser.add_argument('--rounds', type=int, default=5, help='Status checks of every simulation')
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between status checks')
+    parser.add_argument('--output', help='JSON file with the results (printed if not set)')
+    args = parser.parse_args()
+
+    server = configure_environment(args)
+    try:
+        from src.app import service
+        create_resources(args)
+
+        simulations, create_latencies = bench_create(service, args)
+        check_latencies, statuses = bench_check_status(service, simulations, args)
+        _, harvest_seconds = timed(service.get_harvest_queue().join)
+        for simulation in simulations:
+            service.delete_simulation(simulation['id'])
+        with service.connect(args.ssh_host) as ssh:              # Finished simulations are only deleted from s3
+            ssh.cmd('rm -rf ' + ' '.join(f'rebound-ctrl/simulations/{simulation["id"]}' for simulation in simulations))
+    finally:
+        server.stop()
+
+    results = {
+        'ssh_host': args.ssh_host,
+        'dynamodb': 'moto' if args.dynamodb_endpoint == 'moto' else 'dynamodb-local',
+        'create_simulation': {
+            'seconds': summarise(create_latencies),
+            'first': create_latencies[0],
+            'by_status': {
+                status: summarise([seconds for simulation, seconds in zip(simulations, create_latencies) if simulation['status'] == status])
+                for status in count(simulation['status'] for simulation in simulations)
+            },
+        },
+        'check_simulations_status': {
+            'simulations': len(simulations),
+            'seconds': summarise(check_latencies),
+            'rounds': [{'seconds': seconds, 'statuses': counts} for seconds, counts in zip(check_latencies, statuses)],
+        },
+        'harvest_wait': harvest_seconds,                    # Time left for harvest jobs after the last check
+    }
+    metrics = {f'create_simulation.{status}.seconds': values['median'] for status, values in results['create_simulation']['by_status'].items()}
+    metrics.update({
+        'create_simulation.seconds': results['create_simulation']['seconds']['median'],
+        'create_simulation.p90_seconds': results['create_simulation']['seconds']['p90'],
+        'check_simulations_status.seconds': results['check_simulations_status']['seconds']['median'],
+        'check_simulations_status.p90_seconds': results['check_simulations_status']['seconds']['p90'],
+    })
+    write('control_plane', results, metrics, args.output)
+
+
+if(__name__ == '__main__'):
+    main()
\ No newline at end of file
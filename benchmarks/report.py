@@ -0,0 +1,50 @@
+''' Helpers shared by the benchmarks, so every report has the same shape.
+
+    Each report is a JSON object with the benchmark name, the environment it ran
+    in, detailed results and a flat "metrics" object (name -> number) that
+    compare.py checks against a baseline. Metrics ending in _per_second are
+    better when higher, every other metric (seconds, MB) when lower.
+'''
+import os
+import sys
+import json
+import platform
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def summarise(values):
+    values = sorted(values)
+    return {
+        'median': statistics.median(values),
+        'min': values[0],
+        'max': values[-1],
+        'p90': values[min(int(len(values) * 0.9), len(values) - 1)],
+    }
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except Exception:
+        return None
+
+def environment():
+    ''' Where the benchmark ran, results are only comparable on similar machines. '''
+    return {
+        'date': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+def write(benchmark, results, metrics, output=None):
+    ''' Print the report and save it to output when given. '''
+    report = json.dumps({'benchmark': benchmark, 'environment': environment(), 'metrics': metrics, **results}, indent=4)
+    if(output):
+        with open(output, 'w') as f:
+            f.write(report)
+    print(report)
\ No newline at end of file
@@ -0,0 +1,201 @@
+''' Throughput benchmark of the simulation boilerplate.
+
+    Every case runs in a fresh copy of src/boilerplate, in its own process, the way
+    hosts run simulations:
+
+    - default: DefaultSimulation with each integrator.
+    - grid: GridSimulation cells per second for each grid size, number of cores
+      and integrator.
+    - export: export_results and charts.py of a large grid. Results are filled
+      with random values first, so only exporting and plotting are measured.
+
+    Time, CPU time and peak memory (MB, of the largest process) are measured by a
+    parent process that only waits for the case to finish.
+
+    Usage: python benchmarks/simulations.py [--grid-sizes 8 16] [--cores 1 2] [--integrators whfast ias15]
+           [--export-sizes 1000] [--repeat 3] [--output simulations.json]
+'''
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+import statistics
+from report import ROOT, write
+
+BOILERPLATE = os.path.join(ROOT, 'src', 'boilerplate')
+
+# Sun, Jupiter and Saturn, the grid moves a massless particle through the inner system
+PARTICLES = [
+    {'m': 1.0},
+    {'m': 9.55e-4, 'a': 5.2, 'e': 0.048},
+    {'m': 2.86e-4, 'a': 9.58, 'e': 0.056},
+]
+GRID_PARTICLE = {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}
+
+# Runs a command and reports its resource usage, so it only counts the case processes
+MEASURE_SCRIPT = '''
+import sys, json, time, resource, subprocess
+start = time.perf_counter()
+process = subprocess.run(sys.argv[1:], capture_output=True, text=True)
+seconds = time.perf_counter() - start
+usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+print(json.dumps({
+    'seconds': seconds,
+    'cpu_seconds': usage.ru_utime + usage.ru_stime,
+    'peak_rss': usage.ru_maxrss / 1024,
+    'returncode': process.returncode,
+    'output': (process.stdout + process.stderr)[-2000:],
+}))
+'''
+
+# Fills the result files of a grid with random values, as if every cell had run
+PREPARE_SCRIPT = '''
+import json
+import numpy as np
+from problem import GridSimulation
+with open('meta.json') as f:
+    sim = GridSimulation(json.load(f))
+writer = sim.create_writer()
+rng = np.random.default_rng(0)
+for name, array in writer.arrays().items():
+    array[:] = rng.random(array.shape)
+writer.cells['stop_reason'][:] = 0
+writer.close()
+'''
+
+EXPORT_SCRIPT = '''
+import json
+from problem import GridSimulation
+with open('meta.json') as f:
+    sim = GridSimulation(json.load(f))
+sim.export_results(sim.create_writer(resume=True))
+'''
+
+def create_meta(simulation_type, integrator, years, cores=1, n=None):
+    meta = {
+        'id': f'benchmark-{simulation_type}',
+        'simulation_type': simulation_type,
+        'cores': cores,
+        'integrator': integrator,
+        'years': years,
+        'num_logs': 10,
+        'ejection_max_distance': 100,
+        'timestep': 0.01,
+        'particles': PARTICLES,
+    }
+    if(simulation_type == 'default'):
+        meta['particles'] = PARTICLES + [{'m': 0.0, 'a': 2.5, 'e': 0.1}]
+    else:
+        meta['grid'] = {'N': n, 'particle': GRID_PARTICLE, 'export_csv': True}
+    return meta
+
+def create_workspace(meta):
+    ''' Copy of the boilerplate with the meta.json of the case. '''
+    folder = tempfile.mkdtemp(prefix='rebound-benchmark-')
+    shutil.copytree(BOILERPLATE, folder, dirs_exist_ok=True, ignore=shutil.ignore_patterns('__pycache__'))
+    os.makedirs(os.path.join(folder, 'results'), exist_ok=True)
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return folder
+
+def measure(command, folder):
+    output = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT, *command], cwd=folder, capture_output=True, text=True, check=True)
+    usage = json.loads(output.stdout)
+    if(usage.pop('returncode') != 0):
+        raise Exception(f'{" ".join(command)} failed: {usage["output"]}')
+    del usage['output']
+    return usage
+
+def run_simulation(meta, repeat):
+    ''' Run the simulation repeat times, keeping the run with the median time. '''
+    runs = []
+    for _ in range(repeat):
+        folder = create_workspace(meta)
+        try:
+            usage = measure([sys.executable, 'problem.py'], folder)
+            with open(os.path.join(folder, 'results', 'results.json')) as f:
+                results = json.load(f)
+            if(results.get('status') != 'finished'):
+                raise Exception(f'Simulation failed: {results.get("error")}')
+            runs.append(usage)
+        finally:
+            shutil.rmtree(folder)
+    runs.sort(key=lambda run: run['seconds'])
+    return {**runs[len(runs) // 2], 'runs': [run['seconds'] for run in runs]}
+
+def bench_default(integrators, years, repeat):
+    cases = []
+    for integrator in integrators:
+        usage = run_simulation(create_meta('default', integrator, years), repeat)
+        cases.append({'integrator': integrator, 'years': years, **usage, 'years_per_second': years / usage['seconds']})
+    return cases
+
+def bench_grid(sizes, cores, integrators, years, repeat):
+    cases = []
+    for n in sizes:
+        for num_cores in cores:
+            for integrator in integrators:
+                usage = run_simulation(create_meta('grid', integrator, years, num_cores, n), repeat)
+                cells = n * n
+                cases.append({
+                    'n': n,
+                    'cores': num_cores,
+                    'integrator': integrator,
+                    'years': years,
+                    **usage,
+                    'cells_per_second': cells / usage['seconds'],
+                    'utilisation': usage['cpu_seconds'] / (usage['seconds'] * num_cores),
+                })
+    return cases
+
+def bench_export(sizes):
+    cases = []
+    for n in sizes:
+        folder = create_workspace(create_meta('grid', 'whfast', 1, n=n))
+        try:
+            subprocess.run([sys.executable, '-c', PREPARE_SCRIPT], cwd=folder, check=True)
+            export = measure([sys.executable, '-c', EXPORT_SCRIPT], folder)
+            charts = measure([sys.executable, 'charts.py'], folder)
+            cases.append({'n': n, 'export': export, 'charts': charts})
+        finally:
+            shutil.rmtree(folder)
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput benchmark of the simulation boilerplate.')
+    parser.add_argument('--integrators', nargs='+', default=['whfast', 'ias15'])
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[8, 16])
+    parser.add_argument('--cores', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--grid-years', type=float, default=100, help='Years integrated by each grid cell')
+    parser.add_argument('--default-years', type=float, default=1000, help='Years integrated by the default simulation')
+    parser.add_argument('--export-sizes', type=int, nargs='*', default=[1000], help='Grid sizes (N) exported and plotted')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each simulation case, the median is reported')
+    parser.add_argument('--output', help='JSON file with the results (printed if not set)')
+    args = parser.parse_args()
+
+    results = {
+        'default': bench_default(args.integrators, args.default_years, args.repeat),
+        'grid': bench_grid(args.grid_sizes, args.cores, args.integrators, args.grid_years, args.repeat),
+        'export': bench_export(args.export_sizes),
+    }
+
+    metrics = {}
+    for case in results['default']:
+        metrics[f'default.{case["integrator"]}.years_per_second'] = case['years_per_second']
+        metrics[f'default.{case["integrator"]}.peak_rss'] = case['peak_rss']
+    for case in results['grid']:
+        name = f'grid.n{case["n"]}.cores{case["cores"]}.{case["integrator"]}'
+        metrics[f'{name}.cells_per_second'] = case['cells_per_second']
+        metrics[f'{name}.peak_rss'] = case['peak_rss']
+    for case in results['export']:
+        for step in ('export', 'charts'):
+            metrics[f'{step}.n{case["n"]}.seconds'] = case[step]['seconds']
+            metrics[f'{step}.n{case["n"]}.peak_rss'] = case[step]['peak_rss']
+    write('simulations', results, metrics, args.output)
+
+
+if(__name__ == '__main__'):
+    main()
\ No newline at end of file
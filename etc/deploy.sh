@@ -0,0 +1,13 @@
+#!/bin/bash
+
+# This script will deploy the service and backfill the records saved by older versions.
+# Usage: ./etc/deploy.sh [stage]
+
+set -e
+
+stage=${1:-dev}
+
+sls deploy --stage $stage
+
+# Simulations saved before the listing indexes have no kind, so the default listing misses them
+sls invoke --function backfillKinds --stage $stage
\ No newline at end of file
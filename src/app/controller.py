@@ -1,30 +1,135 @@
-from flask import Blueprint, jsonify, request as req, Response
-from src.app.models import SimulationModel
-from src.app import service
+import gzip
+import json
+from flask import Blueprint, jsonify, request as req, Response, redirect, stream_with_context
+from src.lib import utils
+
+service = utils.lazy_import('src.app.service')  # Loaded by the first route that needs it
 
 blueprint = Blueprint('rebound-ctrl', __name__)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024                       # Bytes per chunk of the streamed downloads
+DEFAULT_PAGE_SIZE = 50                                  # Simulations per page when listing
+MAX_PAGE_SIZE = 500
+MAX_LOG_WAIT = 20                                       # Max seconds a logs request waits for new lines
+LOG_STREAM_TIMEOUT = 25                                 # Seconds a logs event stream stays open (API timeout is 30)
+
 @blueprint.route('/hosts', methods=['GET'])
 def fetch_hosts():
     return jsonify(data=service.fetch_hosts())
 
+@blueprint.route('/hosts/capacity', methods=['GET'])
+def fetch_hosts_capacity():
+    ''' Free cores, memory and running jobs of every host, probed at most once a minute. '''
+    return jsonify(data=service.fetch_hosts_capacity(service.fetch_hosts()))
+
 @blueprint.route('/simulations', methods=['GET'])
 def fetch_simulations():
-    simulations = [s.to_dict() for s in SimulationModel.scan().limit(10000)]
-    return jsonify(data=simulations)
+    ''' Newest simulations first, MAX_PAGE_SIZE at most per page. Filters: status, host and kind
+        ('simulation' or 'shard'). Pass the returned cursor to get the next page, and full=true
+        to get every field instead of the summary.
+    '''
+    simulations, cursor = service.list_simulations(
+        limit=min(int(req.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE),
+        cursor=req.args.get('cursor'),
+        status=req.args.get('status'),
+        host=req.args.get('host'),
+        kind=req.args.get('kind'),
+        full=req.args.get('full', '').lower() in ('1', 'true'),
+    )
+    return jsonify(data=simulations, cursor=cursor)
+
+@blueprint.route('/simulations/progress', methods=['GET'])
+def fetch_simulations_progress():
+    ''' Progress of the simulations in ?ids (comma separated, MAX_PAGE_SIZE at most), read from the
+        progress.json file each running simulation keeps up to date.
+    '''
+    ids = [id for id in req.args.get('ids', '').split(',') if id]
+    if(len(ids) > MAX_PAGE_SIZE):
+        return jsonify({'error': f'At most {MAX_PAGE_SIZE} simulations per request.'}), 400
+    return jsonify(data=service.fetch_simulations_progress(ids))
+
+@blueprint.route('/simulations/<id>/progress', methods=['GET'])
+def fetch_simulation_progress(id):
+    progress = service.fetch_simulations_progress([id])
+    if(not progress):
+        return jsonify({'error': 'Simulation not found.'}), 404
+    return jsonify(data=progress[0])
+
+@blueprint.route('/simulations/<id>', methods=['GET'])
+def fetch_simulation(id):
+    simulation = service.fetch_simulation(id)
+    if(simulation is None):
+        return jsonify({'error': 'Simulation not found.'}), 404
+    return jsonify(data=simulation)
+
+def compress(response):
+    ''' Gzip the response body if the client accepts it. '''
+    if('gzip' in req.headers.get('Accept-Encoding', '')):
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @blueprint.route('/simulations/<id>/logs', methods=['GET'])
 def fetch_simulation_logs(id):
+    ''' Whole logs, or with ?offset=N only the logs after byte N and the next offset.
+        ?wait=S waits up to S seconds for new logs (long poll), and ?stream=true
+        (or Accept: text/event-stream) sends them as server-sent events.
+    '''
     host = req.args.get('host')
-    return service.fetch_simulation_logs(id, host)
+    offset = req.args.get('offset')
+    if(req.args.get('stream', '').lower() in ('1', 'true') or 'text/event-stream' in req.headers.get('Accept', '')):
+        cursor = req.headers.get('Last-Event-ID', offset)
+        return Response(stream_with_context(stream_logs(id, cursor)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    if(offset is None):
+        return compress(Response(service.fetch_simulation_logs(id, host), mimetype='text/html'))
+    wait = min(float(req.args.get('wait', 0)), MAX_LOG_WAIT)
+    return compress(jsonify(data=service.wait_simulation_logs(id, offset, wait)))
+
+def stream_logs(id, cursor):
+    for result in service.stream_simulation_logs(id, cursor, LOG_STREAM_TIMEOUT):
+        yield f'id: {result["offset"]}\nevent: logs\ndata: {json.dumps(result)}\n\n'
+        if(result['status'] != 'running'):
+            yield 'event: end\ndata: {}\n\n'
+
+def stream_file(file, mimetype, filename):
+    ''' Response streaming an s3 object, partial (206) when it was fetched with a Range. '''
+    if(file is None):
+        return jsonify({'error': 'Requested range not satisfiable.'}), 416
+    body = file['Body']
+    response = Response(stream_with_context(body.iter_chunks(DOWNLOAD_CHUNK_SIZE)), mimetype=mimetype)
+    if(file.get('ContentRange')):
+        response.status_code = 206
+        response.headers['Content-Range'] = file['ContentRange']
+    response.headers['Content-Length'] = file['ContentLength']
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers.add('Access-Control-Expose-Headers', f'Content-Disposition, Content-Range, Accept-Ranges')
+    response.headers.add('Content-Disposition', f'attachment; filename={filename}')
+    response.call_on_close(body.close)
+    return response
 
 @blueprint.route('/simulations/<id>/results', methods=['GET'])
 def download_simulation_results(id):
-    file = service.download_simulation_results(id)
-    response = Response(file, mimetype='application/tar+gzip')
-    response.headers.add('Access-Control-Expose-Headers', f'Content-Disposition')
-    response.headers.add('Content-Disposition', f'attachment; filename=results-{id}.tar.gz')
-    return response
+    ''' Streams the results archive. Supports Range requests to resume downloads,
+        and ?redirect=true to redirect to a temporary s3 link instead (large archives).
+    '''
+    if(req.args.get('redirect', '').lower() in ('1', 'true')):
+        return redirect(service.simulation_results_url(id))
+    file = service.open_simulation_results(id, req.headers.get('Range'))
+    return stream_file(file, 'application/tar+gzip', f'results-{id}.tar.gz')
+
+@blueprint.route('/simulations/<id>/results/summary', methods=['GET'])
+def fetch_results_summary(id):
+    return jsonify(data=service.fetch_results_summary(id))
+
+@blueprint.route('/simulations/<id>/files', methods=['GET'])
+def fetch_result_files(id):
+    return jsonify(data=service.fetch_result_files(id))
+
+@blueprint.route('/simulations/<id>/files/<path:name>', methods=['GET'])
+def download_result_file(id, name):
+    file = service.open_result_file(id, name, req.headers.get('Range'))
+    return stream_file(file, file and file.get('ContentType'), name.split('/')[-1])
 
 @blueprint.route('/simulations', methods=['POST'])
 def create_simulation():
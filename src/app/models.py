@@ -1,12 +1,41 @@
-from dynamorm import DynaModel
+from dynamorm import DynaModel, GlobalIndex, ProjectInclude
 from marshmallow import Schema, fields
 from src.constants import SIMULATIONS_TABLE, SIMULATIONS_RESULTS_TABLE
 
 
+# Attributes returned when listing simulations (particles and grid are left out)
+SUMMARY_FIELDS = (
+    'name', 'description', 'status', 'process_id', 'host', 'hosts', 'simulation_type',
+    'cores', 'years', 'shards', 'parent_id', 'kind',
+)
+
+def summary_projection(hash_key):
+    ''' Index keys are always projected, they can not be listed again. '''
+    return ProjectInclude(*[field for field in SUMMARY_FIELDS if field != hash_key])
+
 class SimulationModel(DynaModel):
     class Table:
         name = SIMULATIONS_TABLE
         hash_key = 'id'
+    
+    # Every index is sorted by created_at, newest first when queried in reverse
+    class ByKind(GlobalIndex):
+        name = 'kind-created_at-index'
+        hash_key = 'kind'                       # 'simulation' or 'shard'
+        range_key = 'created_at'
+        projection = summary_projection('kind')
+    
+    class ByStatus(GlobalIndex):
+        name = 'status-created_at-index'
+        hash_key = 'status'
+        range_key = 'created_at'
+        projection = summary_projection('status')
+    
+    class ByHost(GlobalIndex):
+        name = 'host-created_at-index'
+        hash_key = 'host'
+        range_key = 'created_at'
+        projection = summary_projection('host')
         
     class SimulationSchema(Schema):
         id = fields.Str()
@@ -25,6 +54,10 @@ class SimulationModel(DynaModel):
         particles = fields.List(fields.Dict())
         grid = fields.Dict()
         created_at = fields.Str()
+        hosts = fields.List(fields.Str())
+        shards = fields.List(fields.Str())
+        parent_id = fields.Str()
+        kind = fields.Str()
 
     class Schema(SimulationSchema):
         def __init__(self, *args, **kwargs):
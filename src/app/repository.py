@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from dynamorm.exceptions import ConditionFailed
+from src.app.models import SimulationModel
+
+BATCH_GET_SIZE = 100                            # Max keys per BatchGetItem
+MAX_WRITE_WORKERS = 16                          # Max conditional updates sent at the same time
+
+# Statuses a simulation can move to, and the statuses it must have to do so. Status updates
+# are conditional, so when two requests check the same simulation only one of them moves it
+# (e.g. only one of them queues its harvest).
+TRANSITIONS = {
+    'starting': ('queued',),
+    'running': ('starting',),
+    'harvesting': ('running',),
+    'finished': ('harvesting',),
+    'failed': ('starting', 'running', 'harvesting'),
+    'unkwown': ('running',),
+}
+
+def save(simulation):
+    SimulationModel(**simulation).save()
+
+def save_batch(simulations):
+    ''' Save several simulations with BatchWriteItem (25 items per request, retried by boto3). '''
+    if(simulations):
+        SimulationModel.put_batch(*simulations)
+
+def get_batch(ids):
+    ''' Simulations by id, in the same order, with BatchGetItem. Missing ids are left out. '''
+    items = {}
+    for i in range(0, len(ids), BATCH_GET_SIZE):
+        keys = [{'id': id} for id in ids[i:i + BATCH_GET_SIZE]]
+        items.update({item.id: item for item in SimulationModel.get_batch(keys)})
+    return [items[id] for id in ids if id in items]
+
+def fetch_statuses(ids):
+    return {simulation.id: simulation.status for simulation in get_batch(list(ids))}
+
+def transition(id, status, **attributes):
+    ''' Move the simulation to status if its current status allows it, setting the given attributes
+        in the same write. Returns whether it was updated.
+    '''
+    if(status not in TRANSITIONS):
+        raise Exception(f'Invalid simulation status: {status}')
+    try:
+        SimulationModel.update_item(id=id, status=status, **attributes, conditions={'status__is_in': list(TRANSITIONS[status])})
+        return True
+    except ConditionFailed:
+        return False
+
+def transition_batch(changes):
+    ''' Apply several (id, status) transitions concurrently. DynamoDB batches can not have conditions
+        and a transaction fails whole if one condition fails, so each one is an independent update.
+        Returns the ids that were updated.
+    '''
+    if(not changes):
+        return set()
+    with ThreadPoolExecutor(max_workers=min(len(changes), MAX_WRITE_WORKERS)) as executor:
+        results = executor.map(lambda change: transition(*change), changes)
+        return {id for (id, status), updated in zip(changes, results) if updated}
\ No newline at end of file
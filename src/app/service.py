@@ -1,188 +1,934 @@
+import os
 import json
+import base64
+import mimetypes
 import time
+import tarfile
+import tempfile
 import traceback
 from io import BytesIO
 from uuid import uuid4
 from decimal import Decimal
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from src.lib.adapters.ssh_adapter import SSHClient
+from src.lib.adapters import ssh_adapter
 from src.lib.adapters import s3_adapter
+from src.lib.adapters import queue_adapter
 from src.lib import utils
-from src.app.models import SimulationModel
-from src.constants import STAGE
+from src.lib import grid_results
+from src.constants import STAGE, HARVEST_QUEUE_URL
 
-def fetch_hosts():
-    return list(utils.get_ssh_keys().keys())
+# Loaded on first use, requests that only talk to the hosts do not load dynamorm
+models = utils.lazy_import('src.app.models')
+repository = utils.lazy_import('src.app.repository')
+
+MAX_HOST_WORKERS = 16                           # Max hosts checked at the same time
+HOST_CAPACITY_TTL = 60                          # Seconds the capacity of a host is reused before probing it again
+MIN_FREE_MEMORY_MB = 512                        # Memory a host needs free to receive a simulation
+LOAD_SLACK = 0.5                                # Fraction of a core the load average may take and still count the core as free
+DISPATCH_BATCH_SIZE = 25                        # Queued simulations considered by each dispatch
+DB_ONLY_STATUSES = ('queued', 'starting', 'harvesting')  # Statuses only updated from the database
+DEPLOY_READY_TIMEOUT = 5                        # Max seconds to wait for a new simulation to start logging
+DEPLOY_POLL_INTERVAL = 0.1                      # Seconds between checks while waiting
+BOILERPLATE_FILES = [
+    'problem/__init__.py', 'problem/types/default.py', 'problem/types/grid.py', 'problem/types/adaptive_grid.py',
+    'problem/utils.py', 'problem/checkpoint.py', 'problem/writer.py', 'problem/scheduler.py', 'problem/batch.py',
+    'problem/profiler.py', 'problem/progress.py',
+    'problem.py', 'charts.py', 'README.md',
+]
+TRANSFER_PART_SIZE = 8 * 1024 * 1024            # Bytes per part of the transfers from the hosts to s3
+RESULTS_URL_EXPIRATION = 3600                   # Seconds the results download links are valid
+RESULT_FOLDERS = ('results', 'charts')          # Folders whose files are also saved one by one in s3
+LOG_CHUNK_SIZE = 256 * 1024                     # Max bytes of logs returned by each tail request
+LOG_POLL_INTERVAL = 1                           # Seconds between log reads while waiting for new lines
+PROGRESS_STALL_TIMEOUT = 60                     # Seconds without progress.json updates before a running simulation is stalled
+
+harvest_queue = None
+host_capacity = {}                              # Host -> last capacity probed, with its checked_at time
+
+def get_harvest_queue():
+    ''' Queue of the jobs that save finished simulations in s3, processed outside the requests. '''
+    global harvest_queue
+    if(harvest_queue is None):
+        if(HARVEST_QUEUE_URL):
+            harvest_queue = queue_adapter.SQSQueue(HARVEST_QUEUE_URL)
+        else:
+            harvest_queue = queue_adapter.LocalQueue(process_job, on_failure=fail_job)
+    return harvest_queue
 
-def fetch_host_status(ssh, host):
-    ''' Check if host is busy. Currently the approach is to check if
-        there are more than 7 processes running, but this could be improved.
+def process_job(job):
+    ''' Process a job of the harvest queue. Jobs can be retried, so they must be idempotent. '''
+    if(job['type'] in ('harvest', 'merge')):
+        simulation = models.SimulationModel.get(id=job['id'])
+        if(simulation is None or simulation.status != 'harvesting'):
+            print(f'Skipping {job["type"]} job of simulation {job["id"]}, it was deleted or is no longer harvesting.')
+            return
+    
+    if(job['type'] == 'harvest'):
+        harvest_simulation(simulation)
+    elif(job['type'] == 'dispatch'):
+        dispatch_queued_simulations()
+    elif(job['type'] == 'merge'):
+        merge_simulation(simulation)
+    else:
+        raise Exception(f'Job type not implemented: {job["type"]}')
+
+def fail_job(job):
+    ''' Called with a job that failed every attempt. The simulation it was harvesting or merging
+        would stay harvesting forever, status checks don't look at it, so it is marked failed.
     '''
-    try:
-        if(host not in utils.get_ssh_keys()):
-            raise Exception(f'Credentials not found for host {host}.')
-        response, error = ssh.cmd('cat /proc/loadavg')
-        procs, total_procs = response.split()[3].split('/')
-        status = 'free' if int(procs) < 7 else 'busy'
-        return status
-    except:
-        raise Exception('Error while fetching host status.')
+    if(job['type'] in ('harvest', 'merge')):
+        repository.transition(job['id'], 'failed')
+
+def connect(host):
+    ''' Borrow a pooled SSH connection to the host, returned to the pool when the with block ends. '''
+    return ssh_adapter.pool.connection(host, **utils.get_host_credentials(host))
+
+def fetch_hosts():
+    return list(utils.get_ssh_keys().keys())
 
 def process_exists(ssh, process_id):
     response, error = ssh.cmd(f'ps -p {process_id}')
     return str(process_id) in response
 
+def fetch_host_capacity(ssh):
+    ''' Cores of the host and how many of them are free (based on the 1 minute load average),
+        available memory and number of rebound-ctrl simulations running, with one command.
+    '''
+    response, error = ssh.cmd(
+        'nproc; cat /proc/loadavg; awk \'/MemAvailable/ {print $2}\' /proc/meminfo; '
+        'n=0; for f in rebound-ctrl/simulations/*/pid.txt; do [ -f "$f" ] && kill -0 $(cat "$f") 2>/dev/null && n=$((n+1)); done; echo $n'
+    )
+    nproc, loadavg, memory, jobs = response.strip().split('\n')
+    cores = int(nproc)
+    load = float(loadavg.split()[0])
+    return {
+        'cores': cores,
+        'free_cores': max(cores - load, 0),
+        'load': load,
+        'free_memory_mb': int(memory or 0) // 1024,
+        'jobs': int(jobs),
+    }
+
+def fetch_hosts_capacity(hosts, max_age=HOST_CAPACITY_TTL, raise_errors=False):
+    ''' Capacity of the hosts, probing concurrently only those not probed in the last max_age seconds.
+        Hosts that can not be reached are left out, or raise their error with raise_errors.
+    '''
+    now = time.time()
+    stale = [host for host in hosts if host not in host_capacity or now - host_capacity[host]['checked_at'] > max_age]
+    if(stale):
+        def probe(host):
+            with connect(host) as ssh:
+                return fetch_host_capacity(ssh)
+        with ThreadPoolExecutor(max_workers=min(len(stale), MAX_HOST_WORKERS)) as executor:
+            futures = {host: executor.submit(probe, host) for host in stale}
+            for host, future in futures.items():
+                try:
+                    host_capacity[host] = {**future.result(), 'checked_at': now}
+                except Exception as e:
+                    print(f'Error while fetching {host} capacity: {e}')
+                    host_capacity.pop(host, None)
+                    if(raise_errors):
+                        raise
+    return {host: host_capacity[host] for host in hosts if host in host_capacity}
+
+def fits(capacity, cores):
+    ''' The load average is fractional, a core used less than LOAD_SLACK still counts as free. '''
+    return capacity['free_cores'] + LOAD_SLACK >= cores and capacity['free_memory_mb'] >= MIN_FREE_MEMORY_MB
+
+def pick_host(capacities, cores):
+    ''' Host with the most free cores that fits the simulation, None if all are busy. '''
+    candidates = [host for host, capacity in capacities.items() if fits(capacity, cores)]
+    return max(candidates, key=lambda host: capacities[host]['free_cores'], default=None)
+
+def reserve_cores(host, cores):
+    ''' The load average takes a while to show a new simulation, count its cores as used meanwhile. '''
+    if(host in host_capacity):
+        host_capacity[host]['free_cores'] = max(host_capacity[host]['free_cores'] - cores, 0)
+
+def split_rows(n_rows, weights):
+    ''' Split grid rows in contiguous ranges proportional to the weights (largest remainder). '''
+    total = sum(weights)
+    shares = [n_rows * w / total for w in weights]
+    counts = [int(share) for share in shares]
+    remainders = sorted(range(len(weights)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in remainders[:n_rows - sum(counts)]:
+        counts[i] += 1
+    
+    ranges, start = [], 0
+    for count in counts:
+        ranges.append([start, start + count])
+        start += count
+    return ranges
+
+def build_bundle(simulation):
+    ''' tar.gz with the boilerplate, meta.json and run.sh of the simulation. '''
+    buffer = BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for filename in BOILERPLATE_FILES:
+            tar.add(f'src/boilerplate/{filename}', arcname=filename)
+        for filename, content, mode in (
+            ('meta.json', json.dumps(simulation, indent=4), 0o644),
+            ('run.sh', 'python3 -u problem.py "$@"\n', 0o755),
+        ):
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(filename)
+            info.size, info.mode, info.mtime = len(data), mode, time.time()
+            tar.addfile(info, BytesIO(data))
+    return buffer.getvalue()
+
+def deploy_simulation(ssh, simulation):
+    ''' Send the simulation bundle to the host and start it with a single command, which waits
+        until the simulation writes its first log line (or exits). Returns its process id.
+    '''
+    folder = f'rebound-ctrl/simulations/{simulation["id"]}'
+    polls = int(DEPLOY_READY_TIMEOUT / DEPLOY_POLL_INTERVAL)
+    bootstrap = (
+        f'mkdir -p {folder} && cd {folder} && tar -xzf - || exit 1; '
+        'nohup ./run.sh > logs.txt 2> errors.txt < /dev/null & pid=$!; echo $pid > pid.txt; '
+        f'for i in $(seq {polls}); do [ -s logs.txt ] && break; kill -0 $pid 2>/dev/null || break; sleep {DEPLOY_POLL_INTERVAL}; done; '
+        'echo $pid; kill -0 $pid 2>/dev/null && echo running || echo exited; head -c 2000 errors.txt'
+    )
+    
+    print('Deploying and starting simulation...')
+    response, error = ssh.cmd(bootstrap, input=build_bundle(simulation))
+    lines = response.split('\n', 2)
+    try:
+        process_id, state = int(lines[0]), lines[1]
+    except Exception:
+        raise Exception(f'Simulation could not be started: {error or response}')
+    if(state != 'running' and len(lines) > 2 and lines[2].strip()):
+        raise Exception(f'Simulation exited on start: {lines[2].strip()}')
+    print('Simulation started successfully. PID:', process_id)
+    return process_id
+
+def stop_simulation(ssh, simulation):
+    ''' Kill the simulation process (run.sh and the python process it started) and remove its folder. '''
+    pid = int(simulation['process_id'])
+    ssh.cmd(f'pkill -P {pid}; kill {pid}; rm -rf rebound-ctrl/simulations/{simulation["id"]}')
+
+def to_item(simulation):
+    ''' Database item of a simulation, floats are stored as decimals. '''
+    simulation['kind'] = 'shard' if simulation.get('parent_id') else 'simulation'
+    return json.loads(json.dumps(simulation), parse_float=Decimal)
+
+def from_item(item):
+    ''' Simulation of a database item, decimals are converted back to ints and floats. '''
+    def number(value):
+        if(isinstance(value, Decimal)):
+            return int(value) if value == value.to_integral_value() else float(value)
+        raise TypeError(f'{type(value).__name__} is not JSON serializable')
+    return json.loads(json.dumps(item, default=number))
+
+def save_simulation(simulation):
+    repository.save(to_item(simulation))
+
 def create_simulation(simulation):
-    ssh = None
+    ''' Start the simulation on its host, or on the host with the most free cores if no host is given.
+        If the host is busy the simulation is queued, and started by dispatch_queued_simulations.
+    '''
+    if(simulation.get('hosts')):
+        return create_sharded_simulation(simulation)
+    
     try:
         simulation['id'] = str(uuid4())
         simulation['created_at'] = datetime.now(timezone.utc).isoformat()
         
         # Validate inputs
-        SimulationModel.Schema().load(simulation)
-        
-        host = simulation['host']
-        ssh = SSHClient(host, **utils.get_ssh_keys()[host]).connect()
-        
-        # Check if host is free
-        print('Checking host status...')
-        if(fetch_host_status(ssh, host) == 'busy'):
-            raise Exception(f'Host {host} is busy.')
-        
-        print('Host is free.')
-        print('Setting up simulation...')
+        models.SimulationModel.Schema().load(simulation)
         
-        # Create simulation folder
-        folder = f'rebound-ctrl/simulations/{simulation["id"]}'
-        ssh.cmd(f'mkdir -p {folder}/problem/types')
+        cores = simulation.get('cores', 1)
+        hosts = [simulation['host']] if simulation.get('host') else fetch_hosts()
+        capacities = fetch_hosts_capacity(hosts, raise_errors=bool(simulation.get('host')))
+        if(capacities and all(capacity['cores'] < cores for capacity in capacities.values())):
+            raise Exception(f'No host has {cores} cores.')
+        host = pick_host(capacities, cores)
+        if(host is None):
+            print('No host is free, queueing simulation.')
+            simulation['status'] = 'queued'
+            save_simulation(simulation)
+            return simulation
         
-        # Commands to setup simulation folder and start execution
-        files = [
-            'problem/__init__.py', 'problem/types/default.py', 'problem/types/grid.py',
-            'problem/utils.py', 'problem.py', 'charts.py', 'README.md'
-        ]
-        for filename in files:
-            ssh.upload(f'src/boilerplate/{filename}', f'{folder}/{filename}')
+        simulation['host'] = host
+        with connect(host) as ssh:
+            process_id = deploy_simulation(ssh, simulation)
+        reserve_cores(host, cores)
         
-        meta_content = json.dumps(simulation, indent=4).replace('"', '\\"')
-        ssh.cmd(f'cd {folder} && echo "{meta_content}" > meta.json')
-        ssh.cmd(f'cd {folder} && echo "python3 -u problem.py" > run.sh')
-        ssh.cmd(f'cd {folder} && chmod +x run.sh')
+        simulation['process_id'] = str(process_id)
+        simulation['status'] = 'running'
+        save_simulation(simulation)
         
-        print('Starting simulation...')
-        ssh.cmd(f'cd {folder} && nohup ./run.sh > logs.txt 2> errors.txt & echo $! > {folder}/pid.txt', wait_response=False)
+        return simulation
+    except Exception as e:
+        raise Exception(f'Error while creating simulation: {e}')
+
+def dispatch_queued_simulations():
+    ''' Start queued simulations, oldest first, on hosts with enough free capacity. Simulations
+        queued for a given host wait for it. Returns the ids of the simulations started.
+    '''
+    queued = [s.id for s in models.SimulationModel.ByStatus.query(status='queued').limit(DISPATCH_BATCH_SIZE)]
+    if(not queued):
+        return []
+    capacities = fetch_hosts_capacity(fetch_hosts())
+    
+    started = []
+    for simulation in repository.get_batch(queued):
+        simulation = from_item(simulation.to_dict())
+        cores = simulation.get('cores') or 1
+        pinned = {simulation['host']: capacities[simulation['host']]} if simulation.get('host') in capacities else {}
+        host = pick_host(pinned if simulation.get('host') else capacities, cores)
+        if(host is None):
+            continue
+        if(not repository.transition(simulation['id'], 'starting', host=host)):
+            continue                            # Another dispatch took it
         
-        print('Checking simulation status...')
-        time.sleep(1)
         try:
-            process_id = int(ssh.cmd(f'cd {folder} && cat pid.txt')[0])
-            if(process_exists(ssh, process_id)):
-                print('Simulation started successfully. PID:', process_id)
+            simulation['host'] = host
+            with connect(host) as ssh:
+                process_id = deploy_simulation(ssh, simulation)
+                if(not repository.transition(simulation['id'], 'running', process_id=str(process_id))):
+                    print(f'Simulation {simulation["id"]} was deleted while starting, stopping it.')
+                    stop_simulation(ssh, {**simulation, 'process_id': process_id})
+                    continue
+            reserve_cores(host, cores)
+            started.append(simulation['id'])
         except Exception as e:
-            raise(f'Process ID could not be identified. ({e}) ')
-        
-        simulation['process_id'] = str(process_id)
-        simulation['status'] = 'running'
+            print(traceback.format_exc())
+            repository.transition(simulation['id'], 'failed')
+    return started
+
+def create_sharded_simulation(simulation):
+    ''' Split the rows of a grid simulation across the given hosts, proportionally to
+        their free cores. Each shard is a simulation of its own, merged when all finish.
+    '''
+    try:
+        simulation['id'] = str(uuid4())
+        simulation['created_at'] = datetime.now(timezone.utc).isoformat()
+        simulation['host'] = ','.join(simulation['hosts'])
         
-        obj = json.loads(json.dumps(simulation), parse_float=Decimal)
-        SimulationModel(**obj).save()    
+        # Validate inputs
+        models.SimulationModel.Schema().load(simulation)
+        if(simulation.get('simulation_type') != 'grid'):
+            raise Exception('Only grid simulations can be split across hosts.')
         
+        with ExitStack() as stack:
+            # Split rows by the free cores of each host
+            connections, capacities = {}, {}
+            for host in simulation['hosts']:
+                connections[host] = stack.enter_context(connect(host))
+                capacities[host] = fetch_host_capacity(connections[host])
+            weights = [max(capacities[host]['free_cores'], 1) for host in simulation['hosts']]
+            rows = split_rows(simulation['grid']['N'], weights)
+            
+            started = []
+            try:
+                for host, host_rows in zip(simulation['hosts'], rows):
+                    if(host_rows[0] == host_rows[1]):
+                        continue
+                    shard = {key: value for key, value in simulation.items() if key not in ('hosts', 'shards')}
+                    shard['id'] = str(uuid4())
+                    shard['parent_id'] = simulation['id']
+                    shard['name'] = f'{simulation.get("name", "")} [{host}]'.strip()
+                    shard['host'] = host
+                    shard['cores'] = max(min(simulation['cores'], int(capacities[host]['free_cores'])), 1)
+                    shard['grid'] = {**simulation['grid'], 'rows': host_rows}
+                    
+                    print(f'Starting shard on {host} with rows {host_rows}...')
+                    shard['process_id'] = str(deploy_simulation(connections[host], shard))
+                    shard['status'] = 'running'
+                    started.append(shard)
+                
+                # Parent and shards are written together
+                simulation['shards'] = [shard['id'] for shard in started]
+                simulation['status'] = 'running'
+                repository.save_batch([to_item(shard) for shard in started] + [to_item(simulation)])
+            except Exception:
+                # The grid can not be merged without every shard, stop the ones already running
+                for shard in started:
+                    try:
+                        stop_simulation(connections[shard['host']], shard)
+                    except Exception as e:
+                        print(f'Error while stopping shard {shard["id"]} on {shard["host"]}: {e}')
+                raise
         return simulation
     except Exception as e:
-        if(ssh is not None):
-            ssh.disconnect()
         raise Exception(f'Error while creating simulation: {e}')
     
+def fetch_simulation(id):
+    simulation = models.SimulationModel.get(id=id)
+    return simulation.to_dict() if simulation else None
+
+def encode_cursor(last_key):
+    return base64.urlsafe_b64encode(json.dumps(last_key).encode('utf-8')).decode('utf-8') if last_key else None
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+    except Exception:
+        raise Exception('Invalid cursor.')
+
+def summary(simulation, fields):
+    return {field: value for field, value in simulation.to_dict().items() if field in fields}
+
+def list_host_items(items, status, fields, listed):
+    ''' Simulations listed for items read from the host index. A sharded simulation runs on several
+        hosts (its host is e.g. 'h1,h2'), so it is listed once in place of its shards. Items that
+        are left out (already listed, other status or missing parent) are None.
+    '''
+    parent_ids = list({item['parent_id'] for item in items if item.get('parent_id')})
+    parents = {parent.id: summary(parent, fields) for parent in repository.get_batch(parent_ids)}
+    simulations = []
+    for item in items:
+        simulation = parents.get(item['parent_id']) if item.get('parent_id') else item
+        if(simulation is None or simulation['id'] in listed or (status and simulation.get('status') != status)):
+            simulations.append(None)
+        else:
+            listed.add(simulation['id'])
+            simulations.append(simulation)
+    return simulations
+
+def list_simulations(limit=50, cursor=None, status=None, host=None, kind=None, full=False):
+    ''' Page of simulations, newest first, queried from the index that matches the filters.
+        Only the summary fields are returned unless full is set. Returns the simulations and
+        the cursor of the next page (None on the last page).
+
+        DynamoDB applies filters (e.g. kind on the status index) after reading limit items, so
+        the index is read until the page is full. Filtering by host lists sharded simulations
+        that have a shard on the host, and their shards only when kind is 'shard'.
+    '''
+    with_parents = host and kind != 'shard'                          # Shards are replaced by their parent, status is checked on the parent
+    if(host):
+        index = models.SimulationModel.ByHost
+        keys = {'host': host}
+        filters = {} if with_parents else {'kind': kind, **({'status': status} if status else {})}
+    elif(status):
+        index = models.SimulationModel.ByStatus
+        keys = {'status': status}
+        filters = {'kind': kind} if kind else {}
+    else:
+        index = models.SimulationModel.ByKind
+        keys = {'kind': kind or 'simulation'}
+        filters = {}
+    fields = ['id', 'created_at', *models.SUMMARY_FIELDS]
+    query = index.query(**keys, **filters).reverse().limit(limit).specific_attributes(fields)
+    if(cursor):
+        query = query.start(decode_cursor(cursor))
+    
+    rows, listed = [], set()                                         # (item read, simulation listed for it or None)
+    while(True):
+        items = [summary(simulation, fields) for simulation in query]
+        rows += zip(items, list_host_items(items, status, fields, listed) if with_parents else items)
+        if(not query.last or sum(1 for _, simulation in rows if simulation) >= limit):
+            break
+        query.again()
+    
+    # A page that read past the limit continues after the last item listed
+    rows = [row for row in rows if row[1]]
+    last = query.last
+    if(len(rows) > limit):
+        item = rows[limit - 1][0]
+        rows, last = rows[:limit], {'id': item['id'], index.hash_key: item[index.hash_key], 'created_at': item['created_at']}
+    
+    simulations = [simulation for _, simulation in rows]
+    if(full and simulations):
+        items = {item.id: item.to_dict() for item in repository.get_batch([s['id'] for s in simulations])}
+        simulations = [items.get(s['id'], s) for s in simulations]
+    return simulations, encode_cursor(last)
+
+def backfill_simulation_kinds():
+    ''' Set kind on simulations saved before the listing indexes existed, so they are listed.
+        Runs after every deploy (see etc/deploy.sh), it only updates the simulations without kind.
+        Returns how many were updated.
+    '''
+    updated = 0
+    for simulation in models.SimulationModel.scan(kind__not_exists=True).recursive():
+        kind = 'shard' if getattr(simulation, 'parent_id', None) else 'simulation'
+        models.SimulationModel(id=simulation.id, kind=kind).update(kind=kind)
+        updated += 1
+    return updated
+
 def fetch_simulation_logs(id, host):
-    simulation = SimulationModel.get(id=id)
+    simulation = models.SimulationModel.get(id=id)
+    
+    # Sharded simulations have the logs of each shard
+    if(simulation and simulation.status == 'running' and getattr(simulation, 'shards', None)):
+        shards = repository.get_batch(simulation.shards)
+        return ''.join(f'[{shard.host}]\n{fetch_simulation_logs(shard.id, shard.host)}\n' for shard in shards)
     
     # Retrieve from machine if it's still running
     if(simulation and simulation.status == 'running'):
-        ssh = None
         try:
-            ssh = SSHClient(host, **utils.get_ssh_keys()[host]).connect()
-            logs, error = ssh.cmd(f'cat rebound-ctrl/simulations/{id}/logs.txt')
+            with connect(host) as ssh:
+                logs, error = ssh.cmd(f'cat rebound-ctrl/simulations/{id}/logs.txt')
             return logs       
         except Exception as e:
-            if(ssh is not None):
-                ssh.disconnect()
             raise Exception(f'Error while fetching simulation logs: {e}')
     
     # Retrieve from S3 if it's finished
     logs = download_simulation_logs(id)
     return logs
 
-def check_simulations_status(simulations):
+def read_log_chunk(id, host, status, offset):
+    ''' Bytes of logs.txt after offset, from the host while the simulation folder exists and from s3 after.
+        Returns the bytes and the size of the file.
+    '''
+    if(status in ('queued', 'starting')):
+        return b'', offset                      # Logs are created when the simulation starts on its host
+    if(status in ('running', 'harvesting')):
+        try:
+            with connect(host) as ssh:
+                return ssh.read(f'rebound-ctrl/simulations/{id}/logs.txt', offset, LOG_CHUNK_SIZE)
+        except Exception:
+            if(status == 'running'):
+                raise                           # Harvested folders are removed after the logs are saved in s3
+    try:
+        byte_range = f'bytes={offset}-{offset + LOG_CHUNK_SIZE - 1}'
+        file = s3_adapter.open_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/logs.txt', byte_range)
+        return file['Body'].read(), int(file['ContentRange'].split('/')[-1])
+    except Exception as e:
+        code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        if(code == 'InvalidRange'):
+            return b'', offset                  # Nothing after offset
+        if(code == 'NoSuchKey' and status == 'failed'):
+            return b'', offset                  # Failed before it started, there are no logs
+        raise
+
+def tail_simulation_logs(id, cursor=None):
+    ''' Logs written after the cursor and the cursor of the next call. The cursor is the byte
+        offset in logs.txt, or one offset per shard (comma separated) for sharded simulations.
+        reset is true when the logs must be read again from the start (e.g. the shards were merged).
+    '''
+    simulation = models.SimulationModel.get(id=id)
+    if(simulation is None):
+        raise Exception('Simulation not found.')
+    
+    if(simulation.status == 'running' and getattr(simulation, 'shards', None)):
+        shards = repository.get_batch(simulation.shards)
+        sources = [(shard.id, shard.host, shard.status) for shard in shards]
+    else:
+        sources = [(id, simulation.host, simulation.status)]
+    
+    offsets = [int(offset) for offset in cursor.split(',')] if cursor else [0] * len(sources)
+    if(len(offsets) != len(sources)):
+        return {**tail_simulation_logs(id), 'reset': True}
+    
+    logs, next_offsets = '', []
+    for (source_id, host, status), offset in zip(sources, offsets):
+        data, size = read_log_chunk(source_id, host, status, offset)
+        if(size < offset):                      # The file was rewritten, read everything again
+            return {**tail_simulation_logs(id), 'reset': True}
+        if(len(data) == LOG_CHUNK_SIZE and b'\n' in data):
+            data = data[:data.rindex(b'\n') + 1]  # Only whole lines, the rest is sent in the next call
+        text = data.decode('utf-8', errors='replace')
+        logs += f'[{host}]\n{text}' if(len(sources) > 1 and text) else text
+        next_offsets.append(str(offset + len(data)))
+    
+    return {'logs': logs, 'offset': ','.join(next_offsets), 'status': simulation.status, 'reset': False}
+
+def wait_simulation_logs(id, cursor=None, wait=0):
+    ''' Long poll: wait up to wait seconds for new logs while the simulation runs. '''
+    deadline = time.time() + wait
+    while(True):
+        result = tail_simulation_logs(id, cursor)
+        if(result['logs'] or result['reset'] or result['status'] != 'running' or time.time() >= deadline):
+            return result
+        time.sleep(LOG_POLL_INTERVAL)
+
+def stream_simulation_logs(id, cursor=None, timeout=0):
+    ''' Yield the new logs as they are written, until the simulation stops or timeout seconds pass. '''
+    deadline = time.time() + timeout
+    while(True):
+        result = tail_simulation_logs(id, cursor)
+        cursor = result['offset']
+        if(result['logs'] or result['reset'] or result['status'] != 'running'):
+            yield result
+        if(result['status'] != 'running' or time.time() >= deadline):
+            return
+        time.sleep(LOG_POLL_INTERVAL)
+
+def fetch_simulations_state(ssh, ids):
+    ''' Read the state of many simulation folders of a host with a single command.
+        Each line is: id, folder exists, errors.txt has content, results.json in one line.
+    '''
+    script = (
+        f'for id in {" ".join(ids)}; do d=rebound-ctrl/simulations/$id; '
+        'printf "%s\\t" "$id"; '
+        '[ -d "$d" ] && printf "1\\t" || printf "0\\t"; '
+        '[ -s "$d/errors.txt" ] && printf "1\\t" || printf "0\\t"; '
+        '[ -f "$d/results/results.json" ] && tr -d "\\n" < "$d/results/results.json"; '
+        'echo; done'
+    )
+    response, error = ssh.cmd(script)
+    states = {}
+    for line in response.splitlines():
+        id, has_folder, has_errors, results = (line.split('\t', 3) + [''] * 4)[:4]
+        states[id] = {
+            'has_folder': has_folder == '1',
+            'has_errors': has_errors == '1',
+            'results': json.loads(results) if results.strip() else None,
+        }
+    return states
+
+def fetch_progress(ssh, ids):
+    ''' results/progress.json of many simulation folders of a host with a single command, with the
+        seconds since each one was written (by the clock of the host). Each line is: id, age, progress in one line.
+    '''
+    script = (
+        f'now=$(date +%s); for id in {" ".join(ids)}; do f=rebound-ctrl/simulations/$id/results/progress.json; '
+        'printf "%s\\t" "$id"; '
+        '[ -f "$f" ] && printf "%s\\t" $((now - $(stat -c %Y "$f"))) && tr -d "\\n" < "$f"; '
+        'echo; done'
+    )
+    response, error = ssh.cmd(script)
+    progress = {}
+    for line in response.splitlines():
+        id, age, content = (line.split('\t', 2) + [''] * 3)[:3]
+        if(content.strip()):
+            progress[id] = {**json.loads(content), 'age_seconds': int(age)}
+    return progress
+
+def fetch_host_progress(host, ids):
+    with connect(host) as ssh:
+        return fetch_progress(ssh, ids)
+
+def combine_progress(parts):
+    ''' Progress of a sharded simulation, from the progress of its shards. '''
+    parts = [part for part in parts if part]
+    if(not parts):
+        return None
+    statuses = {part['status'] for part in parts}
+    done, total = sum(part['done'] for part in parts), sum(part['total'] for part in parts)
+    running = [part for part in parts if part['status'] == 'running']
+    etas = [part['eta_seconds'] for part in running]
+    return {
+        'status': 'failed' if 'failed' in statuses else 'running' if 'running' in statuses else 'finished',
+        'done': done,
+        'total': total,
+        'percent': done / total * 100 if total else 0.0,
+        'failures': sum(part['failures'] for part in parts),
+        'cells_per_second': sum(part['cells_per_second'] for part in running),
+        'eta_seconds': None if None in etas else max(etas, default=0.0),  # The slowest shard
+        'age_seconds': max(part['age_seconds'] for part in running or parts),
+        'stalled': any(part['stalled'] for part in parts),
+        'shards': len(parts),                   # Shards that reported progress
+    }
+
+def fetch_simulations_progress(ids):
+    ''' Progress of many simulations at once, for dashboards. progress.json of the simulations still on
+        their hosts is read with one command per host, querying every host at the same time. Sharded
+        simulations add up their shards. Simulations that are not on a host have no progress (None),
+        and running simulations whose progress was not written for PROGRESS_STALL_TIMEOUT are stalled.
+    '''
+    simulations = repository.get_batch(list(ids))
+    shards = repository.get_batch([shard for s in simulations if s.status == 'running' for shard in getattr(s, 'shards', None) or []])
+    by_host = {}
+    for simulation in simulations + shards:
+        if(simulation.status in ('running', 'harvesting') and not getattr(simulation, 'shards', None)):
+            by_host.setdefault(simulation.host, []).append(simulation.id)
+    
+    progress, errors = {}, {}
+    if(by_host):
+        with ThreadPoolExecutor(max_workers=min(len(by_host), MAX_HOST_WORKERS)) as executor:
+            futures = {executor.submit(fetch_host_progress, host, host_ids): host for host, host_ids in by_host.items()}
+            for future, host in futures.items():
+                try:
+                    progress.update(future.result())
+                except Exception as e:
+                    print(traceback.format_exc())
+                    errors[host] = f'Error while fetching simulations progress: {e}'
+    for id, item in progress.items():
+        item['stalled'] = item['status'] == 'running' and item['age_seconds'] > PROGRESS_STALL_TIMEOUT
+    
     response = []
     for simulation in simulations:
-        ssh = None
-        try:
-            host = simulation['host']
-            ssh = SSHClient(host, **utils.get_ssh_keys()[host]).connect()
-            sim_path = f'rebound-ctrl/simulations/{simulation["id"]}'
-            
-            # Check if there is a simulation folder
-            has_simulation, error = ssh.cmd(f'[ -d "{sim_path}" ] && echo true')
-            if(not has_simulation):
-                simulation['status'] = 'unkwown'
-            
-            # Check if there are errors
-            errors_content, error = ssh.cmd(f'[ -f "{sim_path}/errors.txt" ] && cat {sim_path}/errors.txt')
-            if(errors_content):
-                simulation['status'] = 'failed'
-            
-            # Check if simulation has results
-            results, error = ssh.cmd(f'[ -f "{sim_path}/results/results.json" ] && cat {sim_path}/results/results.json')
-            if(results):
-                results = json.loads(results)
-                if(results['status'] == 'failed'):
-                    simulation['status'] = 'failed'
-                else:
-                    simulation['status'] = 'finished'
-            
-            # Simulation is not running anymore, save results in database and s3.
-            if(simulation['status'] != 'running'):
-                # Update simulation status
-                sim = {'id': simulation['id'], 'status': simulation['status']}
-                SimulationModel(**sim).update(**sim)
-                
-                # Save results in s3 if simulation folder is available
-                if(simulation['status'] == 'finished'):
-                    try:
-                        folder = f'rebound-ctrl/simulations/{simulation["id"]}'
-                        ssh.cmd(f'cd {folder} && rm results.tar.gz')
-                        ssh.cmd(f'cd {folder} && tar -czvf results.tar.gz .')
-                        file = ssh.download(f'{folder}/results.tar.gz')
-                        logs, error = ssh.cmd(f'cat rebound-ctrl/simulations/{simulation["id"]}/logs.txt')
-                        bucket = f'rebound-ctrl-{STAGE}-files'
-                        s3_adapter.upload_file(
-                            bucket=bucket, 
-                            path=f'simulations/{simulation["id"]}/results.tar.gz', 
-                            file=file, 
-                            content_type='application/tar+gzip'
-                        )
-                        s3_adapter.save_to_s3(bucket, f'simulations/{simulation["id"]}/logs.txt', logs)
-                        ssh.cmd(f'rm -r {folder}')
-                    except:
-                        raise Exception('Error while saving simulation results in AWS S3. The simulation files are still available in the server.')
-                    
-            response.append(simulation)
-            ssh.disconnect()
-        except Exception as e:
-            print(traceback.format_exc())
-            if(ssh is not None):
-                ssh.disconnect()
-            simulation['error'] = f'Error while updating simulations status: {e}'
-            response.append(simulation)
+        shard_ids = getattr(simulation, 'shards', None)
+        host = getattr(simulation, 'host', None)
+        item = {
+            'id': simulation.id,
+            'status': simulation.status,
+            'host': host,
+            'progress': combine_progress([progress.get(id) for id in shard_ids]) if shard_ids else progress.get(simulation.id),
+        }
+        if(host in errors):
+            item['error'] = errors[host]
+        response.append(item)
     return response
 
-def download_simulation_results(id):
+def fetch_host_simulations_state(host, simulations):
+    with connect(host) as ssh:
+        return fetch_simulations_state(ssh, [simulation['id'] for simulation in simulations])
+
+def resolve_status(simulation, state):
+    ''' Status of a simulation given the state of its folder. '''
+    status = simulation['status']
+    if(not state['has_folder']):
+        status = 'unkwown'
+    if(state['has_errors']):
+        status = 'failed'
+    if(state['results']):
+        status = 'failed' if state['results']['status'] == 'failed' else 'finished'
+    return status
+
+def check_simulations_status(simulations):
+    ''' Check simulations grouped by host, querying every host concurrently with one command each.
+        Status changes are conditional and written together, and simulations are returned in the
+        same order they were received.
+    '''
+    response = [None] * len(simulations)
+    by_host, db_only = {}, []            # db_only: indexes only updated from the database
+    for i, simulation in enumerate(simulations):
+        if(simulation.get('status') in DB_ONLY_STATUSES):
+            db_only.append(i)
+        elif(simulation.get('shards')):
+            response[i] = check_sharded_simulation(simulation)
+        else:
+            by_host.setdefault(simulation['host'], []).append(i)
+    
+    # Fetch the state of the simulation folders of every host at the same time
+    states, errors = {}, {}
+    if(by_host):
+        with ThreadPoolExecutor(max_workers=min(len(by_host), MAX_HOST_WORKERS)) as executor:
+            futures = {
+                executor.submit(fetch_host_simulations_state, host, [simulations[i] for i in indexes]): host
+                for host, indexes in by_host.items()
+            }
+            for future, host in futures.items():
+                try:
+                    states[host] = future.result()
+                except Exception as e:
+                    print(traceback.format_exc())
+                    errors[host] = e
+    
+    changes = {}                                # Index -> new status
+    for host, indexes in by_host.items():
+        for i in indexes:
+            simulation = simulations[i]
+            response[i] = simulation
+            try:
+                if(host in errors):
+                    raise errors[host]
+                status = resolve_status(simulation, states[host][simulation['id']])
+                if(status == 'finished'):
+                    status = 'harvesting'       # Finished simulations are saved in s3 by the harvest queue
+                if(status != simulation['status']):
+                    changes[i] = status
+            except Exception as e:
+                print(traceback.format_exc())
+                simulation['error'] = f'Error while updating simulations status: {e}'
+    
     try:
-        file = s3_adapter.download_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/results.tar.gz')
-        return file
+        updated = repository.transition_batch([(simulations[i]['id'], status) for i, status in changes.items()])
+        
+        # Simulations another request already moved take their status from the database
+        stale = [i for i in changes if simulations[i]['id'] not in updated] + db_only
+        current = repository.fetch_statuses(simulations[i]['id'] for i in stale) if stale else {}
+        for i in stale:
+            simulations[i]['status'] = current.get(simulations[i]['id'], simulations[i]['status'])
+        for i, status in changes.items():
+            if(simulations[i]['id'] in updated):
+                simulations[i]['status'] = status
+                if(status == 'harvesting'):
+                    get_harvest_queue().send({'type': 'harvest', 'id': simulations[i]['id']})
+        
+        # Stopped simulations free their cores for the queued ones
+        if(updated):
+            get_harvest_queue().send({'type': 'dispatch'})
+    except Exception as e:
+        print(traceback.format_exc())
+        for i in list(changes) + db_only:
+            simulations[i]['error'] = f'Error while updating simulations status: {e}'
+    
+    for i in db_only:
+        response[i] = simulations[i]
+    return response
+
+def harvest_simulation(simulation):
+    ''' Save the results and logs of a finished (harvesting) simulation in s3 and remove its folder from the host. '''
+    id = simulation.id
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    folder = f'rebound-ctrl/simulations/{id}'
+    with connect(simulation.host) as ssh:
+        has_folder, error = ssh.cmd(f'[ -d "{folder}" ] && echo true')
+        if(not has_folder):
+            # A previous attempt removed the folder after saving the results
+            if(not s3_adapter.file_exists(bucket, f'simulations/{id}/results.tar.gz')):
+                raise Exception(f'Simulation {id} folder and results not found.')
+        else:
+            try:
+                ssh.cmd(f'cd {folder} && rm -f results.tar.gz')
+                ssh.cmd(f'cd {folder} && tar -czf results.tar.gz --exclude=./results.tar.gz .')
+                logs, error = ssh.cmd(f'cat {folder}/logs.txt')
+                transfer_to_s3(ssh, f'{folder}/results.tar.gz', bucket, f'simulations/{id}/results.tar.gz', 'application/tar+gzip')
+                publish_result_files(ssh, folder, id)
+                s3_adapter.save_to_s3(bucket, f'simulations/{id}/logs.txt', logs)
+                ssh.cmd(f'rm -rf {folder}')
+            except Exception as e:
+                raise Exception(f'Error while saving simulation results in AWS S3, the simulation files are still available in the server: {e}')
+    
+    finish_harvest(id)
+
+def finish_harvest(id):
+    ''' Mark the harvested simulation finished. If it was deleted while its results were being saved,
+        the files saved after the delete are removed.
+    '''
+    if(not repository.transition(id, 'finished') and models.SimulationModel.get(id=id) is None):
+        delete_simulation_files(id)
+
+def transfer_to_s3(ssh, remote_path, bucket, path, content_type=None):
+    ''' Stream a file of the host to s3 in parts, without keeping the whole file in memory. '''
+    start = time.time()
+    size = s3_adapter.upload_parts(bucket, path, ssh.stream(remote_path, chunk_size=TRANSFER_PART_SIZE), content_type)
+    elapsed = max(time.time() - start, 1e-6)
+    print(f'Transferred {remote_path} to s3://{bucket}/{path}: {size / 1e6:.1f} MB in {elapsed:.1f}s ({size / 1e6 / elapsed:.1f} MB/s)')
+    return size
+
+def is_result_file(name):
+    return name.split('/')[0] in RESULT_FOLDERS and not name.endswith('checkpoint.jsonl')
+
+def save_result_files_index(id, files):
+    ''' files.json lists the files saved one by one, so they can be fetched without the archive. '''
+    files = sorted(files, key=lambda file: file['name'])
+    s3_adapter.save_to_s3(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/files.json', json.dumps(files))
+
+def publish_result_files(ssh, folder, id):
+    ''' Save the result files of the simulation folder in s3 under simulations/<id>/files/. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    output, error = ssh.cmd(f'cd {folder} && find {" ".join(RESULT_FOLDERS)} -type f -printf "%s\\t%p\\n" 2>/dev/null')
+    files = []
+    for line in output.splitlines():
+        size, name = line.split('\t', 1)
+        if(is_result_file(name)):
+            transfer_to_s3(ssh, f'{folder}/{name}', bucket, f'simulations/{id}/files/{name}', mimetypes.guess_type(name)[0])
+            files.append({'name': name, 'size': int(size)})
+    save_result_files_index(id, files)
+
+def publish_local_result_files(folder, id):
+    ''' Same as publish_result_files, for a simulation folder in this machine. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, folder).replace(os.sep, '/')
+            if(is_result_file(name)):
+                with open(path, 'rb') as f:
+                    s3_adapter.upload_file(bucket=bucket, path=f'simulations/{id}/files/{name}', file=f, content_type=mimetypes.guess_type(name)[0])
+                files.append({'name': name, 'size': os.path.getsize(path)})
+    save_result_files_index(id, files)
+
+def apply_transition(simulation, status):
+    ''' Move the simulation to status. If another request moved it first, it takes the status of the database. '''
+    if(repository.transition(simulation['id'], status)):
+        simulation['status'] = status
+        return True
+    simulation['status'] = repository.fetch_statuses([simulation['id']]).get(simulation['id'], simulation['status'])
+    return False
+
+def check_sharded_simulation(simulation):
+    ''' Check the shards still running and merge their results once all of them finished. '''
+    try:
+        shards = [shard.to_dict() for shard in repository.get_batch(simulation['shards'])]
+        running = [shard for shard in shards if shard['status'] in ('running', 'harvesting')]
+        statuses = {shard['id']: shard['status'] for shard in shards}
+        for shard in check_simulations_status(running):
+            if(shard.get('error')):
+                raise Exception(shard['error'])
+            statuses[shard['id']] = shard['status']
+        
+        if(any(status not in ('running', 'harvesting', 'finished') for status in statuses.values())):
+            apply_transition(simulation, 'failed')
+        elif(all(status == 'finished' for status in statuses.values())):
+            # Shards are merged by the harvest queue
+            if(apply_transition(simulation, 'harvesting')):
+                get_harvest_queue().send({'type': 'merge', 'id': simulation['id']})
     except Exception as e:
+        print(traceback.format_exc())
+        simulation['error'] = f'Error while updating simulations status: {e}'
+    return simulation
+
+def merge_simulation(simulation):
+    ''' Merge the results of a sharded (harvesting) simulation whose shards finished. '''
+    shards = [from_item(shard.to_dict()) for shard in repository.get_batch(simulation.shards)]
+    merge_shard_results(from_item(simulation.to_dict()), shards)
+    finish_harvest(simulation.id)
+
+def merge_shard_results(simulation, shards):
+    ''' Merge the results of the shards, ordered by grid rows, in a single results.tar.gz and logs.txt. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    shards = sorted(shards, key=lambda shard: shard['grid']['rows'][0])
+    with tempfile.TemporaryDirectory() as tmp:
+        folders = []
+        logs = ''
+        for i, shard in enumerate(shards):
+            archive = os.path.join(tmp, f'shard_{i}.tar.gz')
+            with open(archive, 'wb') as f:
+                s3_adapter.download_fileobj(bucket, f'simulations/{shard["id"]}/results.tar.gz', f)
+            folder = os.path.join(tmp, f'shard_{i}')
+            grid_results.extract_results(archive, folder)
+            os.remove(archive)
+            folders.append(folder)
+            logs += f'[{shard["host"]}]\n{download_simulation_logs(shard["id"]).decode("utf-8")}\n'
+        
+        merged = os.path.join(tmp, 'merged')
+        grid_results.merge_grid_shards(folders, os.path.join(merged, 'results'))
+        with open(os.path.join(merged, 'meta.json'), 'w') as f:
+            json.dump(simulation, f, indent=4)
+        
+        archive = os.path.join(tmp, 'results.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            tar.add(merged, arcname='.')
+        with open(archive, 'rb') as f:
+            s3_adapter.upload_file(bucket=bucket, path=f'simulations/{simulation["id"]}/results.tar.gz', file=f, content_type='application/tar+gzip')
+        publish_local_result_files(merged, simulation['id'])
+        s3_adapter.save_to_s3(bucket, f'simulations/{simulation["id"]}/logs.txt', logs)
+
+def open_simulation_results(id, byte_range=None):
+    ''' Results archive as an s3 response, its Body is streamed. Returns None if the range is not satisfiable. '''
+    try:
+        return s3_adapter.open_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/results.tar.gz', byte_range)
+    except Exception as e:
+        if(getattr(e, 'response', {}).get('Error', {}).get('Code') == 'InvalidRange'):
+            return None
         raise Exception(f'Error while fetching simulation results: {e}')
 
+def simulation_results_url(id):
+    ''' Temporary link to download the results archive directly from s3. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    path = f'simulations/{id}/results.tar.gz'
+    if(not s3_adapter.file_exists(bucket, path)):
+        raise Exception('Error while fetching simulation results: results not found.')
+    return s3_adapter.presigned_url(bucket, path, RESULTS_URL_EXPIRATION, filename=f'results-{id}.tar.gz')
+
+def fetch_result_files(id):
+    ''' Files of the results that can be fetched one by one. '''
+    try:
+        return s3_adapter.read_json(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/files.json')
+    except Exception as e:
+        raise Exception(f'Result files are not available for this simulation: {e}')
+
+def open_result_file(id, name, byte_range=None):
+    ''' A single result file as an s3 response, its Body is streamed. Returns None if the range is not satisfiable. '''
+    if(not is_result_file(name) or '..' in name.split('/')):
+        raise Exception(f'Invalid result file: {name}')
+    try:
+        return s3_adapter.open_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/files/{name}', byte_range)
+    except Exception as e:
+        if(getattr(e, 'response', {}).get('Error', {}).get('Code') == 'InvalidRange'):
+            return None
+        raise Exception(f'Error while fetching result file {name}: {e}')
+
+def fetch_results_summary(id):
+    ''' Small summary of the results (results.json, grid.json and the list of files) for dashboards. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    files = fetch_result_files(id)
+    names = {file['name'] for file in files}
+    summary = {'id': id, 'files': files}
+    for key, name in (('results', 'results/results.json'), ('grid', 'results/grid.json')):
+        if(name in names):
+            summary[key] = s3_adapter.read_json(bucket, f'simulations/{id}/files/{name}')
+    return summary
+
 def download_simulation_logs(id):
     try:
         file = s3_adapter.download_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/logs.txt')
@@ -190,25 +936,38 @@ def download_simulation_logs(id):
     except Exception as e:
         raise Exception(f'Error while fetching simulation logs: {e}')
 
+def delete_simulation_files(id):
+    ''' Delete the results, logs and result files of the simulation from s3. '''
+    bucket = f'rebound-ctrl-{STAGE}-files'
+    try:
+        for path in ('results.tar.gz', 'logs.txt', 'files.json'):
+            s3_adapter.delete_file(bucket, f'simulations/{id}/{path}')
+        for file in s3_adapter.list_files(bucket, f'simulations/{id}/files'):
+            s3_adapter.delete_file(bucket, file['Key'])
+    except Exception as e:
+        print(f'Error while deleting simulation files: {e}')
+
 def delete_simulation(id):
-    simulation = SimulationModel.get(id=id)
+    simulation = models.SimulationModel.get(id=id)
     
-    # Delete from machine if it's still running
-    if(simulation and simulation.status == 'running'):
-        ssh = None
-        try:
-            ssh = SSHClient(simulation.host, **utils.get_ssh_keys()[simulation.host]).connect()
-            ssh.cmd(f'rm -r rebound-ctrl/simulations/{id}')
-            # TODO: kill process
-        except Exception as e:
-            print(f'Error while deleting simulation folder: {e}')
-            if(ssh is not None):
-                ssh.disconnect()
-    else: # Simulation has already finished, delete results from s3
+    # Sharded simulations delete every shard as well
+    for shard_id in getattr(simulation, 'shards', None) or []:
+        delete_simulation(shard_id)
+    
+    # The record goes first, so a harvest in progress sees the delete when it finishes and removes what it saved
+    simulation.delete()
+    
+    # Delete from machine if it's still running or being harvested. A simulation that is starting
+    # may not have a folder yet, the dispatch stops it when it can not move it to running.
+    if(simulation.status in ('starting', 'running', 'harvesting') and not getattr(simulation, 'shards', None)):
         try:
-            s3_adapter.delete_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/results.tar.gz')
-            s3_adapter.delete_file(f'rebound-ctrl-{STAGE}-files', f'simulations/{id}/logs.txt')
+            with connect(simulation.host) as ssh:
+                ssh.cmd(f'rm -rf rebound-ctrl/simulations/{id}')
+                # TODO: kill process
         except Exception as e:
             print(f'Error while deleting simulation folder: {e}')
     
-    simulation.delete()
\ No newline at end of file
+    # Results saved by the harvest, or by the part of it that already ran. Simulations that
+    # have not finished yet have nothing in s3.
+    if(simulation.status not in ('queued', 'starting', 'running')):
+        delete_simulation_files(id)
\ No newline at end of file
@@ -17,7 +17,7 @@ def main():
     
     if(meta['simulation_type'] == 'default'):
         plot_charts_for_default_simulation(meta)
-    elif(meta['simulation_type'] == 'grid'):
+    elif(meta['simulation_type'] in ('grid', 'adaptive_grid')):
         plot_charts_for_grid_simulation(meta)
 
 
@@ -28,14 +28,16 @@ def plot_charts_for_default_simulation(meta):
 def plot_charts_for_grid_simulation(meta):
     grid_options = meta['grid']             # Information of the grid.
     n_grid = grid_options['N']              # Grid size   
+    if(os.path.exists('results/grid.json')):
+        with open('results/grid.json') as f:
+            n_grid = json.load(f)['shape'][0]   # Adaptive grids are exported with a finer shape than N
     particle = grid_options['particle']     # Information of the dynamic particle
     
     x_range = particle['a']                 # X range of the grid
     y_range = particle['e']                 # Y range of the grid
     
     # Megno chart
-    megnos = pd.read_csv('results/megnos.csv')['megno']
-    z_values = np.array(megnos).reshape(n_grid, n_grid)
+    z_values = load_grid_values('megno', n_grid)
     plot_heatmap(
         x_range, y_range, z_values, vmin=1.9, vmax=4.0,
         x_label='Semi-major axis $a$', 
@@ -46,13 +48,11 @@ def plot_charts_for_grid_simulation(meta):
     )
 
     p_index = len(meta['particles']) - 1                            # Dynamic particle index
-    dynamic_particle_data = pd.read_csv(f'results/orbits_p{p_index+1:03d}.csv')
 
     # Delta a chart for the dynamic particle 
-    delta_as = dynamic_particle_data['delta_a']                     # List of delta a for each simulation
-    delta_as_km = [abs(a) * KM for a in delta_as]                   # Convert delta a from AU to KM
-    vmin, vmax = min(delta_as_km), max(delta_as_km)                 # Range of z values in chart
-    z_values = np.array(delta_as_km).reshape(n_grid, n_grid)
+    delta_as = load_grid_values('delta_a', n_grid, p_index)         # Delta a for each simulation
+    z_values = np.abs(delta_as) * KM                                # Convert delta a from AU to KM
+    vmin, vmax = np.nanmin(z_values), np.nanmax(z_values)           # Range of z values in chart
     plot_heatmap(x_range, y_range, z_values, vmin=vmin, vmax=vmax,
         x_label='Semi-major axis $a$ (AU)', 
         y_label='Eccentricity $e$', 
@@ -62,10 +62,9 @@ def plot_charts_for_grid_simulation(meta):
     )
     
     # Delta e chart for the dynamic particle
-    delta_es = dynamic_particle_data['delta_e']                     # List of delta a for each simulation
-    delta_es = [abs(e) for e in delta_es]                           # Convert delta a from AU to KM
-    vmin, vmax = min(delta_es), max(delta_es)                       # Range of z values in chart
-    z_values = np.array(delta_es).reshape(n_grid, n_grid)
+    delta_es = load_grid_values('delta_e', n_grid, p_index)         # Delta e for each simulation
+    z_values = np.abs(delta_es)
+    vmin, vmax = np.nanmin(z_values), np.nanmax(z_values)           # Range of z values in chart
     plot_heatmap(x_range, y_range, z_values, vmin=vmin, vmax=vmax,
         x_label='Semi-major axis $a$ (AU)', 
         y_label='Eccentricity $e$', 
@@ -75,6 +74,22 @@ def plot_charts_for_grid_simulation(meta):
     )
     
 
+def load_grid_values(name, n_grid, p_index=None):
+    ''' Load a grid quantity from its memory-mapped .npy file, falling back to
+        the CSV files of simulations exported before the binary format.
+    '''
+    path = f'results/{name}.npy'
+    if(os.path.exists(path)):
+        values = np.load(path, mmap_mode='r')
+        return values if p_index is None else values[p_index]
+    
+    if(p_index is None):
+        values = pd.read_csv('results/megnos.csv')[name]
+    else:
+        values = pd.read_csv(f'results/orbits_p{p_index+1:03d}.csv')[name]
+    return np.array(values).reshape(n_grid, n_grid)
+
+
 def plot_heatmap(x_range, y_range, z_values, x_label, y_label, z_label, title, vmin, vmax, figname='result.png'):
     ''' This function plots a heatmap and saves the figure.'''
     fig = plt.figure(figsize=(7,5))
@@ -1,13 +1,19 @@
 import os
+import sys
 import json
-from rebound.interruptible_pool import InterruptiblePool
 import traceback
-from problem import DefaultSimulation, GridSimulation
+from problem import DefaultSimulation, GridSimulation, AdaptiveGridSimulation, Checkpoint
 from problem import utils
 
 
 if __name__ == '__main__':
     try:
+        resume = '--resume' in sys.argv[1:]                         # Resume grid from results/checkpoint.jsonl
+
+        # Create results folder
+        if(not os.path.exists('results')):
+            os.makedirs('results')
+
         utils.log('Reading inputs...')
         with open('meta.json') as f:
             inputs = json.load(f)
@@ -16,21 +22,28 @@ if __name__ == '__main__':
         if(inputs.get('simulation_type') == 'default'):
             sim = DefaultSimulation(inputs)
             results = sim.run(inputs['particles'])
-        elif(inputs.get('simulation_type') == 'grid'):
-            sim = GridSimulation(inputs)
-            params = sim.prepare_params()
-            pool = InterruptiblePool(sim.cores)
-            results = pool.map(sim.run, params)
+        elif(inputs.get('simulation_type') in ('grid', 'adaptive_grid')):
+            if(inputs['simulation_type'] == 'grid'):
+                sim = GridSimulation(inputs)
+            else:
+                sim = AdaptiveGridSimulation(inputs)
+
+            # Skip cells already saved by a previous execution
+            writer = sim.create_writer(resume=resume)
+            checkpoint = Checkpoint('results/checkpoint.jsonl', writer, sim.checkpoint_size, resume=resume)
+            if(resume):
+                utils.log(f'Resuming simulation, {len(checkpoint.done)} cells already finished.')
+
+            with sim.progress:                                      # Keeps results/progress.json up to date
+                sim.run_grid(sim.create_scheduler(), checkpoint)
+            results = writer
         else:
             raise Exception(f'Simulation type not implemented:, {inputs.get("simulation_type")}')
-        
+
         utils.log('Simulation finished, exporting results...')
-        # Create results folder
-        if(not os.path.exists('results')):
-            os.makedirs('results')
         sim.export_results(results)
         utils.log('Results exported successfully.')
-        
+
     except Exception as e:
         utils.log(traceback.format_exc())
         utils.log(f'PROGRAM_ERROR: {e}')
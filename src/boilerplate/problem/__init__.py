@@ -1,2 +1,5 @@
 from problem.types.default import DefaultSimulation
-from problem.types.grid import GridSimulation
\ No newline at end of file
+from problem.types.grid import GridSimulation
+from problem.types.adaptive_grid import AdaptiveGridSimulation
+from problem.checkpoint import Checkpoint
+from problem.writer import GridResultWriter
\ No newline at end of file
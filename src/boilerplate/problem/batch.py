@@ -0,0 +1,197 @@
+import math
+import time
+import numpy as np
+from problem.writer import STOP_REASONS
+
+class TestParticleBatch():
+    ''' Integrates the massless dynamic particles of several grid cells as test
+        particles of a single simulation with the fixed particles.
+
+        REBOUND's megno is a single value for the whole simulation, so the batch
+        has one first order variation and megno of each cell is calculated from
+        its own part of it. Test particles don't act on other particles, so the
+        variation of the fixed particles is the same as in a simulation per cell
+        and each cell's variation is the fixed particles' part plus its test
+        particle's part. Both start from the vector init_megno(seed=0) gives a
+        simulation per cell. Its length is measured after every stage and megno
+        is estimated from its logarithmic growth: Y(t) = 2/t * integral(s * dln(d)),
+        averaged over time. There are batch_samples stages, but at least
+        batch_sample_steps integration steps per stage, so short runs are not
+        sampled more often than they are integrated.
+
+        REBOUND can't remove particles while integrating a variation, so once
+        half of the test particles stopped, the others are moved to a new
+        simulation and the stopped ones are no longer integrated.
+    '''
+    def __init__(self, simulation, particles):
+        self.simulation = simulation                                 # GridSimulation with the options and the base simulation
+        self.particles = [{attr: float(p[attr]) for attr in p} for p in particles]  # Dynamic particle of each cell
+        self.results = [None] * len(particles)                       # Result of each cell, set when it stops
+        self.slots = {k: k for k in range(len(particles))}           # Test particle of each cell in the simulation
+        self.steps_done = 0                                          # Integration steps of the simulations already compacted
+
+    def create(self):
+        ''' Copy the base simulation, add each cell particle as a test particle and set up the variation. '''
+        sim = self.simulation.base_sim.copy()
+        self.n_active = sim.N
+        for particle in self.particles:
+            sim.add(**particle)
+        sim.N_active = self.n_active
+        sim.testparticle_type = 0
+        sim.move_to_com()                                            # Test particles are massless, the center of mass is the same
+
+        # Initial variation of a simulation per cell
+        reference = self.simulation.base_sim.copy()
+        reference.add(**self.particles[0])
+        reference.move_to_com()
+        reference.init_megno(seed=0)
+        initial = [self.state(reference.particles[reference.var_config[0].index + i]) for i in range(reference.N_real)]
+
+        self.variation = sim.add_variation(order=1)
+        for i in range(sim.N_real):
+            self.set_state(self.variation_particle(sim, i), initial[min(i, self.n_active)])
+        return sim
+
+    def compact(self, sim, active):
+        ''' New simulation, at the same time, with the fixed particles and the test particles
+            of the active cells, and their part of the variation.
+        '''
+        compacted = self.simulation.base_sim.copy()
+        compacted.t, compacted.dt = sim.t, sim.dt
+        for i in range(self.n_active):
+            self.set_state(compacted.particles[i], self.state(sim.particles[i]))
+        for k in active:
+            compacted.add(m=0.0)
+            self.set_state(compacted.particles[-1], self.state(self.test_particle(sim, k)))
+        compacted.N_active = self.n_active
+        compacted.testparticle_type = 0
+
+        variation = [self.state(self.variation_particle(sim, i)) for i in range(self.n_active)]
+        variation += [self.state(self.variation_particle(sim, self.n_active + self.slots[k])) for k in active]
+        self.steps_done += sim.steps_done
+        self.variation = compacted.add_variation(order=1)
+        for i, state in enumerate(variation):
+            self.set_state(self.variation_particle(compacted, i), state)
+        self.slots = {k: i for i, k in enumerate(active)}
+        return compacted
+
+    def state(self, particle):
+        return np.array([particle.x, particle.y, particle.z, particle.vx, particle.vy, particle.vz])
+
+    def set_state(self, particle, state):
+        particle.x, particle.y, particle.z, particle.vx, particle.vy, particle.vz = state
+
+    def variation_particle(self, sim, i):
+        return sim.particles[self.variation.index + i]
+
+    def test_particle(self, sim, k):
+        return sim.particles[self.n_active + self.slots[k]]
+
+    def lengths(self, sim, cells):
+        ''' Length of the variation of each cell, fixed particles' part plus its test particle's part. '''
+        fixed = sum(np.sum(self.state(self.variation_particle(sim, i))**2) for i in range(self.n_active))
+        return np.array([
+            math.sqrt(fixed + np.sum(self.state(self.variation_particle(sim, self.n_active + self.slots[k]))**2))
+            for k in cells
+        ])
+
+    def rescale(self, sim, factor, cells):
+        ''' Scale the variation of the fixed particles and the given cells, which keeps it a solution
+            of the variational equations (the part of stopped cells is zero).
+        '''
+        for i in list(range(self.n_active)) + [self.n_active + self.slots[k] for k in cells]:
+            particle = self.variation_particle(sim, i)
+            self.set_state(particle, self.state(particle) * factor)
+
+    def run(self):
+        setup_start = time.perf_counter()
+        sim = self.create()
+        self.setup_time = time.perf_counter() - setup_start          # Time to build the batch simulation
+        t_max = self.simulation.years * (2*math.pi)
+        samples = min(self.simulation.batch_samples, int(t_max / abs(sim.dt) / self.simulation.batch_sample_steps))
+        stages = max(self.simulation.stages, samples, 1)
+        chaos_threshold = self.simulation.chaos_threshold
+        ejection_distance = self.simulation.ejection_max_distance
+        encounter_distance = self.simulation.encounter_min_distance
+
+        active = list(range(len(self.particles)))                   # Cells still being integrated
+        integral = np.zeros(len(self.particles))                     # Integral of s * dln(d)
+        megno_sum = np.zeros(len(self.particles))                    # Integral of Y(t) dt
+        log_length = np.log(self.lengths(sim, active))               # ln(d) of each cell at the previous stage
+        log_scale = 0.0                                              # ln of the factor the variation was divided by
+        t_previous = 0.0
+
+        for stage in range(1, stages + 1):
+            try:
+                sim.integrate(t_max * stage / stages)
+            except Exception:
+                for k in active:
+                    self.stop(sim, k, 10.0, 'error')
+                break
+
+            t = sim.t
+            # Like a simulation per cell, megno is only compared to the chaos threshold after each stage
+            end_of_stage = stage * self.simulation.stages // stages > (stage - 1) * self.simulation.stages // stages
+            lengths = self.lengths(sim, active)
+            stopped = []
+            for k, length in zip(active, lengths):
+                # Update the megno estimate from the growth of the variation
+                current = math.log(max(length, 1e-300)) + log_scale
+                integral[k] += (current - log_length[k]) * (t + t_previous) / 2
+                megno_sum[k] += 2 * integral[k] / t * (t - t_previous)
+                log_length[k] = current
+                megno = megno_sum[k] / t
+
+                position = self.state(self.test_particle(sim, k))[:3]
+                if(ejection_distance and np.linalg.norm(position) > ejection_distance):
+                    stopped.append((k, 10.0, 'ejected'))
+                elif(encounter_distance and self.min_distance(sim, position) < encounter_distance):
+                    stopped.append((k, 10.0, 'close_encounter'))
+                elif(stage == stages):
+                    stopped.append((k, megno, 'completed'))
+                elif(chaos_threshold is not None and end_of_stage and megno > chaos_threshold):
+                    stopped.append((k, megno, 'chaotic'))
+            t_previous = t
+
+            for k, megno, reason in stopped:
+                self.stop(sim, k, megno, reason)
+                active.remove(k)
+            if(not active):
+                break
+
+            # Keep the variation from overflowing, all cells are divided by the same factor
+            largest = max(lengths)
+            if(largest > 0):
+                self.rescale(sim, 1 / largest, active)
+                log_scale += math.log(largest)
+
+            # Stop integrating the test particles of stopped cells
+            if(stopped and len(active) <= len(self.slots) / 2):
+                sim = self.compact(sim, active)
+
+        self.steps_done += sim.steps_done                            # Integration steps, shared by every cell of the batch
+        return self.results
+
+    def min_distance(self, sim, position):
+        ''' Distance from the position to the nearest fixed particle. '''
+        return min(np.linalg.norm(position - self.state(sim.particles[i])[:3]) for i in range(self.n_active))
+
+    def stop(self, sim, k, megno, stop_reason):
+        ''' Save the result of cell k. Its test particle stays in the simulation until it is
+            compacted, but its part of the variation is cleared so it can't overflow the other cells.
+        '''
+        primary = sim.calculate_com(last=self.n_active)
+        initial_particles = self.simulation.fixed_particles + [self.particles[k]]
+        orbits = []
+        for i in range(1, self.n_active):
+            final_orbit = sim.particles[i].calculate_orbit(primary=sim.calculate_com(last=i))
+            orbits.append(self.simulation.orbit_data(final_orbit, initial_particles[i]))
+        final_orbit = self.test_particle(sim, k).calculate_orbit(primary=primary)
+        orbits.append(self.simulation.orbit_data(final_orbit, self.particles[k]))
+
+        info = {
+            'stop_reason': STOP_REASONS.index(stop_reason),
+            'stop_time': sim.t / (2*math.pi),
+        }
+        self.results[k] = (megno, orbits, info)
+        self.set_state(self.variation_particle(sim, self.n_active + self.slots[k]), np.zeros(6))
\ No newline at end of file
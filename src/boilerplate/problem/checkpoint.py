@@ -0,0 +1,59 @@
+import os
+import json
+
+class Checkpoint():
+    ''' Saves finished grid cells to disk in batches so an interrupted
+        simulation can be resumed without running those cells again.
+
+        Cell results are written by the GridResultWriter, the checkpoint file
+        only records which rows of the writer files are complete.
+    '''
+    def __init__(self, path, writer, batch_size, resume=False):
+        self.path = path                                             # Checkpoint file (one JSON line per cell)
+        self.writer = writer                                         # Writer that holds cell results
+        self.batch_size = max(int(batch_size), 1)                    # Number of cells finished before saving
+        self.buffer = []                                             # Cells finished but not saved yet
+        self.done = set()                                            # Indexes of the cells already saved
+
+        if(resume and writer.resumed and os.path.exists(self.path)):
+            self.load()
+        elif(os.path.exists(self.path)):
+            os.remove(self.path)
+
+    def load(self):
+        ''' Read cells already saved. A line cut in half by a crash is discarded. '''
+        valid_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    cell = json.loads(line)
+                except ValueError:
+                    break
+                if(not line.endswith(b'\n')):
+                    break
+                self.done.add(cell['i'])
+                valid_size += len(line)
+
+        # Drop incomplete data at the end of the file, so new cells are appended after valid lines
+        with open(self.path, 'ab') as f:
+            f.truncate(valid_size)
+
+    def add(self, index, result):
+        ''' Write a finished cell, saving the batch when it is full. '''
+        self.writer.write(index, result)
+        self.buffer.append(index)
+        if(len(self.buffer) >= self.batch_size):
+            self.flush()
+
+    def flush(self):
+        ''' Save buffered cells to disk. Results are flushed before being marked as done. '''
+        if(not self.buffer):
+            return
+        self.writer.flush()
+        with open(self.path, 'a') as f:
+            for index in self.buffer:
+                f.write(json.dumps({'i': index}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(self.buffer)
+        self.buffer = []
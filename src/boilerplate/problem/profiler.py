@@ -0,0 +1,84 @@
+import os
+import resource
+import numpy as np
+
+PROFILE_FIELDS = ['worker', 'start', 'end', 'steps', 'setup_time', 'integrate_time', 'orbit_time', 'peak_rss']
+PERCENTILES = [50, 90, 99]
+
+def peak_rss():
+    ''' Peak resident memory (MB) of the current process, ru_maxrss is in kilobytes on Linux. '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def worker_fields(start, end):
+    ''' Fields recorded by the worker around a cell: process, wall clock start and end (unix time) and peak memory. '''
+    return {'worker': os.getpid(), 'start': start, 'end': end, 'peak_rss': peak_rss()}
+
+def phase_fields(steps, setup_start, integrate_start, orbit_start, end):
+    ''' Integration steps and time (seconds) of each phase, from perf_counter marks. '''
+    return {
+        'steps': steps,
+        'setup_time': integrate_start - setup_start,
+        'integrate_time': orbit_start - integrate_start,
+        'orbit_time': end - orbit_start,
+    }
+
+def percentiles(values):
+    ''' Distribution of the values, NaN values are ignored. '''
+    values = values[~np.isnan(values)]
+    if(not len(values)):
+        return {}
+    return {
+        **{f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES},
+        'mean': float(values.mean()),
+        'max': float(values.max()),
+        'total': float(values.sum()),
+    }
+
+def summarise(profile, durations, cores, since):
+    ''' Summary of the profile array (one row per field of PROFILE_FIELDS) for results.json.
+
+        Utilisation and idle tail only consider cells run since the given time,
+        cells of a previous execution (resumed grids) have another time base.
+    '''
+    fields = {field: np.asarray(profile[i]).reshape(-1) for i, field in enumerate(PROFILE_FIELDS)}
+    durations = np.asarray(durations).reshape(-1)
+    done = ~np.isnan(fields['end'])
+    if(not done.any()):
+        return {}
+
+    summary = {
+        'cells': int(done.sum()),
+        'cell_time': percentiles(durations[done]),
+        'steps': percentiles(fields['steps'][done]),
+        'phases': {phase: percentiles(fields[f'{phase}_time'][done]) for phase in ('setup', 'integrate', 'orbit')},
+        'peak_rss': float(np.nanmax(fields['peak_rss'])),
+    }
+    integrate_time = np.nansum(fields['integrate_time'][done])
+    if(integrate_time > 0):
+        summary['steps_per_second'] = float(np.nansum(fields['steps'][done]) / integrate_time)
+
+    current = done & (fields['start'] >= since)
+    if(not current.any()):
+        return summary
+    start, end = fields['start'][current].min(), fields['end'][current].max()
+    span = max(end - start, 1e-9)
+    workers = []
+    for worker in np.unique(fields['worker'][current]):
+        cells = current & (fields['worker'] == worker)
+        busy = float((fields['end'][cells] - fields['start'][cells]).sum())
+        workers.append({
+            'worker': int(worker),
+            'cells': int(cells.sum()),
+            'busy_time': busy,
+            'utilisation': busy / span,
+            'last_end': float(fields['end'][cells].max() - start),
+            'peak_rss': float(np.nanmax(fields['peak_rss'][cells])),
+        })
+    busy = sum(worker['busy_time'] for worker in workers)
+    summary.update({
+        'span': float(span),
+        'utilisation': busy / (max(cores, len(workers)) * span),  # Busy time over the time every core was available
+        'idle_tail': float(span - min(worker['last_end'] for worker in workers)),  # Time from the first worker running out of cells to the end
+        'workers': workers,
+    })
+    return summary
\ No newline at end of file
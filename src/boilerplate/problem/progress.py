@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+class ProgressReporter():
+    ''' Keeps results/progress.json up to date while the grid runs, so progress can
+        be read without parsing the logs.
+
+        Only the main process counts, from the results the workers send back, so
+        workers share no counter or lock. A background thread rewrites the file
+        every interval seconds (a heartbeat of the run, even while no cell finishes)
+        to a temporary file that replaces the previous one, so readers never see a
+        partial file. Every num_logs-th of the cells a progress line is also printed.
+    '''
+    def __init__(self, path, total, num_logs, interval=5, failure_code=None):
+        self.path = path                                             # progress.json path
+        self.num_logs = num_logs                                     # Number of progress lines printed per run of cells
+        self.interval = interval                                     # Seconds between writes
+        self.failure_code = failure_code                             # stop_reason of the cells that failed
+        self.lock = threading.Lock()                                 # Shared with the writer thread only
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started_at = time.time()
+        self.status = 'running'
+        self.reset(total)
+
+    def reset(self, total, done=0):
+        ''' Start counting a run of total cells, done of them finished by a previous execution. '''
+        with self.lock:
+            self.total = total                                       # Cells of the run
+            self.done = done                                         # Cells finished, previous executions included
+            self.initial = done                                      # Cells finished before this execution
+            self.failures = 0                                        # Cells that stopped with an error
+            self.reset_at = time.time()
+            self.workers = {}                                        # Worker pid -> cells finished and last result time
+            self.D = max(int(total / self.num_logs), 1)              # Cells per log line
+
+    def add(self, result):
+        ''' Count a finished cell (megno, orbits, info) received from a worker. '''
+        megno, orbits, info = result
+        now = time.time()
+        with self.lock:
+            previous = self.done
+            self.done += 1
+            if(self.failure_code is not None and info.get('stop_reason') == self.failure_code):
+                self.failures += 1
+            if('worker' in info):
+                worker = self.workers.setdefault(str(info['worker']), {'cells': 0})
+                worker['cells'] += 1
+                worker['last_seen'] = now
+            should_log = self.done // self.D > previous // self.D
+        if(should_log):
+            self.log()
+
+    def snapshot(self):
+        ''' Progress of the run as a JSON serializable dict. '''
+        now = time.time()
+        with self.lock:
+            elapsed = now - self.reset_at
+            rate = (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.done
+            return {
+                'status': self.status,
+                'done': self.done,
+                'total': self.total,
+                'percent': self.done / self.total * 100 if self.total else 0.0,
+                'failures': self.failures,
+                'cells_per_second': rate,
+                'eta_seconds': remaining / rate if rate else None,
+                'elapsed_seconds': now - self.started_at,
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+                'updated_at': datetime.fromtimestamp(now).isoformat(),
+                'workers': {
+                    pid: {
+                        'cells': worker['cells'],
+                        'last_seen': datetime.fromtimestamp(worker['last_seen']).isoformat(),
+                        'idle_seconds': now - worker['last_seen'],   # Time since the worker sent its last result
+                    }
+                    for pid, worker in self.workers.items()
+                },
+            }
+
+    def log(self):
+        progress = self.snapshot()
+        elapsed, eta = progress['elapsed_seconds'], progress['eta_seconds'] or 0
+        print(f'{progress["done"]}/{progress["total"]} ({progress["percent"]:.2f}% | {elapsed/60:.2f} min | {eta/60:.2f} min ETA)')
+
+    def write(self):
+        ''' Replace progress.json atomically. '''
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, self.path)
+
+    def run(self):
+        while(not self.stopped.wait(self.interval)):
+            try:
+                self.write()
+            except OSError as e:
+                print(f'Error while writing progress: {e}')
+
+    def start(self):
+        self.write()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, status):
+        ''' Stop the writer thread and write the final status. '''
+        self.stopped.set()
+        if(self.thread is not None):
+            self.thread.join()
+        with self.lock:
+            self.status = status
+        self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop('failed' if exc_type else 'finished')
\ No newline at end of file
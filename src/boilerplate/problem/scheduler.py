@@ -0,0 +1,75 @@
+from rebound.interruptible_pool import InterruptiblePool
+
+simulation = None                                                    # Grid simulation of the worker process
+
+def init_worker(grid_simulation):
+    ''' Keep the grid simulation in the worker, so tasks only carry cell coordinates. '''
+    global simulation
+    simulation = grid_simulation
+    simulation.init_worker()
+
+def run_task(cell):
+    return simulation.run_cell(cell)
+
+def run_batch_task(cells):
+    return simulation.run_batch(cells)
+
+
+class GridScheduler():
+    ''' Sends grid cells to the worker pool as compact (index, x, y) tuples,
+        slowest first, in chunks of grid.chunksize cells.
+
+        When the simulation uses batches, consecutive cells (of similar cost)
+        are grouped and run together by one task.
+
+        A new pool is started for each run, so workers see the simulation
+        state (e.g. progress totals) at the moment the cells are sent. It is
+        closed when every cell finished, and terminated if the run is
+        interrupted or the caller stops iterating early.
+    '''
+    def __init__(self, simulation, cores, chunksize=None):
+        self.simulation = simulation
+        self.cores = cores
+        self.chunksize = chunksize                                   # Cells per task sent to a worker (None is automatic)
+        self.pool = None
+
+    def start(self):
+        ''' Start the pool. Workers receive the simulation once, when they are created. '''
+        self.pool = InterruptiblePool(self.cores, initializer=init_worker, initargs=(self.simulation,))
+        return self
+
+    def get_chunksize(self, num_cells):
+        if(self.chunksize):
+            return self.chunksize
+        return max(num_cells // (self.cores * 8), 1)                 # Small chunks so the tail is shared by all workers
+
+    def run(self, cells):
+        ''' Yield (index, result) of the cells as they finish, most expensive cells are sent first. '''
+        cells = sorted(cells, key=lambda cell: self.simulation.estimate_cost(cell[1], cell[2]), reverse=True)
+        self.start()
+        try:
+            if(self.simulation.use_batches()):
+                size = self.simulation.batch_size
+                batches = [cells[i:i + size] for i in range(0, len(cells), size)]
+                for results in self.pool.imap_unordered(run_batch_task, batches, chunksize=self.get_chunksize(len(batches))):
+                    yield from results
+            else:
+                yield from self.pool.imap_unordered(run_task, cells, chunksize=self.get_chunksize(len(cells)))
+        except BaseException:                                        # Ctrl-C, a failed cell or a consumer that stopped reading
+            self.terminate()
+            raise
+        self.close()
+
+    def close(self):
+        ''' Wait for the workers to exit, only once every task finished. '''
+        if(self.pool is not None):
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        ''' Stop the workers without waiting for the pending tasks. '''
+        if(self.pool is not None):
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
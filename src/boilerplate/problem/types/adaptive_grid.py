@@ -0,0 +1,96 @@
+import numpy as np
+from problem import utils
+from problem.types.grid import GridSimulation
+from problem.writer import GridResultWriter
+
+INTEGRATION_FIELDS = ['stop_reason', 'stop_time', 'duration']      # Only integrated points have them, filled points are left NaN
+
+class AdaptiveGridSimulation(GridSimulation):
+    ''' Grid that starts with N x N points and, at each depth, subdivides only
+        the cells whose corners have very different megno values.
+
+        Points of every depth lie on a regular grid of (N-1) * 2^max_depth + 1
+        points per axis, which is the shape of the exported arrays. Points that
+        were not integrated take the value of the nearest integrated point of
+        the finest depth around them.
+    '''
+    def __init__(self, inputs):
+        super().__init__(inputs)
+        if('rows' in self.grid_options):
+            raise Exception('Adaptive grids can not be split in rows.')
+        self.max_depth = self.grid_options.get('max_depth', 2)       # Number of times a cell can be subdivided
+        self.threshold = self.grid_options.get('threshold', 0.5)     # Megno difference that makes a cell be subdivided
+        self.n_final = (self.grid_options['N'] - 1) * 2 ** self.max_depth + 1  # Points per axis of the final grid
+        self.num_integrations = 0                                    # Number of grid points integrated
+
+    def create_writer(self, resume=False):
+        num_particles = len(self.inputs['particles'])
+        shape = (self.n_final, self.n_final)
+        return GridResultWriter('results', shape, num_particles, resume=resume, profile=self.profile)
+
+    def run_grid(self, scheduler, checkpoint):
+        ''' Run the coarse grid, then refine it depth by depth. '''
+        particle = self.grid_options['particle']
+        x_attr, y_attr = self.grid_attributes()
+        x_values = np.linspace(particle[x_attr][0], particle[x_attr][1], self.n_final)
+        y_values = np.linspace(particle[y_attr][0], particle[y_attr][1], self.n_final)
+
+        computed = np.zeros((self.n_final, self.n_final), dtype=bool)
+        step = 2 ** self.max_depth
+        points = [(row, col) for row in range(0, self.n_final, step) for col in range(0, self.n_final, step)]
+        for depth in range(self.max_depth + 1):
+            utils.log(f'Running depth {depth} with {len(points)} simulations...')
+            params = [(row * self.n_final + col, float(x_values[col]), float(y_values[row])) for row, col in points]
+            self.run_cells(scheduler, checkpoint, params)
+            for row, col in points:
+                computed[row, col] = True
+            self.num_integrations += len(points)
+
+            if(depth == self.max_depth):
+                break
+            points = self.refine(checkpoint.writer.megno, computed, step)
+            step //= 2
+            if(not points):
+                break
+
+        self.fill(checkpoint.writer, computed)
+
+    def refine(self, megno, computed, step):
+        ''' Points inside the cells of size step whose corner megnos differ more than the threshold. '''
+        values = np.where(computed[::step, ::step], megno[::step, ::step], np.nan)
+        corners = np.stack([values[:-1, :-1], values[1:, :-1], values[:-1, 1:], values[1:, 1:]])
+        spread = corners.max(axis=0) - corners.min(axis=0)          # NaN when a corner was not integrated
+
+        half = step // 2
+        points = set()
+        for i, j in zip(*np.nonzero(spread > self.threshold)):
+            for dr in (0, half, step):
+                for dc in (0, half, step):
+                    row, col = int(i) * step + dr, int(j) * step + dc
+                    if(not computed[row, col]):
+                        points.add((row, col))
+        return sorted(points)
+
+    def fill(self, writer, computed):
+        ''' Rasterise the results, filling points not integrated from the nearest integrated point. '''
+        rows, cols = np.indices(computed.shape)
+        filled = computed.copy()
+        for depth in range(self.max_depth, -1, -1):
+            step = 2 ** (self.max_depth - depth)
+            source_rows = np.rint(rows / step).astype(int) * step
+            source_cols = np.rint(cols / step).astype(int) * step
+            mask = ~filled & computed[source_rows, source_cols]
+            source = (source_rows[mask], source_cols[mask])
+            for name, array in writer.arrays().items():
+                if(name not in INTEGRATION_FIELDS):
+                    array[..., mask] = array[(Ellipsis,) + source]
+            filled |= mask
+        writer.flush()
+
+    def summary(self):
+        return {
+            'num_simulations': self.num_integrations,
+            'grid_shape': [self.n_final, self.n_final],
+            'max_depth': self.max_depth,
+            'threshold': self.threshold,
+        }
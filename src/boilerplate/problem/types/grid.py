@@ -5,11 +5,14 @@ import time
 import json
 import numpy as np
 import pandas as pd
-import multiprocessing
 import matplotlib.pyplot as plt
 from datetime import datetime, timezone
-
-simulations_finished = multiprocessing.Value('i', 0)                 # Number of simulations finished   
+from contextlib import closing
+from problem.writer import GridResultWriter, STOP_REASONS
+from problem.scheduler import GridScheduler
+from problem.batch import TestParticleBatch
+from problem.progress import ProgressReporter
+from problem import profiler
 
 class GridSimulation():
     def __init__(self, inputs):
@@ -24,98 +27,262 @@ class GridSimulation():
         self.timestep = inputs['timestep']                           # Timestep of the simulation
         self.grid_options = inputs['grid']                           # Grid options
         self.start_time = time.time()
-        self.num_simulations = self.grid_options['N'] ** 2           # Number of simulations
+        self.rows = self.grid_options.get('rows', [0, self.grid_options['N']])  # Rows [start, end) of the grid run by this host (sharded grids)
+        self.num_simulations = (self.rows[1] - self.rows[0]) * self.grid_options['N']  # Number of simulations
         self.D = max(int(self.num_simulations / self.number_of_logs), 1)  # Number of simulations per log line                           
+        self.checkpoint_size = self.grid_options.get('checkpoint_size', self.D)  # Number of simulations saved per checkpoint batch
+        self.export_csv = self.grid_options.get('export_csv', True)  # Export CSV files besides the .npy arrays
+        self.stages = self.grid_options.get('stages', 1)             # Number of chunks the integration is split into
+        self.chaos_threshold = self.grid_options.get('chaos_threshold')  # Megno that stops the integration after a chunk
+        self.encounter_min_distance = self.grid_options.get('encounter_min_distance')  # Close encounter distance that stops the integration
+        self.chunksize = self.grid_options.get('chunksize')          # Cells per task sent to a worker
+        self.batch_size = self.grid_options.get('batch_size', 1)     # Massless cells integrated together as test particles
+        self.batch_samples = self.grid_options.get('batch_samples', 1000)  # Stages used to estimate megno of batched cells
+        self.batch_sample_steps = self.grid_options.get('batch_sample_steps', 20)  # Minimum integration steps between those stages
+        self.profile = self.grid_options.get('profile', False)       # Record steps, phase times, worker and memory of each cell
+        self.fixed_particles = [{attr: float(p[attr]) for attr in p} for p in inputs['particles']]  # Particles that are the same in every cell
+        self.base_sim = None                                         # Simulation with the fixed particles, built once per worker
+        self.progress = ProgressReporter('results/progress.json', self.num_simulations, self.number_of_logs, self.grid_options.get('progress_interval', 5), STOP_REASONS.index('error'))
+
+    def __getstate__(self):
+        ''' Workers receive the simulation without the progress reporter, only the main process counts. '''
+        return {**self.__dict__, 'progress': None}
     
+    def grid_attributes(self):
+        ''' Identify attributes of the dynamic particle that vary along the grid (x, y). '''
+        particle = self.grid_options['particle']
+        x_attr, y_attr = [attr for attr in particle if type(particle[attr]) == list]
+        return x_attr, y_attr
+
     def prepare_params(self):
         n_grid = self.grid_options['N']
         
         # Identify attributes ranges
-        ranges = {}
         particle = self.grid_options['particle']
-        for attr in particle:
-            if(type(particle[attr]) == list):
-                ranges[attr] = np.linspace(particle[attr][0], particle[attr][1], n_grid)
-        x_attr, y_attr = list(ranges.keys())
+        x_attr, y_attr = self.grid_attributes()
+        ranges = {attr: np.linspace(particle[attr][0], particle[attr][1], n_grid) for attr in (x_attr, y_attr)}
         
-        # Create parameters for each simulation
+        # Create parameters (index, x, y) for each simulation
         params = []
-        for y in ranges[y_attr]:
+        start, end = self.rows
+        for y in ranges[y_attr][start:end]:
             for x in ranges[x_attr]:
-                particles = self.inputs['particles'].copy()
-                particles.append({**particle, x_attr: x, y_attr: y})
-                params.append(particles)
+                params.append((len(params), float(x), float(y)))
                 
         return params
+
+    def cell_params(self, x, y):
+        ''' Dynamic particle of the simulation at grid position (x, y). '''
+        particle = self.grid_options['particle']
+        x_attr, y_attr = self.grid_attributes()
+        return {**particle, x_attr: x, y_attr: y}
     
-    def run(self, particles):
-        ''' Run simulation based on parameters. '''
+    def estimate_cost(self, x, y):
+        ''' Cheap estimate of the relative run time of a cell, used to send slow cells first.
+            Inner orbits need more steps per year and eccentric orbits are more likely
+            to be ejected early.
+        '''
+        particle = {**self.grid_options['particle'], **dict(zip(self.grid_attributes(), (x, y)))}
+        cost = 1.0
+        if(isinstance(particle.get('a'), (int, float)) and particle['a'] > 0):
+            cost *= particle['a'] ** -1.5
+        if(isinstance(particle.get('e'), (int, float))):
+            cost *= max(1 - particle['e'], 1e-3)
+        return cost
+
+    def create_writer(self, resume=False):
+        ''' Create writer that stores the result of each grid cell on disk. '''
+        num_particles = len(self.inputs['particles'])                # Fixed particles plus the dynamic one, minus the central body
+        shape = (self.rows[1] - self.rows[0], self.grid_options['N'])
+        return GridResultWriter('results', shape, num_particles, resume=resume, profile=self.profile)
+
+    def reset_progress(self, num_simulations, num_finished=0):
+        ''' Start progress count, considering simulations finished in a previous execution. '''
+        self.num_simulations = num_simulations
+        self.D = max(int(num_simulations / self.number_of_logs), 1)
+        self.progress.reset(num_simulations, num_finished)
+
+    def create_scheduler(self):
+        return GridScheduler(self, self.cores, self.chunksize)
+
+    def run_grid(self, scheduler, checkpoint):
+        ''' Run every grid cell not saved in the checkpoint yet. '''
+        self.run_cells(scheduler, checkpoint, self.prepare_params())
+
+    def run_cells(self, scheduler, checkpoint, params):
+        ''' Run the given (index, x, y) cells, skipping the ones already saved. '''
+        pending = [param for param in params if param[0] not in checkpoint.done]
+        self.reset_progress(len(params), len(params) - len(pending))
+        with closing(scheduler.run(pending)) as results:           # Terminates the pool if saving a result fails
+            for index, result in results:
+                checkpoint.add(index, result)
+                self.progress.add(result)
+        checkpoint.flush()
+
+    def use_batches(self):
+        ''' Cells are batched only when asked and the dynamic particle is massless. '''
+        mass = self.grid_options['particle'].get('m', 0)
+        return self.batch_size > 1 and not isinstance(mass, list) and float(mass) == 0
+
+    def run_batch(self, params):
+        ''' Run (index, x, y) cells together as test particles of one simulation. '''
+        if(self.base_sim is None):
+            self.init_worker()
+        started_at = time.time()
+        start = time.perf_counter()
+        batch = TestParticleBatch(self, [self.cell_params(x, y) for _, x, y in params])
+        results = batch.run()
+        end = time.perf_counter()
+        for k, (_, _, info) in enumerate(results):
+            info['duration'] = (end - start) / len(params)          # Batch time shared by its cells
+            info['worker'] = os.getpid()
+            if(self.profile):
+                # Each cell gets an equal slice of the batch steps and time, orbits are calculated as cells stop so their time is part of integrate_time
+                info['profile'] = {
+                    'steps': batch.steps_done / len(params),
+                    'setup_time': batch.setup_time / len(params),
+                    'integrate_time': info['duration'] - batch.setup_time / len(params),
+                    'orbit_time': 0.0,
+                    **profiler.worker_fields(started_at + k * info['duration'], started_at + (k + 1) * info['duration']),
+                }
+        return [(param[0], result) for param, result in zip(params, results)]
+
+    def init_worker(self):
+        ''' Build the fixed particles once, every cell of the worker starts from a copy. '''
+        self.base_sim = self.create_simulation(self.fixed_particles)
+
+    def create_simulation(self, particles):
+        ''' Create simulation object with the given particles. '''
         sim = rebound.Simulation()                             # Create simulation object
         sim.integrator = self.integrator                       # Set integrator
         sim.dt = self.timestep * (2*math.pi)                   # Set timestep
-
         for particle in particles:
-            for attr in particle:
-                particle[attr] = float(particle[attr])
             sim.add(**particle)                                # Add particle to the simulation
+        return sim
+
+    def run_cell(self, param):
+        ''' Run simulation of one grid cell, returning its index with the result. '''
+        index, x, y = param
+        started_at = time.time()
+        start = time.perf_counter()
+        megno, orbits, info = self.run(self.cell_params(x, y))
+        info['duration'] = time.perf_counter() - start
+        info['worker'] = os.getpid()
+        if(self.profile):
+            info['profile'].update(profiler.worker_fields(started_at, time.time()))
+        return index, (megno, orbits, info)
+    
+    def run(self, particle):
+        ''' Run simulation of the fixed particles plus the given dynamic particle. '''
+        if(self.base_sim is None):
+            self.init_worker()
+        setup_start = time.perf_counter()
+        sim = self.base_sim.copy()                             # Copy simulation with the fixed particles
+        particle = {attr: float(particle[attr]) for attr in particle}
+        sim.add(**particle)                                    # Add dynamic particle to the simulation
+        particles = self.fixed_particles + [particle]
 
         sim.move_to_com()                                      # Move objects to the center of momentum frame
 
         sim.init_megno(seed=0)                                 # Setup Megno chaos indicator
         sim.exit_max_distance = self.ejection_max_distance     # Max distance from center of mass
+        if(self.encounter_min_distance):
+            sim.exit_min_distance = self.encounter_min_distance  # Min distance between particles
         
-        error = None
-        try:
-            sim.integrate(self.years * (2*math.pi))              # Run simulation
-        except Exception as e:
-            error = e
+        integrate_start = time.perf_counter()
+        error, stop_reason = self.integrate(sim)
     
-        result = self.calculate_result(sim, error, particles)
-        
-        # After every D simulations, log the progress
-        global simulations_finished
-        with simulations_finished.get_lock():
-            simulations_finished.value = simulations_finished.value + 1
-            should_log = simulations_finished.value % self.D == 0
-            if(should_log):
-                progress = simulations_finished.value / (self.num_simulations) * 100
-                time_elapsed = time.time() - self.start_time
-                eta = 100 * time_elapsed / progress - time_elapsed if progress else 0
-                print(f'{simulations_finished.value}/{self.num_simulations} ({progress:.2f}% | {time_elapsed/60:.2f} min | {eta/60:.2f} min ETA)')
-        
+        orbit_start = time.perf_counter()
+        result = self.calculate_result(sim, error, particles, stop_reason)
+        if(self.profile):
+            result[2]['profile'] = profiler.phase_fields(sim.steps_done, setup_start, integrate_start, orbit_start, time.perf_counter())
         return result
 
-    def calculate_result(self, sim, error, particles):
+    def integrate(self, sim):
+        ''' Integrate in stages, stopping early once megno crosses the chaos threshold
+            or a particle is ejected or has a close encounter.
+        '''
+        t_max = self.years * (2*math.pi)
+        try:
+            for stage in range(1, self.stages + 1):
+                sim.integrate(t_max * stage / self.stages)           # Run simulation until the end of the stage
+                if(self.chaos_threshold is not None and stage < self.stages and sim.calculate_megno() > self.chaos_threshold):
+                    return None, 'chaotic'
+        except rebound.Escape as e:
+            return e, 'ejected'
+        except rebound.Encounter as e:
+            return e, 'close_encounter'
+        except Exception as e:
+            return e, 'error'
+        return None, 'completed'
+
+    def calculate_result(self, sim, error, particles, stop_reason='completed'):
         ''' Calculate result of the simulation. '''
 
         # Final orbit data by particle
         orbits = []
         i = 0
         for final_orbit in sim.calculate_orbits():
-            inital_orbit = particles[i+1]
-            orbit = {
-                'a': final_orbit.a,
-                'e': final_orbit.e,
-                'inc': final_orbit.inc,
-                'Omega': final_orbit.Omega,
-                'omega': final_orbit.omega,
-                'M': final_orbit.M,
-                'delta_a': final_orbit.a - inital_orbit.get('a', 0),
-                'delta_e': final_orbit.e - inital_orbit.get('e', 0)
-            }
-            orbits.append(orbit)
+            orbits.append(self.orbit_data(final_orbit, particles[i+1]))
             i += 1
         
+        # When and why the simulation stopped
+        info = {
+            'stop_reason': STOP_REASONS.index(stop_reason),
+            'stop_time': sim.t / (2*math.pi),
+        }
+        
         # Check if there was an error 
         if(error):                                                  
             megno = 10.0
-            return megno, orbits
+            return megno, orbits, info
         
         megno = sim.calculate_megno()
-        return megno, orbits
+        return megno, orbits, info
     
     
-    def export_results(self, results):
+    def orbit_data(self, final_orbit, inital_orbit):
+        ''' Final orbit of a particle and how much it changed. '''
+        return {
+            'a': final_orbit.a,
+            'e': final_orbit.e,
+            'inc': final_orbit.inc,
+            'Omega': final_orbit.Omega,
+            'omega': final_orbit.omega,
+            'M': final_orbit.M,
+            'delta_a': final_orbit.a - inital_orbit.get('a', 0),
+            'delta_e': final_orbit.e - inital_orbit.get('e', 0)
+        }
+
+    def summary(self):
+        ''' Additional information of the grid exported in results.json. '''
+        return {'num_simulations': (self.rows[1] - self.rows[0]) * self.grid_options['N']}
+
+    def count_stop_reasons(self, writer):
+        ''' Number of simulations that stopped for each reason. '''
+        codes = np.asarray(writer.cells['stop_reason']).reshape(-1)
+        return {reason: int(np.sum(codes == i)) for i, reason in enumerate(STOP_REASONS)}
+
+    def summarise_durations(self, writer):
+        ''' Statistics of the time (seconds) each cell took to run. '''
+        durations = np.asarray(writer.cells['duration']).reshape(-1)
+        durations = durations[~np.isnan(durations)]
+        if(not len(durations)):
+            return {}
+        return {
+            'total': float(durations.sum()),
+            'mean': float(durations.mean()),
+            'max': float(durations.max()),
+        }
+
+    def summarise_profile(self, writer):
+        ''' Percentiles of cell times and steps, per worker utilisation and idle tail of this execution. '''
+        if(writer.profile is None):
+            return {}
+        return profiler.summarise(writer.profile, writer.cells['duration'], self.cores, self.start_time)
+
+    def export_results(self, writer):
+        ''' Export results already written by the GridResultWriter. '''
         end_time = time.time()
         
         # General result
@@ -124,30 +291,25 @@ class GridSimulation():
             'end_time': datetime.fromtimestamp(end_time).isoformat(),
             'duration_time': (end_time - self.start_time) / 60 / 60,
             'status': 'finished',
+            **self.summary(),
+            'stop_reasons': self.count_stop_reasons(writer),
+            'cell_durations': self.summarise_durations(writer),
         }
-        
-        megnos = []
-        particles_orbits = [[] for _ in results[0][1]] 
-        for sim_result in results:
-            megno, orbits = sim_result
-            megnos.append(megno)
-            
-            i = 0
-            for orbit in orbits:
-                particles_orbits[i].append(orbit)
-                i += 1
+        if(self.profile):
+            result['profile'] = self.summarise_profile(writer)
             
         # Exports results.json file    
         with open('results/results.json', 'w') as f:
             json.dump(result, f, indent=4)
             
-        # Exports megnos.csv file    
-        df = pd.DataFrame(megnos, columns=['megno'])
-        df.to_csv('results/megnos.csv', index=False, header=True)
+        # Exports grid.json file, describing the .npy arrays
+        particle = self.grid_options['particle']
+        x_attr, y_attr = self.grid_attributes()
+        y_values = np.linspace(particle[y_attr][0], particle[y_attr][1], self.grid_options['N'])[self.rows[0]:self.rows[1]]
+        y_range = [y_values[0], y_values[-1]] if self.rows != [0, self.grid_options['N']] else particle[y_attr]
+        writer.export_metadata(x_attr, y_attr, particle[x_attr], y_range, rows=[self.rows[0], self.rows[0] + writer.shape[0]], stop_reasons=STOP_REASONS)
         
-        # Exports orbits file for each particle
-        i = 1
-        for particle_data in particles_orbits:
-            df = pd.DataFrame(particle_data)
-            df.to_csv(f'results/orbits_p{i:03d}.csv', index=False, header=True)
-            i += 1
\ No newline at end of file
+        # Exports megnos.csv and orbits file for each particle
+        if(self.export_csv):
+            writer.export_csv()
+        writer.close()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from problem.profiler import PROFILE_FIELDS
+
+ORBIT_FIELDS = ['a', 'e', 'inc', 'Omega', 'omega', 'M', 'delta_a', 'delta_e']
+CELL_FIELDS = ['stop_reason', 'stop_time', 'duration']
+STOP_REASONS = ['completed', 'chaotic', 'ejected', 'close_encounter', 'error']  # Why a simulation stopped (code is the index)
+
+class GridResultWriter():
+    ''' Writes grid results to memory-mapped .npy files as cells finish, so
+        results never need to be held in memory.
+
+        Each quantity has its own float64 array: megno.npy and one array per
+        cell field with the grid shape (rows are the y attribute, columns the
+        x attribute) and one array per orbit field with shape (particles,
+        *grid shape). They can be opened with np.load(path, mmap_mode='r')
+        without parsing.
+
+        With profile enabled, profiling fields of each cell are written to
+        profile.npy with shape (len(PROFILE_FIELDS), *grid shape).
+    '''
+    def __init__(self, folder, shape, num_particles, resume=False, profile=False):
+        self.folder = folder                                         # Results folder
+        self.shape = tuple(shape)                                    # Grid shape (rows, columns)
+        self.num_cells = int(np.prod(self.shape))                    # Number of grid cells
+        self.num_particles = num_particles                           # Number of particles with orbit data
+        self.resumed = resume and self.has_files()                   # Whether previous data was reopened
+
+        mode = 'r+' if self.resumed else 'w+'
+        self.megno = self.open('megno', self.shape, mode)
+        self.cells = {field: self.open(field, self.shape, mode) for field in CELL_FIELDS}
+        self.orbits = {field: self.open(field, (num_particles,) + self.shape, mode) for field in ORBIT_FIELDS}
+        self.profile = None                                          # Profiling fields of each cell, when enabled
+        if(profile):
+            profile_mode = mode if os.path.exists(self.path('profile')) else 'w+'
+            self.profile = self.open('profile', (len(PROFILE_FIELDS),) + self.shape, profile_mode)
+
+    def names(self):
+        return ['megno'] + CELL_FIELDS + ORBIT_FIELDS
+
+    def arrays(self):
+        ''' Every array by name, grid dimensions are always the last two. '''
+        return {'megno': self.megno, **self.cells, **self.orbits}
+
+    def path(self, name):
+        return os.path.join(self.folder, f'{name}.npy')
+
+    def has_files(self):
+        return all(os.path.exists(self.path(name)) for name in self.names())
+
+    def open(self, name, shape, mode):
+        if(mode == 'w+'):
+            array = np.lib.format.open_memmap(self.path(name), mode=mode, dtype=np.float64, shape=shape)
+            array[:] = np.nan
+            return array
+        return np.lib.format.open_memmap(self.path(name), mode=mode)
+
+    def write(self, index, result):
+        ''' Write the result of one grid cell at its position. '''
+        megno, orbits, info = result
+        cell = np.unravel_index(index, self.shape)
+        self.megno[cell] = megno
+        for field in CELL_FIELDS:
+            self.cells[field][cell] = info[field]
+        for i, orbit in enumerate(orbits):
+            for field in ORBIT_FIELDS:
+                self.orbits[field][(i,) + cell] = orbit[field]
+        if(self.profile is not None and 'profile' in info):
+            for i, field in enumerate(PROFILE_FIELDS):
+                self.profile[(i,) + cell] = info['profile'][field]
+
+    def flush(self):
+        ''' Make sure written cells are on disk. '''
+        for array in self.arrays().values():
+            array.flush()
+        if(self.profile is not None):
+            self.profile.flush()
+
+    def export_metadata(self, x_attr, y_attr, x_range, y_range, **extra):
+        ''' Export grid.json, describing the axes of the .npy files. '''
+        metadata = {
+            'shape': list(self.shape),
+            'x_attr': x_attr,
+            'y_attr': y_attr,
+            'x_range': [float(v) for v in x_range],
+            'y_range': [float(v) for v in y_range],
+            'num_particles': self.num_particles,
+            'quantities': self.names(),
+            **extra,
+        }
+        with open(os.path.join(self.folder, 'grid.json'), 'w') as f:
+            json.dump(metadata, f, indent=4)
+
+    def export_csv(self, chunk_size=10000):
+        ''' Export megnos.csv and orbits_pNNN.csv files, a chunk of rows at a time. '''
+        self.flush()
+        columns = {name: self.arrays()[name].reshape(-1) for name in ['megno'] + CELL_FIELDS}
+        self.write_csv('megnos.csv', columns, chunk_size)
+        for i in range(self.num_particles):
+            columns = {field: self.orbits[field][i].reshape(-1) for field in ORBIT_FIELDS}
+            self.write_csv(f'orbits_p{i+1:03d}.csv', columns, chunk_size)
+
+    def write_csv(self, filename, columns, chunk_size):
+        path = os.path.join(self.folder, filename)
+        for start in range(0, max(self.num_cells, 1), chunk_size):
+            df = pd.DataFrame({name: values[start:start + chunk_size] for name, values in columns.items()})
+            df.to_csv(path, index=False, header=start == 0, mode='w' if start == 0 else 'a')
+
+    def close(self):
+        self.flush()
+        del self.megno, self.cells, self.orbits, self.profile
@@ -4,5 +4,7 @@ from src.lib.adapters import secrets_adapter
 SERVICE_NAME = os.environ.get('SERVICE_NAME')
 STAGE = os.environ.get('STAGE')
 SIMULATIONS_TABLE = f'{SERVICE_NAME}-{STAGE}-Simulations'
+HARVEST_QUEUE_URL = os.environ.get('HARVEST_QUEUE_URL')
 SIMULATIONS_RESULTS_TABLE = f'{SERVICE_NAME}-{STAGE}-SimulationsResults'
+SECRETS_TTL = int(os.environ.get('SECRETS_TTL', 300))
 APP_SECRET_ARN = 'arn:aws:secretsmanager:us-east-1:396489703414:secret:rebound-ctrl-secret-6pFng0'
\ No newline at end of file
@@ -0,0 +1,24 @@
+import json
+from src.app import service
+
+# Processes the jobs of the harvest queue. Failed jobs raise, so SQS retries
+# them and moves them to the dead letter queue after too many attempts.
+def handler(event, context):
+    for record in event['Records']:
+        service.process_job(json.loads(record['body']))
+
+# Processes the jobs moved to the dead letter queue, they failed every attempt.
+def failed(event, context):
+    for record in event['Records']:
+        print(f'Job failed every attempt: {record["body"]}')
+        service.fail_job(json.loads(record['body']))
+
+# Runs on a schedule, so queued simulations start even if no status check frees a host.
+def dispatch(event, context):
+    started = service.dispatch_queued_simulations()
+    print(f'Started {len(started)} queued simulations.')
+
+# Invoked by etc/deploy.sh after every deploy, so simulations saved before the listing indexes are listed.
+def backfill(event, context):
+    updated = service.backfill_simulation_kinds()
+    print(f'Set the kind of {updated} simulations.')
\ No newline at end of file
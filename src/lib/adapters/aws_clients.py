@@ -0,0 +1,16 @@
+import threading
+
+clients = {}                                    # (service, region) -> boto3 client
+lock = threading.Lock()
+
+def get_client(service_name, region_name=None):
+    ''' boto3 clients are created once per container and shared by every adapter. boto3
+        is imported with the first client, so requests that do not use AWS never load it.
+    '''
+    key = (service_name, region_name)
+    if(key not in clients):
+        with lock:
+            if(key not in clients):
+                import boto3
+                clients[key] = boto3.client(service_name, region_name=region_name)
+    return clients[key]
\ No newline at end of file
@@ -0,0 +1,69 @@
+import json
+import time
+import queue
+import threading
+import traceback
+from src.lib.adapters import aws_clients
+
+def get_client():
+    return aws_clients.get_client('sqs')
+
+
+class SQSQueue():
+    ''' Jobs are sent to an SQS queue and processed by the harvester function.
+        Failed jobs become visible again and are retried until the queue moves
+        them to its dead letter queue, whose jobs are given to the failed function.
+    '''
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, job):
+        get_client().send_message(QueueUrl=self.url, MessageBody=json.dumps(job))
+
+
+class LocalQueue():
+    ''' In-process queue, jobs are processed by a background thread. Used when
+        no SQS queue is configured (local server and tests).
+    '''
+    def __init__(self, handler, max_retries=3, retry_delay=5, on_failure=None):
+        self.handler = handler                          # Function that processes a job
+        self.on_failure = on_failure                    # Function called with a job that failed every attempt
+        self.max_retries = max_retries                  # Attempts before a job is dropped
+        self.retry_delay = retry_delay                  # Seconds between attempts
+        self.jobs = queue.Queue()
+        self.failed = []                                # Jobs that failed every attempt
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def send(self, job):
+        self.jobs.put((json.loads(json.dumps(job)), 1, 0))
+
+    def work(self):
+        while(True):
+            job, attempt, ready_at = self.jobs.get()
+            try:
+                if(time.time() < ready_at):                 # Retry not due yet, put it back at the end
+                    time.sleep(0.05)
+                    self.jobs.put((job, attempt, ready_at))
+                    continue
+                self.handler(job)
+            except Exception:
+                print(traceback.format_exc())
+                if(attempt < self.max_retries):
+                    self.jobs.put((job, attempt + 1, time.time() + self.retry_delay))
+                else:
+                    self.failed.append(job)
+                    self.fail(job)
+            finally:
+                self.jobs.task_done()
+
+    def fail(self, job):
+        if(self.on_failure):
+            try:
+                self.on_failure(job)
+            except Exception:
+                print(traceback.format_exc())
+
+    def join(self):
+        ''' Wait until every job was processed, retries included. '''
+        self.jobs.join()
@@ -1,15 +1,11 @@
 import io
-import boto3
 import json
+from itertools import chain
 from io import StringIO, BytesIO
-
-s3_client = None
+from src.lib.adapters import aws_clients
 
 def get_client():
-    global s3_client
-    if(s3_client is None):
-        s3_client = boto3.client('s3')
-    return s3_client
+    return aws_clients.get_client('s3')
 
 
 def file_exists(bucket, path):
@@ -57,9 +53,55 @@ def download_file(bucket, path):
     return obj
 
 
+def open_file(bucket, path, byte_range=None):
+    ''' Get an object without reading it, Body is a stream. byte_range is an HTTP Range header value. '''
+    if(byte_range):
+        return get_client().get_object(Bucket=bucket, Key=path, Range=byte_range)
+    return get_client().get_object(Bucket=bucket, Key=path)
+
+
+def presigned_url(bucket, path, expires_in=3600, filename=None):
+    params = { 'Bucket': bucket, 'Key': path }
+    if(filename):
+        params['ResponseContentDisposition'] = f'attachment; filename={filename}'
+    return get_client().generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+def download_fileobj(bucket, path, file):
+    get_client().download_fileobj(bucket, path, file)
+
+
 def upload_file(bucket, path, file, content_type=None):
     file.seek(0)
-    get_client().upload_fileobj(file, bucket, path, ExtraArgs={ 'ContentType': content_type })
+    extra = { 'ContentType': content_type } if content_type else {}
+    get_client().upload_fileobj(file, bucket, path, ExtraArgs=extra)
+
+
+def upload_parts(bucket, path, parts, content_type=None):
+    ''' Multipart upload of an iterable of byte blocks, every block but the last must have at least 5 MB.
+        A single block is uploaded with a simple put. Returns the number of bytes uploaded.
+    '''
+    client = get_client()
+    extra = { 'ContentType': content_type } if content_type else {}
+    parts = iter(parts)
+    data = next(parts, b'')
+    following = next(parts, None)
+    if(following is None):
+        client.put_object(Bucket=bucket, Key=path, Body=data, **extra)
+        return len(data)
+
+    upload = client.create_multipart_upload(Bucket=bucket, Key=path, **extra)
+    uploaded, size = [], 0
+    try:
+        for number, data in enumerate(chain([data, following], parts), start=1):
+            response = client.upload_part(Bucket=bucket, Key=path, UploadId=upload['UploadId'], PartNumber=number, Body=data)
+            uploaded.append({ 'PartNumber': number, 'ETag': response['ETag'] })
+            size += len(data)
+        client.complete_multipart_upload(Bucket=bucket, Key=path, UploadId=upload['UploadId'], MultipartUpload={ 'Parts': uploaded })
+    except Exception:
+        client.abort_multipart_upload(Bucket=bucket, Key=path, UploadId=upload['UploadId'])
+        raise
+    return size
 
 
 def upload_excel(bucket, path, file):
@@ -1,11 +1,12 @@
-import boto3
 import json
+import time
 import base64
+import threading
+from src.lib.adapters import aws_clients
 
 def get_secret(secret_name, region_name='us-east-1'):
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
+    # Secrets Manager client, shared between calls
+    client = aws_clients.get_client('secretsmanager', region_name=region_name)
 
     secret_response = client.get_secret_value(SecretId=secret_name)
 
@@ -16,4 +17,56 @@ def get_secret(secret_name, region_name='us-east-1'):
         return secret
     else:
         decoded_binary_secret = base64.b64decode(secret_response['SecretBinary'])
-        return decoded_binary_secret
\ No newline at end of file
+        return decoded_binary_secret
+
+class SecretCache():
+    ''' Keeps a secret in memory for ttl seconds. After that the cached value is still
+        returned while a background thread fetches the new one (stale while revalidate),
+        up to max_stale seconds, when reads wait for the fetch. refresh() forces a fetch,
+        at most once every min_refresh_interval seconds.
+    '''
+    def __init__(self, secret_name, ttl=300, max_stale=3600, min_refresh_interval=10, region_name='us-east-1'):
+        self.secret_name = secret_name
+        self.region_name = region_name
+        self.ttl = ttl                                  # Seconds the secret is used without checking for changes
+        self.max_stale = max_stale                      # Seconds an expired secret can still be returned
+        self.min_refresh_interval = min_refresh_interval  # Min seconds between forced refreshes
+        self.value = None
+        self.fetched_at = 0                             # time.monotonic() of the last fetch
+        self.lock = threading.Lock()
+        self.refreshing = False                         # A background refresh is running
+
+    def get(self):
+        age = time.monotonic() - self.fetched_at
+        if(self.value is None or age > self.max_stale):
+            return self.fetch()
+        if(age > self.ttl):
+            self.refresh_in_background()
+        return self.value
+
+    def fetch(self):
+        with self.lock:
+            self.value = get_secret(self.secret_name, self.region_name)
+            self.fetched_at = time.monotonic()
+            return self.value
+
+    def refresh(self):
+        ''' Fetch the secret now, unless it was fetched less than min_refresh_interval seconds ago. '''
+        if(self.value is not None and time.monotonic() - self.fetched_at < self.min_refresh_interval):
+            return self.value
+        return self.fetch()
+
+    def refresh_in_background(self):
+        with self.lock:
+            if(self.refreshing):
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.fetch()
+            except Exception as e:
+                print(f'Error while refreshing secret {self.secret_name}: {e}')   # Keep the cached value
+            finally:
+                self.refreshing = False
+        threading.Thread(target=run, daemon=True).start()
\ No newline at end of file
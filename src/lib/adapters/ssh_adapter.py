@@ -1,15 +1,19 @@
 import io
-import paramiko
+import time
+import threading
+from contextlib import contextmanager
 
 class SSHClient():
-    def __init__(self, host, username, password, port):
+    def __init__(self, host, username, password, port, keepalive=30):
         self.host = host
         self.username = username
         self.password = password
         self.port = port
+        self.keepalive = keepalive
         self.sftp = None
-        
+
     def connect(self):
+        import paramiko                         # Loaded with the first connection, it is slow to import
         self.ssh = paramiko.SSHClient()
         self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
@@ -18,18 +22,31 @@ class SSHClient():
             if('timed out' in str(e).lower()):
                 raise Exception(f'{self.host} connection timeout.')
             raise Exception(f'{self.host} SSH connection error: {e}')
+        if(self.keepalive):
+            self.ssh.get_transport().set_keepalive(self.keepalive)
         return self
 
     def disconnect(self):
         self.ssh.close()
         if(self.sftp):
             self.sftp.close()
-    
+
+    def is_alive(self):
+        ''' Check if the connection can still be used. '''
+        transport = self.ssh.get_transport()
+        if(transport is None or not transport.is_active()):
+            return False
+        try:
+            transport.send_ignore()
+            return True
+        except Exception:
+            return False
+
     def upload(self, local_path, remote_path):
         if(not self.sftp):
             self.sftp = self.ssh.open_sftp()
         self.sftp.put(local_path, remote_path)
-    
+
     def download(self, remote_path):
         if(not self.sftp):
             self.sftp = self.ssh.open_sftp()
@@ -37,9 +54,138 @@ class SSHClient():
         self.sftp.getfo(remote_path, buffer)
         buffer.seek(0)
         return buffer
-    
-    def cmd(self, command, wait_response=True):
+
+    def read(self, remote_path, offset=0, limit=None):
+        ''' Read up to limit bytes of the remote file starting at offset. Returns the bytes and the file size. '''
+        if(not self.sftp):
+            self.sftp = self.ssh.open_sftp()
+        with self.sftp.open(remote_path, 'rb') as file:
+            size = file.stat().st_size
+            if(offset >= size):
+                return b'', size
+            file.seek(offset)
+            length = size - offset if limit is None else min(limit, size - offset)
+            return file.read(length), size
+
+    def stream(self, remote_path, chunk_size=8 * 1024 * 1024):
+        ''' Yield the remote file in blocks of chunk_size bytes. The reads of each
+            block are sent at once and pipelined by readv, and only one block
+            is kept in memory at a time, whatever the file size.
+        '''
+        if(not self.sftp):
+            self.sftp = self.ssh.open_sftp()
+        with self.sftp.open(remote_path, 'rb') as file:
+            size = file.stat().st_size
+            request_size = file.MAX_REQUEST_SIZE
+            for offset in range(0, size, chunk_size):
+                end = min(offset + chunk_size, size)
+                requests = [(n, min(request_size, end - n)) for n in range(offset, end, request_size)]
+                yield b''.join(file.readv(requests))
+
+    def cmd(self, command, wait_response=True, input=None):
+        ''' Run a command. input (bytes) is sent to its stdin, e.g. to pipe an archive to tar. '''
         stdin, stdout, stderr = self.ssh.exec_command(command)
+        if(input is not None):
+            stdin.write(input)
+            stdin.channel.shutdown_write()
         if(wait_response):
             return stdout.read().decode('utf-8'), stderr.read().decode('utf-8')
-        return True
\ No newline at end of file
+        return True
+
+
+class SSHConnectionPool():
+    ''' Keeps SSH connections open between requests, so warm containers do not
+        pay the TCP connect, key exchange and authentication on every call.
+
+        Connections are reused per (host, username, port, password), checked
+        before being handed out, evicted after idle_timeout seconds without use
+        and limited to max_sessions per host (callers wait for a free one).
+    '''
+    def __init__(self, max_sessions=4, idle_timeout=300, keepalive=30, wait_timeout=30):
+        self.max_sessions = max_sessions                # Max connections open per host
+        self.idle_timeout = idle_timeout                # Seconds an unused connection is kept open
+        self.keepalive = keepalive                      # Seconds between keepalive packets
+        self.wait_timeout = wait_timeout                # Seconds to wait for a free connection
+        self.condition = threading.Condition()
+        self.idle = {}                                  # Key -> list of (client, last used time)
+        self.open = {}                                  # Key -> number of open connections
+
+    def key(self, host, username, password, port):
+        return (host, username, port, password)
+
+    def acquire(self, host, username, password, port):
+        ''' Take an idle healthy connection of the host or open a new one. '''
+        key = self.key(host, username, password, port)
+        deadline = time.time() + self.wait_timeout
+        with self.condition:
+            self.evict_idle()
+            while(True):
+                while(self.idle.get(key)):
+                    client, last_used = self.idle[key].pop()
+                    if(client.is_alive()):
+                        return client
+                    self.close(key, client)
+                if(self.open.get(key, 0) < self.max_sessions):
+                    self.open[key] = self.open.get(key, 0) + 1
+                    break
+                remaining = deadline - time.time()
+                if(remaining <= 0):
+                    raise Exception(f'{host} has no free SSH connection.')
+                self.condition.wait(remaining)
+
+        try:
+            return SSHClient(host, username, password, port, keepalive=self.keepalive).connect()
+        except Exception:
+            with self.condition:
+                self.open[key] -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, client, discard=False):
+        ''' Give the connection back to the pool, closing it if it is broken. '''
+        key = self.key(client.host, client.username, client.password, client.port)
+        with self.condition:
+            if(discard or not client.is_alive()):
+                self.close(key, client)
+            else:
+                self.idle.setdefault(key, []).append((client, time.time()))
+            self.condition.notify()
+
+    def close(self, key, client):
+        self.open[key] -= 1
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+
+    def evict_idle(self):
+        ''' Close connections unused for longer than idle_timeout. '''
+        now = time.time()
+        with self.condition:
+            for key, clients in self.idle.items():
+                expired = [c for c in clients if now - c[1] > self.idle_timeout]
+                for client, last_used in expired:
+                    clients.remove((client, last_used))
+                    self.close(key, client)
+
+    def close_all(self):
+        with self.condition:
+            for key, clients in self.idle.items():
+                for client, last_used in clients:
+                    self.close(key, client)
+            self.idle = {}
+
+    @contextmanager
+    def connection(self, host, username, password, port):
+        ''' Borrow a connection, it goes back to the pool when the block ends. '''
+        client = self.acquire(host, username, password, port)
+        try:
+            yield client
+        except Exception:
+            self.release(client, discard=not client.is_alive())
+            raise
+        else:
+            self.release(client)
+
+
+pool = SSHConnectionPool()
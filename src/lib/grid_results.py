@@ -0,0 +1,179 @@
+import os
+import ast
+import json
+import struct
+import shutil
+import tarfile
+
+NPY_MAGIC = b'\x93NUMPY'
+CHUNK_SIZE = 1024 * 1024
+
+def read_npy_header(f):
+    ''' Read the header of a .npy file, leaving the file at the start of the data. '''
+    if(f.read(6) != NPY_MAGIC):
+        raise Exception('Invalid .npy file.')
+    major, minor = f.read(2)
+    size_format = '<H' if major == 1 else '<I'
+    header_size = struct.unpack(size_format, f.read(struct.calcsize(size_format)))[0]
+    return ast.literal_eval(f.read(header_size).decode('latin1'))
+
+def write_npy_header(f, descr, shape):
+    ''' Write a version 1.0 .npy header, padded so the data is 64 bytes aligned. '''
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': tuple(shape)})
+    padding = 64 - (len(NPY_MAGIC) + 2 + 2 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    f.write(NPY_MAGIC + bytes([1, 0]) + struct.pack('<H', len(header)) + header)
+
+def copy_bytes(source, target, size):
+    while(size > 0):
+        data = source.read(min(size, CHUNK_SIZE))
+        if(not data):
+            raise Exception('Unexpected end of .npy file.')
+        target.write(data)
+        size -= len(data)
+
+def concatenate_npy(paths, output):
+    ''' Concatenate C-ordered .npy arrays along their second to last axis (grid rows),
+        streaming the data so the arrays are never loaded in memory.
+    '''
+    files = [open(path, 'rb') for path in paths]
+    try:
+        headers = [read_npy_header(f) for f in files]
+        shapes = [header['shape'] for header in headers]
+        descr = headers[0]['descr']
+        itemsize = int(descr[2:])
+        outer = 1
+        for size in shapes[0][:-2]:
+            outer *= size
+        columns = shapes[0][-1]
+        shape = shapes[0][:-2] + (sum(shape[-2] for shape in shapes), columns)
+
+        with open(output, 'wb') as out:
+            write_npy_header(out, descr, shape)
+            for _ in range(outer):
+                for f, part_shape in zip(files, shapes):
+                    copy_bytes(f, out, part_shape[-2] * columns * itemsize)
+    finally:
+        for f in files:
+            f.close()
+
+def concatenate_csv(paths, output):
+    ''' Concatenate CSV files with the same columns, keeping only the first header. '''
+    with open(output, 'wb') as out:
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                header = f.readline()
+                if(i == 0):
+                    out.write(header)
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+
+def merge_distributions(distributions, counts):
+    ''' Total, mean and max of shard distributions over the given number of cells each. Percentiles
+        can not be merged without the values, they are kept in the profile of each shard.
+    '''
+    parts = [(d, n) for d, n in zip(distributions, counts) if d]
+    if(not parts):
+        return {}
+    cells = sum(n for _, n in parts)
+    return {
+        'mean': sum(d['mean'] * n for d, n in parts) / cells if cells else 0,
+        'max': max(d['max'] for d, _ in parts),
+        'total': sum(d['total'] for d, _ in parts),
+    }
+
+def merge_profiles(profiles):
+    ''' Merge the profile section of results.json of grid shards. Utilisation and workers are
+        per host, so they are only in the profile of each shard (under shards).
+    '''
+    profiles = [profile for profile in profiles if profile]
+    if(not profiles):
+        return {}
+    counts = [profile['cells'] for profile in profiles]
+    result = {
+        'cells': sum(counts),
+        'cell_time': merge_distributions([p.get('cell_time') for p in profiles], counts),
+        'steps': merge_distributions([p.get('steps') for p in profiles], counts),
+        'phases': {
+            phase: merge_distributions([p.get('phases', {}).get(phase) for p in profiles], counts)
+            for phase in ('setup', 'integrate', 'orbit')
+        },
+        'peak_rss': max(p['peak_rss'] for p in profiles),
+    }
+    integrate_time = result['phases']['integrate'].get('total', 0)
+    if(integrate_time > 0):
+        result['steps_per_second'] = result['steps'].get('total', 0) / integrate_time
+    result['shards'] = profiles
+    return result
+
+def merge_summaries(summaries):
+    ''' Merge results.json of grid shards. '''
+    result = {
+        'start_time': min(s['start_time'] for s in summaries),
+        'end_time': max(s['end_time'] for s in summaries),
+        'duration_time': max(s['duration_time'] for s in summaries),
+        'status': 'finished',
+        'num_simulations': sum(s.get('num_simulations', 0) for s in summaries),
+        'num_shards': len(summaries),
+    }
+    stop_reasons = {}
+    for summary in summaries:
+        for reason, count in summary.get('stop_reasons', {}).items():
+            stop_reasons[reason] = stop_reasons.get(reason, 0) + count
+    result['stop_reasons'] = stop_reasons
+
+    durations = [s['cell_durations'] for s in summaries if s.get('cell_durations')]
+    if(durations):
+        total = sum(d['total'] for d in durations)
+        cells = sum(d['total'] / d['mean'] for d in durations if d['mean'])
+        result['cell_durations'] = {
+            'total': total,
+            'mean': total / cells if cells else 0,
+            'max': max(d['max'] for d in durations),
+        }
+
+    if(any('profile' in s for s in summaries)):
+        result['profile'] = merge_profiles([s.get('profile') for s in summaries])
+    return result
+
+def merge_grid_shards(shard_folders, output_folder):
+    ''' Merge the results folders of grid shards, ordered by their rows, into one results folder. '''
+    os.makedirs(output_folder, exist_ok=True)
+    grids = []
+    for folder in shard_folders:
+        with open(os.path.join(folder, 'grid.json')) as f:
+            grids.append(json.load(f))
+
+    for name in grids[0]['quantities']:
+        concatenate_npy([os.path.join(folder, f'{name}.npy') for folder in shard_folders], os.path.join(output_folder, f'{name}.npy'))
+
+    # Profiled grids have profile.npy, one array per profiling field
+    if(all(os.path.exists(os.path.join(folder, 'profile.npy')) for folder in shard_folders)):
+        concatenate_npy([os.path.join(folder, 'profile.npy') for folder in shard_folders], os.path.join(output_folder, 'profile.npy'))
+
+    csv_files = sorted(name for name in os.listdir(shard_folders[0]) if name.endswith('.csv'))
+    for name in csv_files:
+        concatenate_csv([os.path.join(folder, name) for folder in shard_folders], os.path.join(output_folder, name))
+
+    grid = {
+        **grids[0],
+        'shape': [sum(g['shape'][0] for g in grids), grids[0]['shape'][1]],
+        'y_range': [grids[0]['y_range'][0], grids[-1]['y_range'][1]],
+    }
+    grid.pop('rows', None)
+    with open(os.path.join(output_folder, 'grid.json'), 'w') as f:
+        json.dump(grid, f, indent=4)
+
+    summaries = []
+    for folder in shard_folders:
+        with open(os.path.join(folder, 'results.json')) as f:
+            summaries.append(json.load(f))
+    with open(os.path.join(output_folder, 'results.json'), 'w') as f:
+        json.dump(merge_summaries(summaries), f, indent=4)
+
+def extract_results(archive_path, folder):
+    ''' Extract the results folder of a simulation archive. '''
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        members = [m for m in tar.getmembers() if m.isfile() and os.path.normpath(m.name).startswith('results' + os.sep)]
+        for member in members:
+            member.name = os.path.basename(member.name)
+            tar.extract(member, folder)
@@ -1,13 +1,34 @@
+import sys
+import importlib.util
 from src.lib.adapters import secrets_adapter
-from src.constants import APP_SECRET_ARN
+from src.constants import APP_SECRET_ARN, SECRETS_TTL
 
-app_secrets = None
+# Hosts added to the secret are seen after SECRETS_TTL seconds, or at once when they are used
+app_secrets = secrets_adapter.SecretCache(APP_SECRET_ARN, ttl=SECRETS_TTL)
 
 def get_app_secrets():
-    global app_secrets
-    if(app_secrets is None):
-        app_secrets = secrets_adapter.get_secret(APP_SECRET_ARN)
-    return app_secrets
+    return app_secrets.get()
+
+def lazy_import(name):
+    ''' Module that is only loaded when one of its attributes is used, to keep cold starts short. '''
+    if(name in sys.modules):
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
 
 def get_ssh_keys():
-    return get_app_secrets()['ssh_keys']
\ No newline at end of file
+    return get_app_secrets()['ssh_keys']
+
+def get_host_credentials(host):
+    ''' SSH credentials of the host. Unknown hosts refresh the secret first, they may have just been added. '''
+    ssh_keys = get_ssh_keys()
+    if(host not in ssh_keys):
+        ssh_keys = app_secrets.refresh()['ssh_keys']
+    if(host not in ssh_keys):
+        raise Exception(f'Credentials not found for host {host}.')
+    return ssh_keys[host]
\ No newline at end of file
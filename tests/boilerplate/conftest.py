@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# Simulations run from the boilerplate folder, where problem is a top level package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src', 'boilerplate'))
+
+@pytest.fixture
+def simulation_folder(tmp_path, monkeypatch):
+    ''' Run from an empty simulation folder, results are written to results/. '''
+    (tmp_path / 'results').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
\ No newline at end of file
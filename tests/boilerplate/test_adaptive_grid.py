@@ -0,0 +1,96 @@
+import json
+import numpy as np
+from problem import AdaptiveGridSimulation
+from problem.checkpoint import Checkpoint
+from problem.writer import ORBIT_FIELDS
+
+EDGE = 2.6                                           # Megno jumps from 2 to 8 at this semi-major axis
+
+class StepSimulation(AdaptiveGridSimulation):
+    ''' Adaptive grid whose megno is a step in a, without integrating. '''
+    def run(self, particle):
+        a = float(particle['a'])
+        orbits = [{field: a for field in ORBIT_FIELDS} for _ in range(2)]
+        return (8.0 if a > EDGE else 2.0), orbits, {'stop_reason': 0, 'stop_time': self.years}
+
+class SerialScheduler():
+    ''' Runs the cells one by one in the test process. '''
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def run(self, cells):
+        for cell in cells:
+            yield self.simulation.run_cell(cell)
+
+def adaptive_simulation(**grid):
+    return StepSimulation({
+        'id': 'test',
+        'simulation_type': 'adaptive_grid',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': 1,
+        'num_logs': 1,
+        'ejection_max_distance': 100,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2}],
+        'grid': {'N': 3, 'max_depth': 2, 'threshold': 0.5, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}, **grid},
+    })
+
+def run_grid(simulation):
+    writer = simulation.create_writer()
+    simulation.run_grid(SerialScheduler(simulation), Checkpoint('results/checkpoint.jsonl', writer, 10))
+    return writer
+
+def test_refine_subdivides_cells_whose_corners_differ():
+    simulation = adaptive_simulation()
+    computed = np.zeros((9, 9), dtype=bool)
+    computed[::4, ::4] = True
+    megno = np.full((9, 9), 2.0)
+    megno[:, 8] = 8.0                                # Only the right column of cells differs
+    points = simulation.refine(megno, computed, 4)
+    assert points
+    assert all(4 <= col <= 8 for row, col in points)
+    assert not any(computed[row, col] for row, col in points)
+
+def test_refine_skips_uniform_grids():
+    computed = np.zeros((9, 9), dtype=bool)
+    computed[::4, ::4] = True
+    assert adaptive_simulation().refine(np.full((9, 9), 2.0), computed, 4) == []
+
+def test_run_grid_refines_around_the_jump(simulation_folder):
+    simulation = adaptive_simulation()
+    writer = run_grid(simulation)
+    assert 9 < simulation.num_integrations < 81
+    a = np.linspace(1.0, 4.0, 9)
+    expected = np.where(a > EDGE, 8.0, 2.0)
+    assert np.array_equal(writer.megno[0], expected)         # Every row is refined next to the jump
+    assert not np.isnan(writer.megno).any()
+
+def test_run_grid_without_jump_only_runs_the_coarse_grid(simulation_folder):
+    simulation = adaptive_simulation(particle={'m': 0.0, 'a': [1.0, 2.0], 'e': [0.0, 0.3]})
+    writer = run_grid(simulation)
+    assert simulation.num_integrations == 9
+    assert np.all(writer.megno == 2.0)
+
+def test_fill_copies_the_nearest_integrated_point(simulation_folder):
+    simulation = adaptive_simulation(max_depth=1)
+    writer = simulation.create_writer()
+    computed = np.zeros((5, 5), dtype=bool)
+    computed[::2, ::2] = True
+    writer.megno[::2, ::2] = np.arange(9.0).reshape(3, 3)
+    simulation.fill(writer, computed)
+    assert writer.megno[0, 1] in (writer.megno[0, 0], writer.megno[0, 2])
+    assert writer.megno[4, 4] == 8.0
+    assert not np.isnan(writer.megno).any()
+
+def test_filled_points_have_no_stop_reason(simulation_folder):
+    simulation = adaptive_simulation()
+    writer = run_grid(simulation)
+    integrated = ~np.isnan(writer.cells['stop_reason'])
+    assert integrated.sum() == simulation.num_integrations
+    assert not np.isnan(writer.orbits['a'][:, ~integrated]).any()  # Orbits are still copied to the filled points
+    simulation.export_results(writer)
+    with open('results/results.json') as f:
+        assert sum(json.load(f)['stop_reasons'].values()) == simulation.num_integrations
+    with open('results/grid.json') as f:
+        assert json.load(f)['rows'] == [0, 9]
\ No newline at end of file
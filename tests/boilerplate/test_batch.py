@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from problem import batch as test_particles
+from problem.types.grid import GridSimulation
+from problem.writer import STOP_REASONS, ORBIT_FIELDS
+
+def grid_simulation(particle_mass=0.0, **grid):
+    return GridSimulation({
+        'id': 'test',
+        'simulation_type': 'grid',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': 50,
+        'num_logs': 1,
+        'ejection_max_distance': 6,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2, 'e': 0.048}],
+        'grid': {'N': 2, 'batch_size': 4, 'batch_samples': 20, 'particle': {'m': particle_mass, 'a': [1.0, 4.0], 'e': [0.0, 0.9]}, **grid},
+    })
+
+def test_only_massless_particles_are_batched():
+    assert grid_simulation().use_batches()
+    assert not grid_simulation(batch_size=1).use_batches()
+    assert not grid_simulation(particle_mass=1e-3).use_batches()
+
+def test_batch_returns_a_result_per_cell():
+    simulation = grid_simulation()
+    results = dict(simulation.run_batch([(0, 1.0, 0.0), (1, 1.5, 0.0), (2, 4.0, 0.9)]))
+    assert sorted(results) == [0, 1, 2]
+    for megno, orbits, info in results.values():
+        assert len(orbits) == 2                     # Jupiter and the cell particle
+        assert set(orbits[1]) == set(ORBIT_FIELDS)
+        assert info['duration'] > 0
+    megno, orbits, info = results[0]
+    assert STOP_REASONS[info['stop_reason']] == 'completed'
+    assert info['stop_time'] == pytest.approx(50)
+    assert orbits[1]['a'] == pytest.approx(1.0, abs=0.05)
+    assert 1.5 < megno < 2.5
+
+def test_batch_stops_cells_separately():
+    results = dict(grid_simulation().run_batch([(0, 1.0, 0.0), (1, 4.0, 0.9)]))  # Apocenter of cell 1 at 7.6
+    assert STOP_REASONS[results[0][2]['stop_reason']] == 'completed'
+    assert STOP_REASONS[results[1][2]['stop_reason']] == 'ejected'
+    assert results[1][2]['stop_time'] < 50
+    assert results[1][0] == 10.0
+
+def planets_simulation(**grid):
+    return GridSimulation({
+        'id': 'test',
+        'simulation_type': 'grid',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': 200,
+        'num_logs': 1,
+        'ejection_max_distance': 100,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2, 'e': 0.048}, {'m': 2.86e-4, 'a': 9.58, 'e': 0.056}],
+        'grid': {'N': 4, 'batch_size': 16, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}, **grid},
+    })
+
+def run_both(simulation):
+    ''' Megno and stop reasons of every cell, with a simulation per cell and with one batch. '''
+    simulation.init_worker()
+    particles = [simulation.cell_params(x, y) for _, x, y in simulation.prepare_params()]
+    cells = [simulation.run(particle) for particle in particles]
+    batch = test_particles.TestParticleBatch(simulation, particles).run()
+    return cells, batch
+
+def test_batch_megno_matches_simulation_per_cell():
+    cells, batch = run_both(planets_simulation())
+    cell_megno = np.array([megno for megno, orbits, info in cells])
+    batch_megno = np.array([megno for megno, orbits, info in batch])
+    assert np.all(np.abs(cell_megno - batch_megno) < 0.05)
+    assert np.all(batch_megno > 1.5)                 # Regular orbits, megno tends to 2
+
+def test_batch_stops_like_simulation_per_cell():
+    cells, batch = run_both(planets_simulation(stages=4, chaos_threshold=2.5))
+    assert [info['stop_reason'] for megno, orbits, info in batch] == [info['stop_reason'] for megno, orbits, info in cells]
+    assert all(info['stop_reason'] == STOP_REASONS.index('completed') for megno, orbits, info in batch)
+
+def test_batch_steps_are_shared_by_its_cells():
+    simulation = grid_simulation(profile=True)
+    results = simulation.run_batch([(0, 1.0, 0.0), (1, 1.5, 0.0)])
+    steps = [info['profile']['steps'] for _, (megno, orbits, info) in results]
+    assert steps[0] == steps[1] == pytest.approx(50 / 0.01 / 2, rel=0.01)  # One integration of 50 years for both cells
+
+def test_short_runs_are_not_sampled_more_often_than_integrated():
+    simulation = grid_simulation(batch_samples=1000)
+    simulation.years = 1                             # 100 steps
+    simulation.init_worker()
+    batch = test_particles.TestParticleBatch(simulation, [simulation.cell_params(1.0, 0.0)])
+    megno, orbits, info = batch.run()[0]
+    assert batch.steps_done < 110                    # A stage per step would make 1000
+    assert STOP_REASONS[info['stop_reason']] == 'completed'
+
+def test_stopped_cells_are_no_longer_integrated(monkeypatch):
+    simulation = grid_simulation()
+    simulation.init_worker()
+    particles = [simulation.cell_params(x, y) for x, y in [(1.0, 0.0), (4.0, 0.9), (4.0, 0.8), (1.5, 0.0)]]  # Cells 1 and 2 are ejected
+    compacted = []
+    compact = test_particles.TestParticleBatch.compact
+    def spy(batch, sim, active):
+        sim = compact(batch, sim, active)
+        compacted.append(sim.N_real)
+        return sim
+    monkeypatch.setattr(test_particles.TestParticleBatch, 'compact', spy)
+    results = test_particles.TestParticleBatch(simulation, particles).run()
+    assert compacted == [4]                          # The star, Jupiter and cells 0 and 3
+    assert [STOP_REASONS[info['stop_reason']] for megno, orbits, info in results] == ['completed', 'ejected', 'ejected', 'completed']
+
+    monkeypatch.setattr(test_particles.TestParticleBatch, 'compact', compact)
+    alone = test_particles.TestParticleBatch(simulation, [particles[0], particles[3]]).run()
+    for (megno, orbits, info), (alone_megno, alone_orbits, alone_info) in zip([results[0], results[3]], alone):
+        assert megno == pytest.approx(alone_megno, rel=1e-6)
+        assert orbits[1]['a'] == pytest.approx(alone_orbits[1]['a'], rel=1e-9)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+from problem.checkpoint import Checkpoint
+from problem.writer import GridResultWriter, ORBIT_FIELDS
+
+def result(index):
+    orbits = [{field: float(index) for field in ORBIT_FIELDS}]
+    return (float(index), orbits, {'stop_reason': 0, 'stop_time': 1.0, 'duration': 0.1})
+
+def writer(folder, resume=False):
+    return GridResultWriter(str(folder), (2, 2), num_particles=1, resume=resume)
+
+def saved_indexes(path):
+    with open(path) as f:
+        return [json.loads(line)['i'] for line in f]
+
+def test_cells_are_saved_in_batches(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    checkpoint = Checkpoint(str(path), writer(tmp_path), batch_size=2)
+    checkpoint.add(3, result(3))
+    assert not path.exists()
+    checkpoint.add(1, result(1))
+    assert saved_indexes(path) == [3, 1]
+    assert checkpoint.done == {1, 3}
+
+def test_resume_skips_saved_cells(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    checkpoint = Checkpoint(str(path), writer(tmp_path), batch_size=1)
+    checkpoint.add(0, result(0))
+    checkpoint.add(2, result(2))
+    resumed = writer(tmp_path, resume=True)
+    assert Checkpoint(str(path), resumed, batch_size=1, resume=True).done == {0, 2}
+    assert resumed.megno[1, 0] == 2.0
+
+def test_without_resume_starts_over(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    Checkpoint(str(path), writer(tmp_path), batch_size=1).add(0, result(0))
+    checkpoint = Checkpoint(str(path), writer(tmp_path), batch_size=1)
+    assert checkpoint.done == set()
+    assert not path.exists()
+
+def test_resume_without_writer_files_starts_over(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    Checkpoint(str(path), writer(tmp_path), batch_size=1).add(0, result(0))
+    other = tmp_path / 'other'
+    other.mkdir()
+    assert Checkpoint(str(path), writer(other, resume=True), batch_size=1, resume=True).done == set()
+
+def test_resume_truncates_a_partial_line(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    Checkpoint(str(path), writer(tmp_path), batch_size=1).add(0, result(0))
+    with open(path, 'a') as f:
+        f.write('{"i": 1')                          # Interrupted while writing
+    checkpoint = Checkpoint(str(path), writer(tmp_path, resume=True), batch_size=1, resume=True)
+    assert checkpoint.done == {0}
+    checkpoint.add(1, result(1))
+    assert saved_indexes(path) == [0, 1]
+
+def test_unsaved_cells_are_not_done(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'), writer(tmp_path), batch_size=10)
+    checkpoint.add(0, result(0))
+    assert checkpoint.done == set()
+    checkpoint.flush()
+    assert checkpoint.done == {0}
\ No newline at end of file
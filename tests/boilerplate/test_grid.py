@@ -0,0 +1,88 @@
+import json
+import pytest
+from problem import GridSimulation
+from problem.types.grid import STOP_REASONS
+from problem.profiler import PROFILE_FIELDS
+
+def grid_simulation(ejection_max_distance=100, **grid):
+    return GridSimulation({
+        'id': 'test',
+        'simulation_type': 'grid',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': 50,
+        'num_logs': 1,
+        'ejection_max_distance': ejection_max_distance,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2, 'e': 0.048}],
+        'grid': {'N': 2, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}, **grid},
+    })
+
+def run(simulation, a, e=0.0):
+    megno, orbits, info = simulation.run(simulation.cell_params(a, e))
+    return megno, STOP_REASONS[info['stop_reason']], info['stop_time']
+
+def test_regular_orbit_completes():
+    megno, reason, stop_time = run(grid_simulation(), 1.0)
+    assert reason == 'completed'
+    assert stop_time == pytest.approx(50)
+    assert 1.5 < megno < 2.5
+
+def test_chaos_threshold_stops_after_a_stage():
+    megno, reason, stop_time = run(grid_simulation(stages=5, chaos_threshold=0.5), 1.0)
+    assert reason == 'chaotic'
+    assert stop_time == pytest.approx(10)           # First of 5 stages of 50 years
+    assert megno > 0.5
+
+def test_chaos_threshold_is_not_checked_after_the_last_stage():
+    megno, reason, stop_time = run(grid_simulation(stages=1, chaos_threshold=0.5), 1.0)
+    assert reason == 'completed'
+
+def test_escape_stops_the_simulation():
+    megno, reason, stop_time = run(grid_simulation(ejection_max_distance=6), 4.0, 0.9)  # Apocenter at 7.6
+    assert reason == 'ejected'
+    assert stop_time < 50
+    assert megno == 10.0
+
+def test_close_encounter_stops_the_simulation():
+    megno, reason, stop_time = run(grid_simulation(encounter_min_distance=0.5), 4.9)
+    assert reason == 'close_encounter'
+    assert stop_time < 50
+    assert megno == 10.0
+
+def test_cells_start_from_a_copy_of_the_fixed_particles():
+    simulation = grid_simulation()
+    first = run(simulation, 1.0)
+    assert simulation.base_sim.N == 2               # The dynamic particle is only added to the copy
+    assert run(simulation, 1.0) == first
+
+def test_shard_runs_its_rows(simulation_folder):
+    simulation = grid_simulation(N=4, rows=[1, 3])
+    params = simulation.prepare_params()
+    assert [index for index, _, _ in params] == list(range(8))
+    assert [y for _, _, y in params] == pytest.approx([0.1] * 4 + [0.2] * 4)
+    assert simulation.create_writer().shape == (2, 4)
+    assert simulation.summary() == {'num_simulations': 8}
+
+def test_profiled_cell(simulation_folder):
+    simulation = grid_simulation(profile=True)
+    writer = simulation.create_writer()
+    index, result = simulation.run_cell((3, 1.0, 0.0))
+    profile = result[2]['profile']
+    assert profile['steps'] == pytest.approx(50 / 0.01, abs=2)
+    assert profile['end'] >= profile['start']
+    assert profile['integrate_time'] > 0
+    writer.write(index, result)
+    assert writer.profile[PROFILE_FIELDS.index('steps'), 1, 1] == profile['steps']
+
+def test_results_count_stop_reasons(simulation_folder):
+    simulation = grid_simulation()
+    writer = simulation.create_writer()
+    for index, reason in enumerate(['completed', 'completed', 'chaotic', 'ejected']):
+        writer.write(index, (2.0, [{field: 0.0 for field in writer.orbits}], {'stop_reason': STOP_REASONS.index(reason), 'stop_time': 1.0, 'duration': 0.1}))
+    simulation.export_results(writer)
+    with open('results/results.json') as f:
+        results = json.load(f)
+    assert results['stop_reasons'] == {'completed': 2, 'chaotic': 1, 'ejected': 1, 'close_encounter': 0, 'error': 0}
+    with open('results/grid.json') as f:
+        assert json.load(f)['stop_reasons'] == STOP_REASONS
\ No newline at end of file
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from problem import profiler
+from problem.profiler import PROFILE_FIELDS
+
+def profile(cells):
+    ''' Profile array of a 1 x len(cells) grid, cells are dicts of PROFILE_FIELDS. '''
+    array = np.full((len(PROFILE_FIELDS), 1, len(cells)), np.nan)
+    for k, cell in enumerate(cells):
+        for i, field in enumerate(PROFILE_FIELDS):
+            array[i, 0, k] = cell.get(field, np.nan)
+    return array
+
+def cell(worker, start, end, steps=100):
+    return {'worker': worker, 'start': start, 'end': end, 'steps': steps, 'setup_time': 0.0, 'integrate_time': end - start, 'orbit_time': 0.0, 'peak_rss': 50.0 + worker}
+
+def test_summary_of_two_workers():
+    cells = [cell(1, 100, 104), cell(1, 104, 110), cell(2, 100, 106), {}]  # Last cell not run yet
+    durations = np.array([[4.0, 6.0, 6.0, np.nan]])
+    summary = profiler.summarise(profile(cells), durations, cores=2, since=100)
+    assert summary['cells'] == 3
+    assert summary['cell_time']['max'] == 6.0
+    assert summary['cell_time']['total'] == 16.0
+    assert summary['steps']['total'] == 300
+    assert summary['steps_per_second'] == pytest.approx(300 / 16)
+    assert summary['peak_rss'] == 52.0
+    assert summary['span'] == 10.0
+    assert summary['utilisation'] == pytest.approx(16 / 20)
+    assert summary['idle_tail'] == 4.0              # Worker 2 had no cells left after 6 s
+    assert [(w['worker'], w['cells'], w['busy_time']) for w in summary['workers']] == [(1, 2, 10.0), (2, 1, 6.0)]
+
+def test_cells_of_a_previous_execution_are_not_in_the_utilisation():
+    cells = [cell(1, 10, 20), cell(2, 100, 102)]
+    summary = profiler.summarise(profile(cells), np.array([[10.0, 2.0]]), cores=1, since=50)
+    assert summary['cells'] == 2
+    assert summary['span'] == 2.0
+    assert [w['worker'] for w in summary['workers']] == [2]
+
+def test_empty_profile():
+    assert profiler.summarise(profile([{}]), np.array([[np.nan]]), cores=1, since=0) == {}
\ No newline at end of file
@@ -0,0 +1,57 @@
+import json
+import pytest
+from problem.progress import ProgressReporter
+
+def result(stop_reason=0, worker=1):
+    return 2.0, [], {'stop_reason': stop_reason, 'worker': worker}
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+@pytest.fixture
+def reporter(tmp_path):
+    return ProgressReporter(str(tmp_path / 'progress.json'), total=10, num_logs=2, interval=60, failure_code=4)
+
+def test_counts_cells_failures_and_workers(reporter):
+    reporter.add(result(worker=1))
+    reporter.add(result(worker=2))
+    reporter.add(result(stop_reason=4, worker=1))
+    progress = reporter.snapshot()
+    assert (progress['done'], progress['total'], progress['failures']) == (3, 10, 1)
+    assert progress['percent'] == 30.0
+    assert {pid: worker['cells'] for pid, worker in progress['workers'].items()} == {'1': 2, '2': 1}
+    assert progress['eta_seconds'] > 0
+
+def test_logs_every_num_logs_th_of_the_cells(reporter, capsys):
+    for _ in range(10):
+        reporter.add(result())
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines] == ['5/10', '10/10']
+
+def test_resumed_cells_do_not_count_in_the_rate(reporter):
+    reporter.reset(10, done=6)
+    progress = reporter.snapshot()
+    assert progress['done'] == 6
+    assert progress['cells_per_second'] == 0.0
+    assert progress['eta_seconds'] is None
+
+def test_file_is_written_on_start_and_stop(reporter):
+    with reporter:
+        assert read(reporter.path)['status'] == 'running'
+        reporter.add(result())
+    progress = read(reporter.path)
+    assert (progress['status'], progress['done']) == ('finished', 1)
+
+def test_failed_run(reporter):
+    with pytest.raises(Exception):
+        with reporter:
+            raise Exception('Worker crashed.')
+    assert read(reporter.path)['status'] == 'failed'
+
+def test_heartbeat_rewrites_the_file(tmp_path):
+    reporter = ProgressReporter(str(tmp_path / 'progress.json'), total=1, num_logs=1, interval=0.01)
+    with reporter:
+        first = read(reporter.path)['updated_at']
+        reporter.stopped.wait(0.1)
+        assert read(reporter.path)['updated_at'] != first
\ No newline at end of file
@@ -0,0 +1,114 @@
+import os
+import time
+import signal
+import pytest
+import threading
+from contextlib import closing
+from problem.scheduler import GridScheduler
+
+class CostSimulation():
+    ''' Grid whose cells cost their x, run_cell returns the worker process. '''
+    def __init__(self, batch_size=1):
+        self.batch_size = batch_size
+
+    def init_worker(self):
+        pass
+
+    def use_batches(self):
+        return self.batch_size > 1
+
+    def estimate_cost(self, x, y):
+        return x
+
+    def run_cell(self, cell):
+        index, x, y = cell
+        return index, os.getpid()
+
+    def run_batch(self, cells):
+        return [(index, len(cells)) for index, x, y in cells]
+
+def cells(n):
+    return [(i, float(i % 5), 0.0) for i in range(n)]
+
+def test_cells_are_sent_slowest_first():
+    scheduler = GridScheduler(CostSimulation(), cores=1, chunksize=1)
+    indexes = [index for index, _ in scheduler.run(cells(10))]
+    costs = [i % 5 for i in indexes]
+    assert sorted(indexes) == list(range(10))
+    assert costs == sorted(costs, reverse=True)
+
+def test_batches_group_cells_of_similar_cost():
+    scheduler = GridScheduler(CostSimulation(batch_size=4), cores=1, chunksize=1)
+    results = list(scheduler.run(cells(10)))
+    indexes = [index for index, _ in results]
+    assert sorted(indexes) == list(range(10))
+    assert [size for _, size in results] == [4] * 8 + [2] * 2
+    assert [i % 5 for i in indexes[:4]] == [4, 4, 3, 3]
+
+def test_cells_run_in_worker_processes():
+    scheduler = GridScheduler(CostSimulation(), cores=2)
+    workers = {worker for _, worker in scheduler.run(cells(20))}
+    assert os.getpid() not in workers
+    assert scheduler.pool is None                    # Closed once every cell finished
+
+class SlowSimulation(CostSimulation):
+    ''' Every cell takes a second, cell 3 fails. '''
+    def run_cell(self, cell):
+        if(cell[0] == 3):
+            raise ValueError('Cell 3 failed.')
+        time.sleep(1)
+        return super().run_cell(cell)
+
+def workers(scheduler):
+    return list(scheduler.pool._pool)
+
+@pytest.fixture
+def ctrl_c():
+    ''' Python handles SIGINT again, REBOUND installs its own handler when a test integrates in this process. '''
+    handler = signal.signal(signal.SIGINT, signal.default_int_handler)
+    yield
+    signal.signal(signal.SIGINT, handler)
+
+def test_ctrl_c_terminates_the_workers(ctrl_c):
+    scheduler = GridScheduler(SlowSimulation(), cores=2, chunksize=1)
+    timer = threading.Timer(1.5, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    start = time.time()
+    with pytest.raises(KeyboardInterrupt):
+        for index, worker in scheduler.run([(i, 1.0, 0.0) for i in range(4, 40)]):
+            processes = workers(scheduler)
+    assert time.time() - start < 10                          # Does not wait for the 36 cells
+    assert scheduler.pool is None
+    assert not any(process.is_alive() for process in processes)
+
+def test_failed_consumer_terminates_the_workers():
+    scheduler = GridScheduler(SlowSimulation(), cores=2, chunksize=1)
+    start = time.time()
+    with pytest.raises(RuntimeError):
+        with closing(scheduler.run([(i, 1.0, 0.0) for i in range(4, 40)])) as results:
+            for index, worker in results:
+                processes = workers(scheduler)
+                raise RuntimeError('Saving the result failed.')
+    assert time.time() - start < 10
+    assert scheduler.pool is None
+    assert not any(process.is_alive() for process in processes)
+
+def test_consumer_that_stops_early_terminates_the_workers():
+    scheduler = GridScheduler(SlowSimulation(), cores=2, chunksize=1)
+    results = scheduler.run([(i, 1.0, 0.0) for i in range(4, 40)])
+    next(results)
+    processes = workers(scheduler)
+    results.close()
+    assert scheduler.pool is None
+    assert not any(process.is_alive() for process in processes)
+
+def test_failed_cell_terminates_the_workers():
+    scheduler = GridScheduler(SlowSimulation(), cores=2, chunksize=1)
+    with pytest.raises(ValueError, match='Cell 3 failed'):
+        list(scheduler.run([(i, 1.0, 0.0) for i in range(40)]))
+    assert scheduler.pool is None
+
+def test_chunksize():
+    assert GridScheduler(CostSimulation(), cores=4, chunksize=7).get_chunksize(1000) == 7
+    assert GridScheduler(CostSimulation(), cores=4).get_chunksize(1000) == 31
+    assert GridScheduler(CostSimulation(), cores=4).get_chunksize(3) == 1
\ No newline at end of file
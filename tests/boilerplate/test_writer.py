@@ -0,0 +1,52 @@
+import json
+import numpy as np
+import pandas as pd
+from problem.writer import GridResultWriter, ORBIT_FIELDS, CELL_FIELDS
+
+def result(megno, value):
+    orbits = [{field: value for field in ORBIT_FIELDS}, {field: -value for field in ORBIT_FIELDS}]
+    return (megno, orbits, {'stop_reason': 1, 'stop_time': value, 'duration': value})
+
+def test_cells_are_written_at_their_position(tmp_path):
+    writer = GridResultWriter(str(tmp_path), (2, 3), num_particles=2)
+    writer.write(4, result(2.0, 5.0))                # Row 1, column 1
+    writer.close()
+    megno = np.load(tmp_path / 'megno.npy', mmap_mode='r')
+    assert megno.shape == (2, 3)
+    assert megno[1, 1] == 2.0
+    assert np.isnan(megno[0, 0])
+    assert np.load(tmp_path / 'stop_time.npy')[1, 1] == 5.0
+    a = np.load(tmp_path / 'a.npy', mmap_mode='r')
+    assert a.shape == (2, 2, 3)
+    assert a[1, 1, 1] == -5.0
+
+def test_resume_reopens_written_cells(tmp_path):
+    writer = GridResultWriter(str(tmp_path), (2, 2), num_particles=2)
+    writer.write(1, result(1.5, 2.0))
+    writer.flush()
+    resumed = GridResultWriter(str(tmp_path), (2, 2), num_particles=2, resume=True)
+    assert resumed.resumed
+    assert resumed.megno[0, 1] == 1.5
+
+def test_export_metadata(tmp_path):
+    writer = GridResultWriter(str(tmp_path), (2, 2), num_particles=1)
+    writer.export_metadata('a', 'e', [1, 4], [0, 0.3], stop_reasons=['completed'])
+    with open(tmp_path / 'grid.json') as f:
+        metadata = json.load(f)
+    assert metadata['shape'] == [2, 2]
+    assert (metadata['x_attr'], metadata['y_attr']) == ('a', 'e')
+    assert metadata['y_range'] == [0.0, 0.3]
+    assert metadata['quantities'] == ['megno'] + CELL_FIELDS + ORBIT_FIELDS
+    assert metadata['stop_reasons'] == ['completed']
+
+def test_export_csv_in_chunks(tmp_path):
+    writer = GridResultWriter(str(tmp_path), (1, 5), num_particles=2)
+    for index in range(5):
+        writer.write(index, result(float(index), float(index)))
+    writer.export_csv(chunk_size=2)
+    megnos = pd.read_csv(tmp_path / 'megnos.csv')
+    assert list(megnos.columns) == ['megno'] + CELL_FIELDS
+    assert list(megnos['megno']) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    orbits = pd.read_csv(tmp_path / 'orbits_p002.csv')
+    assert list(orbits.columns) == ORBIT_FIELDS
+    assert list(orbits['a']) == [0.0, -1.0, -2.0, -3.0, -4.0]
\ No newline at end of file
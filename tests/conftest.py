@@ -0,0 +1,47 @@
+import os
+import sys
+import yaml
+import boto3
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The service reads its configuration when imported, tests run on their own stage without AWS
+os.environ.update({
+    'SERVICE_NAME': 'rebound-ctrl',
+    'STAGE': 'test',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test',
+})
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def root(monkeypatch):
+    ''' Run from the repository root, the boilerplate is bundled from src/boilerplate. '''
+    monkeypatch.chdir(ROOT)
+    return ROOT
+
+@pytest.fixture
+def s3():
+    ''' Mocked s3 with the files bucket of the stage. '''
+    from moto import mock_aws
+    from src.lib.adapters import aws_clients
+    with mock_aws():
+        aws_clients.clients.clear()                 # Clients created outside the mock would reach AWS
+        client = aws_clients.get_client('s3')
+        client.create_bucket(Bucket='rebound-ctrl-test-files')
+        yield client
+    aws_clients.clients.clear()
+
+@pytest.fixture
+def simulations_table(monkeypatch):
+    ''' Mocked simulations table, created with its definition in serverless.yml. '''
+    from moto import mock_aws
+    from src.app.models import SimulationModel
+    with open(os.path.join(ROOT, 'serverless.yml')) as f:
+        properties = yaml.safe_load(f)['resources']['Resources']['SimulationsTable']['Properties']
+    with mock_aws():
+        monkeypatch.delattr(type(SimulationModel.Table), '_table', raising=False)  # Table of the previous mock
+        boto3.client('dynamodb').create_table(**{**properties, 'TableName': SimulationModel.Table.name})
+        yield SimulationModel
\ No newline at end of file
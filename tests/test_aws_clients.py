@@ -0,0 +1,20 @@
+import sys
+import types
+from src.lib import utils
+from src.lib.adapters import aws_clients
+
+def test_clients_are_shared(monkeypatch):
+    monkeypatch.setattr(aws_clients, 'clients', {})
+    s3 = aws_clients.get_client('s3')
+    assert aws_clients.get_client('s3') is s3
+    assert aws_clients.get_client('s3', 'eu-west-1') is not s3
+    assert aws_clients.get_client('s3', 'eu-west-1').meta.region_name == 'eu-west-1'
+
+def test_lazy_import_loads_on_first_use(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'src.lib.grid_results', raising=False)
+    module = utils.lazy_import('src.lib.grid_results')
+    assert sys.modules['src.lib.grid_results'] is module
+    assert type(module) is not types.ModuleType     # Not executed yet
+    assert module.NPY_MAGIC == b'\x93NUMPY'
+    assert type(module) is types.ModuleType
+    assert utils.lazy_import('src.lib.grid_results') is module
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import report
+
+def write_report(path, metrics, benchmark='simulations'):
+    path.write_text(json.dumps({'benchmark': benchmark, 'metrics': metrics}))
+    return str(path)
+
+def compare(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'compare.py'), *args], capture_output=True, text=True)
+
+def test_report(tmp_path):
+    report.write('simulations', {'results': [1, 2]}, {'grid_seconds': 1.5}, output=str(tmp_path / 'report.json'))
+    written = json.loads((tmp_path / 'report.json').read_text())
+    assert written['benchmark'] == 'simulations'
+    assert written['metrics'] == {'grid_seconds': 1.5}
+    assert written['results'] == [1, 2]
+    assert written['environment']['cpus'] == os.cpu_count()
+
+def test_summarise():
+    assert report.summarise([3, 1, 2]) == {'median': 2, 'min': 1, 'max': 3, 'p90': 3}
+
+def test_compare_within_threshold(tmp_path):
+    baseline = write_report(tmp_path / 'baseline.json', {'grid_seconds': 10.0, 'cells_per_second': 100.0})
+    current = write_report(tmp_path / 'current.json', {'grid_seconds': 11.0, 'cells_per_second': 90.0, 'new_seconds': 1.0})
+    result = compare(baseline, current)
+    assert result.returncode == 0
+    assert '(new)' in result.stdout
+
+def test_compare_regressions(tmp_path):
+    baseline = write_report(tmp_path / 'baseline.json', {'grid_seconds': 10.0, 'cells_per_second': 100.0})
+    current = write_report(tmp_path / 'current.json', {'grid_seconds': 9.0, 'cells_per_second': 70.0})
+    result = compare(baseline, current, '--threshold', '0.2')
+    assert result.returncode == 1
+    assert 'cells_per_second' in result.stdout.splitlines()[-1]
+    assert 'grid_seconds' not in result.stdout.splitlines()[-1]  # Faster is not a regression
+
+def test_compare_different_benchmarks(tmp_path):
+    baseline = write_report(tmp_path / 'baseline.json', {}, benchmark='cold_start')
+    current = write_report(tmp_path / 'current.json', {})
+    assert compare(baseline, current).returncode != 0
\ No newline at end of file
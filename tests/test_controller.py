@@ -0,0 +1,99 @@
+import gzip
+import json
+import pytest
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+from src.index import app
+from src.app import service
+from src.lib.adapters import s3_adapter
+
+BUCKET = 'rebound-ctrl-test-files'
+ARCHIVE = bytes(range(256)) * 16
+
+@pytest.fixture
+def client(s3):
+    s3_adapter.upload_file(BUCKET, 'simulations/a/results.tar.gz', BytesIO(ARCHIVE), content_type='application/tar+gzip')
+    return app.test_client()
+
+def test_download_results(client):
+    response = client.get('/simulations/a/results')
+    assert response.status_code == 200
+    assert response.data == ARCHIVE
+    assert response.headers['Content-Length'] == str(len(ARCHIVE))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=results-a.tar.gz'
+
+def test_download_results_range(client):
+    response = client.get('/simulations/a/results', headers={'Range': 'bytes=1000-'})
+    assert response.status_code == 206
+    assert response.data == ARCHIVE[1000:]
+    assert response.headers['Content-Range'] == f'bytes 1000-{len(ARCHIVE) - 1}/{len(ARCHIVE)}'
+
+def test_download_results_range_not_satisfiable(client):
+    response = client.get('/simulations/a/results', headers={'Range': f'bytes={len(ARCHIVE)}-'})
+    assert response.status_code == 416
+
+def test_download_results_redirect(client):
+    response = client.get('/simulations/a/results?redirect=true')
+    assert response.status_code == 302
+    url = urlparse(response.headers['Location'])
+    assert url.path.endswith('/simulations/a/results.tar.gz')
+    assert parse_qs(url.query)['response-content-disposition'] == ['attachment; filename=results-a.tar.gz']
+
+def test_download_missing_results_redirect(client):
+    response = client.get('/simulations/b/results?redirect=true')
+    assert response.status_code == 500
+    assert 'results not found' in response.get_json()['error']
+
+@pytest.fixture
+def result_files(client, tmp_path):
+    (tmp_path / 'results').mkdir()
+    (tmp_path / 'results' / 'results.json').write_text(json.dumps({'status': 'finished'}))
+    (tmp_path / 'results' / 'grid.json').write_text(json.dumps({'shape': [2, 2]}))
+    (tmp_path / 'results' / 'megnos.csv').write_text('megno\n2.0\n')
+    (tmp_path / 'results' / 'checkpoint.jsonl').write_text('{}\n')
+    (tmp_path / 'logs.txt').write_text('logs')
+    service.publish_local_result_files(str(tmp_path), 'a')
+    return client
+
+def test_result_files(result_files):
+    files = result_files.get('/simulations/a/files').get_json()['data']
+    assert files == [
+        {'name': 'results/grid.json', 'size': 17},
+        {'name': 'results/megnos.csv', 'size': 10},
+        {'name': 'results/results.json', 'size': 22},
+    ]
+
+def test_results_summary(result_files):
+    summary = result_files.get('/simulations/a/results/summary').get_json()['data']
+    assert summary['results'] == {'status': 'finished'}
+    assert summary['grid'] == {'shape': [2, 2]}
+    assert len(summary['files']) == 3
+
+def test_download_result_file(result_files):
+    response = result_files.get('/simulations/a/files/results/megnos.csv')
+    assert response.status_code == 200
+    assert response.data == b'megno\n2.0\n'
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=megnos.csv'
+    assert result_files.get('/simulations/a/files/results/megnos.csv', headers={'Range': 'bytes=6-'}).data == b'2.0\n'
+
+def test_download_result_file_outside_the_results(result_files):
+    assert result_files.get('/simulations/a/files/logs.txt').status_code == 500
+    assert result_files.get('/simulations/a/files/results/checkpoint.jsonl').status_code == 500
+    assert result_files.get('/simulations/a/files/results/../results.tar.gz').status_code in (404, 500)
+
+def test_logs_event_stream(monkeypatch):
+    results = [{'logs': 'line 1\n', 'offset': '7', 'status': 'running', 'reset': False}, {'logs': '', 'offset': '7', 'status': 'finished', 'reset': False}]
+    monkeypatch.setattr(service, 'stream_simulation_logs', lambda id, cursor, timeout: iter(results))
+    response = app.test_client().get('/simulations/a/logs', headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    events = response.get_data(as_text=True).split('\n\n')
+    assert events[0] == f'id: 7\nevent: logs\ndata: {json.dumps(results[0])}'
+    assert events[2] == 'event: end\ndata: {}'
+
+def test_logs_tail_is_gzipped(monkeypatch):
+    monkeypatch.setattr(service, 'wait_simulation_logs', lambda id, offset, wait: {'logs': 'line 1\n', 'offset': '7'})
+    response = app.test_client().get('/simulations/a/logs?offset=0', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data))['data'] == {'logs': 'line 1\n', 'offset': '7'}
\ No newline at end of file
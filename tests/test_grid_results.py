@@ -0,0 +1,104 @@
+import json
+import numpy as np
+from src.lib import grid_results
+
+def write_shard(folder, rows, megno, summary):
+    ''' Results folder of a shard with the given rows of a 4 column grid. '''
+    folder.mkdir()
+    np.save(folder / 'megno.npy', megno)
+    np.save(folder / 'a.npy', np.stack([megno, -megno]))  # One array per particle
+    (folder / 'megnos.csv').write_text('megno\n' + ''.join(f'{value}\n' for value in megno.ravel()))
+    grid = {'quantities': ['megno', 'a'], 'shape': list(megno.shape), 'rows': rows, 'y_range': [rows[0] / 10, (rows[1] - 1) / 10]}
+    (folder / 'grid.json').write_text(json.dumps(grid))
+    (folder / 'results.json').write_text(json.dumps(summary))
+    return folder
+
+def summary(start, end, num_simulations, stop_reasons, durations):
+    return {
+        'start_time': start,
+        'end_time': end,
+        'duration_time': end - start,
+        'status': 'finished',
+        'num_simulations': num_simulations,
+        'stop_reasons': stop_reasons,
+        'cell_durations': durations,
+    }
+
+def test_merge_grid_shards(tmp_path):
+    top = np.arange(8, dtype=float).reshape(2, 4)
+    bottom = np.arange(8, 20, dtype=float).reshape(3, 4)
+    shards = [
+        write_shard(tmp_path / 'shard0', [0, 2], top, summary(10, 20, 8, {'completed': 8}, {'total': 8.0, 'mean': 1.0, 'max': 2.0})),
+        write_shard(tmp_path / 'shard1', [2, 5], bottom, summary(12, 30, 12, {'completed': 10, 'chaotic': 2}, {'total': 6.0, 'mean': 0.5, 'max': 3.0})),
+    ]
+    output = tmp_path / 'results'
+    grid_results.merge_grid_shards([str(folder) for folder in shards], str(output))
+
+    megno = np.load(output / 'megno.npy')
+    assert np.array_equal(megno, np.concatenate([top, bottom]))
+    a = np.load(output / 'a.npy')                   # Rows are concatenated inside each particle
+    assert np.array_equal(a, np.stack([megno, -megno]))
+    assert (output / 'megnos.csv').read_text() == 'megno\n' + ''.join(f'{value}\n' for value in megno.ravel())
+
+    grid = json.loads((output / 'grid.json').read_text())
+    assert grid['shape'] == [5, 4]
+    assert grid['y_range'] == [0.0, 0.4]
+    assert 'rows' not in grid
+
+    results = json.loads((output / 'results.json').read_text())
+    assert results['start_time'] == 10
+    assert results['end_time'] == 30
+    assert results['num_simulations'] == 20
+    assert results['num_shards'] == 2
+    assert results['stop_reasons'] == {'completed': 18, 'chaotic': 2}
+    assert results['cell_durations'] == {'total': 14.0, 'mean': 14.0 / 20, 'max': 3.0}
+
+def test_merge_summaries_without_cell_durations():
+    merged = grid_results.merge_summaries([summary(1, 2, 4, {}, None), summary(1, 3, 4, {'completed': 4}, None)])
+    assert merged['duration_time'] == 2
+    assert merged['stop_reasons'] == {'completed': 4}
+    assert 'cell_durations' not in merged
+
+def distribution(mean, max, total):
+    return {'p50': mean, 'p90': max, 'p99': max, 'mean': mean, 'max': max, 'total': total}
+
+def profile(cells, cell_time, steps, integrate_time):
+    return {
+        'cells': cells,
+        'cell_time': cell_time,
+        'steps': steps,
+        'phases': {'setup': distribution(0.1, 0.1, 0.1 * cells), 'integrate': integrate_time, 'orbit': {}},
+        'peak_rss': 100.0 * cells,
+        'steps_per_second': steps['total'] / integrate_time['total'],
+        'utilisation': 0.9,
+        'workers': [{'worker': 1, 'cells': cells}],
+    }
+
+def test_merge_profiled_grid_shards(tmp_path):
+    top, bottom = np.zeros((2, 4)), np.ones((3, 4))
+    profiles = [
+        profile(8, distribution(1.0, 2.0, 8.0), distribution(100, 200, 800), distribution(0.5, 1.5, 4.0)),
+        profile(12, distribution(0.5, 3.0, 6.0), distribution(50, 80, 600), distribution(0.25, 2.5, 3.0)),
+    ]
+    shards = []
+    for i, (rows, megno) in enumerate([([0, 2], top), ([2, 5], bottom)]):
+        folder = write_shard(tmp_path / f'shard{i}', rows, megno, {**summary(10, 20, megno.size, {}, None), 'profile': profiles[i]})
+        np.save(folder / 'profile.npy', np.stack([megno + i, megno * 10]))  # Two profiling fields
+        shards.append(str(folder))
+    output = tmp_path / 'results'
+    grid_results.merge_grid_shards(shards, str(output))
+
+    assert np.array_equal(np.load(output / 'profile.npy'), np.stack([np.concatenate([top, bottom + 1]), np.concatenate([top, bottom]) * 10]))
+    merged = json.loads((output / 'results.json').read_text())['profile']
+    assert merged['cells'] == 20
+    assert merged['cell_time'] == {'mean': (8 * 1.0 + 12 * 0.5) / 20, 'max': 3.0, 'total': 14.0}
+    assert merged['steps'] == {'mean': (8 * 100 + 12 * 50) / 20, 'max': 200, 'total': 1400}
+    assert merged['phases']['orbit'] == {}
+    assert merged['peak_rss'] == 1200.0
+    assert merged['steps_per_second'] == 1400 / 7.0
+    assert merged['shards'] == profiles             # Percentiles, utilisation and workers of each host
+
+def test_merge_summaries_of_shards_without_cells_profiled():
+    merged = grid_results.merge_summaries([{**summary(1, 2, 0, {}, None), 'profile': {}}, summary(1, 2, 0, {}, None)])
+    assert merged['profile'] == {}
+    assert 'profile' not in grid_results.merge_summaries([summary(1, 2, 0, {}, None)])
\ No newline at end of file
@@ -0,0 +1,35 @@
+from src.lib.adapters.queue_adapter import LocalQueue
+
+def failing(job):
+    raise Exception('Job failed.')
+
+def test_local_queue_processes_jobs():
+    processed = []
+    queue = LocalQueue(processed.append, retry_delay=0)
+    queue.send({'type': 'harvest', 'id': 'a'})
+    queue.join()
+    assert processed == [{'type': 'harvest', 'id': 'a'}]
+    assert queue.failed == []
+
+def test_local_queue_retries_then_fails():
+    attempts, failed = [], []
+    def handler(job):
+        attempts.append(job)
+        failing(job)
+    queue = LocalQueue(handler, max_retries=3, retry_delay=0, on_failure=failed.append)
+    queue.send({'type': 'harvest', 'id': 'a'})
+    queue.join()
+    assert len(attempts) == 3
+    assert failed == queue.failed == [{'type': 'harvest', 'id': 'a'}]
+
+def test_local_queue_keeps_working_when_on_failure_raises():
+    processed = []
+    def handler(job):
+        if(job['id'] == 'a'):
+            failing(job)
+        processed.append(job['id'])
+    queue = LocalQueue(handler, max_retries=1, retry_delay=0, on_failure=failing)
+    queue.send({'type': 'harvest', 'id': 'a'})
+    queue.send({'type': 'harvest', 'id': 'b'})
+    queue.join()
+    assert processed == ['b']
\ No newline at end of file
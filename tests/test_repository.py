@@ -0,0 +1,42 @@
+import pytest
+from src.app import repository
+
+@pytest.fixture
+def simulations(simulations_table):
+    repository.save_batch([{'id': id, 'status': status} for id, status in (('a', 'running'), ('b', 'harvesting'), ('c', 'finished'))])
+    return simulations_table
+
+def test_get_batch_keeps_the_order(simulations, monkeypatch):
+    monkeypatch.setattr(repository, 'BATCH_GET_SIZE', 2)
+    assert [s.id for s in repository.get_batch(['c', 'x', 'a', 'b'])] == ['c', 'a', 'b']
+    assert repository.fetch_statuses(['a', 'c']) == {'a': 'running', 'c': 'finished'}
+
+def test_transition(simulations):
+    assert repository.transition('a', 'harvesting')
+    assert repository.fetch_statuses(['a']) == {'a': 'harvesting'}
+
+def test_transition_from_another_status_fails(simulations):
+    assert not repository.transition('a', 'finished')      # Must be harvested first
+    assert not repository.transition('c', 'harvesting')
+    assert not repository.transition('x', 'failed')         # Missing simulations are not created
+    assert repository.fetch_statuses(['a', 'c', 'x']) == {'a': 'running', 'c': 'finished'}
+
+def test_only_one_transition_wins(simulations):
+    assert repository.transition('a', 'harvesting')
+    assert not repository.transition('a', 'harvesting')    # A second check of the same simulation does not harvest it again
+
+def test_invalid_status(simulations):
+    with pytest.raises(Exception, match='Invalid simulation status'):
+        repository.transition('a', 'queued')
+
+def test_transition_batch(simulations):
+    assert repository.transition_batch([]) == set()
+    assert repository.transition_batch([('a', 'harvesting'), ('b', 'finished'), ('c', 'failed')]) == {'a', 'b'}
+    assert repository.fetch_statuses(['a', 'b', 'c']) == {'a': 'harvesting', 'b': 'finished', 'c': 'finished'}
+
+def test_transition_sets_attributes(simulations_table):
+    repository.save({'id': 'q', 'status': 'queued'})
+    assert repository.transition('q', 'starting', host='h1')
+    assert repository.get_batch(['q'])[0].host == 'h1'
+    assert not repository.transition('q', 'starting', host='h2')
+    assert repository.get_batch(['q'])[0].host == 'h1'
\ No newline at end of file
@@ -0,0 +1,26 @@
+from io import BytesIO
+from src.lib.adapters import s3_adapter
+
+BUCKET = 'rebound-ctrl-test-files'
+
+def test_upload_file_without_content_type(s3):
+    s3_adapter.upload_file(BUCKET, 'simulations/a/files/megno.npy', BytesIO(b'data'), content_type=None)
+    assert s3_adapter.download_file(BUCKET, 'simulations/a/files/megno.npy') == b'data'
+
+def test_upload_file_with_content_type(s3):
+    s3_adapter.upload_file(BUCKET, 'simulations/a/files/grid.json', BytesIO(b'{}'), content_type='application/json')
+    assert s3.head_object(Bucket=BUCKET, Key='simulations/a/files/grid.json')['ContentType'] == 'application/json'
+
+def test_upload_parts(s3):
+    parts = [b'a' * 5 * 1024 * 1024, b'b' * 10]
+    assert s3_adapter.upload_parts(BUCKET, 'simulations/a/results.tar.gz', parts) == len(parts[0]) + len(parts[1])
+    assert s3_adapter.download_file(BUCKET, 'simulations/a/results.tar.gz') == b''.join(parts)
+
+def test_upload_parts_without_parts(s3):
+    assert s3_adapter.upload_parts(BUCKET, 'simulations/a/results.tar.gz', iter([])) == 0
+    assert s3_adapter.download_file(BUCKET, 'simulations/a/results.tar.gz') == b''
+
+def test_upload_parts_single_part(s3):
+    assert s3_adapter.upload_parts(BUCKET, 'simulations/a/logs.txt', [b'log'], content_type='text/plain') == 3
+    assert s3_adapter.download_file(BUCKET, 'simulations/a/logs.txt') == b'log'
+    assert s3.head_object(Bucket=BUCKET, Key='simulations/a/logs.txt')['ContentType'] == 'text/plain'
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+import pytest
+import threading
+from types import SimpleNamespace
+from src.lib import utils
+from src.lib.adapters import secrets_adapter
+from src.lib.adapters.secrets_adapter import SecretCache
+
+class Secret():
+    ''' Stand-in for Secrets Manager, counting the fetches. '''
+    def __init__(self, value):
+        self.value = value
+        self.fetches = 0
+        self.fetched = threading.Event()
+        self.fail = False
+        self.released = threading.Event()               # Cleared to hold the fetches until it is set
+        self.released.set()
+
+    def get(self, secret_name, region_name):
+        self.fetches += 1
+        self.fetched.set()
+        self.released.wait(5)
+        if(self.fail):
+            raise Exception('Secrets Manager is down.')
+        return self.value
+
+@pytest.fixture
+def secret(monkeypatch):
+    secret = Secret({'ssh_keys': {'h1': {'username': 'user'}}})
+    monkeypatch.setattr(secrets_adapter, 'get_secret', secret.get)
+    return secret
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(secrets_adapter, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def wait_background_refresh(cache, secret):
+    secret.released.set()
+    assert secret.fetched.wait(5)
+    while(cache.refreshing):
+        time.sleep(0.01)
+
+def test_secret_is_cached_for_ttl(secret, clock):
+    cache = SecretCache('arn', ttl=300)
+    assert cache.get() == secret.value
+    clock[0] += 299
+    cache.get()
+    assert secret.fetches == 1
+
+def test_expired_secret_is_returned_while_revalidating(secret, clock):
+    cache = SecretCache('arn', ttl=300)
+    old = cache.get()
+    secret.value = {'ssh_keys': {}}
+    secret.fetched.clear()
+    secret.released.clear()
+    clock[0] += 301
+    assert cache.get() is old                       # Stale value, the new one is fetched in the background
+    wait_background_refresh(cache, secret)
+    assert cache.get() == {'ssh_keys': {}}
+    assert secret.fetches == 2
+
+def test_failed_refresh_keeps_the_cached_secret(secret, clock):
+    cache = SecretCache('arn', ttl=300)
+    old = cache.get()
+    secret.fail = True
+    secret.fetched.clear()
+    secret.released.clear()
+    clock[0] += 301
+    assert cache.get() is old
+    wait_background_refresh(cache, secret)
+    assert cache.get() is old
+
+def test_too_stale_secret_is_fetched_again(secret, clock):
+    cache = SecretCache('arn', ttl=300, max_stale=3600)
+    cache.get()
+    secret.value = {'ssh_keys': {}}
+    clock[0] += 3601
+    assert cache.get() == {'ssh_keys': {}}
+    assert secret.fetches == 2
+
+def test_refresh_is_rate_limited(secret, clock):
+    cache = SecretCache('arn', min_refresh_interval=10)
+    cache.get()
+    cache.refresh()
+    assert secret.fetches == 1
+    clock[0] += 11
+    cache.refresh()
+    assert secret.fetches == 2
+
+def test_new_hosts_refresh_the_secret(secret, clock, monkeypatch):
+    monkeypatch.setattr(utils, 'app_secrets', SecretCache('arn', ttl=300))
+    assert utils.get_host_credentials('h1') == {'username': 'user'}
+    clock[0] += 11
+    secret.value = {'ssh_keys': {'h1': {'username': 'user'}, 'h2': {'username': 'other'}}}
+    assert utils.get_host_credentials('h2') == {'username': 'other'}
+    with pytest.raises(Exception, match='Credentials not found for host h3'):
+        utils.get_host_credentials('h3')
+    assert secret.fetches == 2                      # h3 was just checked, the secret is not fetched again
\ No newline at end of file
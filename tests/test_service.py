@@ -0,0 +1,452 @@
+import io
+import os
+import json
+import time
+import tarfile
+import pytest
+import subprocess
+import numpy as np
+from decimal import Decimal
+from contextlib import nullcontext
+from types import SimpleNamespace
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from src.app import service
+from src.app import repository
+from src.lib.adapters import s3_adapter
+
+class LocalShell():
+    ''' Runs commands in a local folder, like the SSH client does in the home of the host. '''
+    def __init__(self, folder):
+        self.folder = folder
+
+    def cmd(self, command, input=None):
+        process = subprocess.run(['bash', '-c', command], cwd=self.folder, input=input, capture_output=True)
+        return process.stdout.decode('utf-8'), process.stderr.decode('utf-8')
+
+def simulation_folder(home, id, errors='', results=None):
+    folder = home / 'rebound-ctrl' / 'simulations' / id
+    (folder / 'results').mkdir(parents=True)
+    (folder / 'errors.txt').write_text(errors)
+    if(results is not None):
+        (folder / 'results' / 'results.json').write_text(json.dumps(results, indent=4))
+
+def test_fetch_simulations_state(tmp_path):
+    simulation_folder(tmp_path, 'running')
+    simulation_folder(tmp_path, 'failed', errors='Traceback')
+    simulation_folder(tmp_path, 'finished', results={'status': 'finished', 'num_simulations': 4})
+    states = service.fetch_simulations_state(LocalShell(tmp_path), ['running', 'failed', 'finished', 'missing'])
+    assert states == {
+        'running': {'has_folder': True, 'has_errors': False, 'results': None},
+        'failed': {'has_folder': True, 'has_errors': True, 'results': None},
+        'finished': {'has_folder': True, 'has_errors': False, 'results': {'status': 'finished', 'num_simulations': 4}},
+        'missing': {'has_folder': False, 'has_errors': False, 'results': None},
+    }
+
+def test_resolve_status():
+    simulation = {'id': 'a', 'status': 'running'}
+    state = {'has_folder': True, 'has_errors': False, 'results': None}
+    assert service.resolve_status(simulation, state) == 'running'
+    assert service.resolve_status(simulation, {**state, 'has_errors': True}) == 'failed'
+    assert service.resolve_status(simulation, {**state, 'results': {'status': 'finished'}}) == 'finished'
+    assert service.resolve_status(simulation, {**state, 'results': {'status': 'failed'}}) == 'failed'
+
+@pytest.fixture
+def logs(simulations_table, monkeypatch):
+    ''' Logs of the simulations by id, read by tail_simulation_logs instead of the hosts. '''
+    files = {}
+    def read_log_chunk(id, host, status, offset):
+        data = files[id]
+        return data[offset:offset + service.LOG_CHUNK_SIZE], len(data)
+    monkeypatch.setattr(service, 'read_log_chunk', read_log_chunk)
+    monkeypatch.setattr(service, 'LOG_CHUNK_SIZE', 16)
+    return files
+
+def save(id, host='h1', status='running', **attributes):
+    service.save_simulation({'id': id, 'host': host, 'status': status, 'created_at': '2026-01-01', **attributes})
+
+def test_tail_simulation_logs(logs):
+    save('a')
+    logs['a'] = b'line 1\n'
+    result = service.tail_simulation_logs('a')
+    assert result == {'logs': 'line 1\n', 'offset': '7', 'status': 'running', 'reset': False}
+    logs['a'] += b'line 2\nline 3\nline 4\n'
+    result = service.tail_simulation_logs('a', result['offset'])
+    assert result['logs'] == 'line 2\nline 3\n'    # Only whole lines of the 16 bytes chunk
+    assert result['offset'] == '21'
+    assert service.tail_simulation_logs('a', '21')['logs'] == 'line 4\n'
+
+def test_tail_rewritten_logs_starts_over(logs):
+    save('a')
+    logs['a'] = b'new\n'
+    assert service.tail_simulation_logs('a', '100') == {'logs': 'new\n', 'offset': '4', 'status': 'running', 'reset': True}
+
+def test_tail_sharded_simulation_logs(logs):
+    save('a', host='h1,h2', shards=['a0', 'a1'])
+    save('a0', host='h1', parent_id='a')
+    save('a1', host='h2', parent_id='a')
+    logs['a0'], logs['a1'] = b'one\n', b''
+    result = service.tail_simulation_logs('a')
+    assert result['logs'] == '[h1]\none\n'
+    assert result['offset'] == '4,0'
+    logs['a1'] = b'two\n'
+    assert service.tail_simulation_logs('a', result['offset'])['logs'] == '[h2]\ntwo\n'
+    assert service.tail_simulation_logs('a', '4')['reset']  # Offsets of another number of shards
+
+def test_wait_simulation_logs_returns_when_the_simulation_stops(logs):
+    save('a', status='finished')
+    logs['a'] = b''
+    assert service.wait_simulation_logs('a', '0', wait=10)['status'] == 'finished'
+
+def test_read_harvested_log_chunk(s3):
+    s3_adapter.save_to_s3('rebound-ctrl-test-files', 'simulations/a/logs.txt', b'line 1\nline 2\n')
+    assert service.read_log_chunk('a', 'h1', 'finished', 7) == (b'line 2\n', 14)
+    assert service.read_log_chunk('a', 'h1', 'finished', 14) == (b'', 14)
+
+@pytest.mark.parametrize('status', ['queued', 'starting'])
+def test_read_log_chunk_before_start(status):
+    assert service.read_log_chunk('a', 'host', status, 0) == (b'', 0)
+
+@pytest.mark.parametrize('job, failed', [
+    ({'type': 'harvest', 'id': 'a'}, ['a']),
+    ({'type': 'merge', 'id': 'a'}, ['a']),
+    ({'type': 'dispatch'}, []),
+])
+def test_fail_job(monkeypatch, job, failed):
+    transitions = []
+    monkeypatch.setattr(service, 'repository', SimpleNamespace(transition=lambda id, status: transitions.append((id, status))))
+    service.fail_job(job)
+    assert transitions == [(id, 'failed') for id in failed]
+
+def test_read_log_chunk_of_simulation_that_failed_to_start(s3):
+    assert service.read_log_chunk('a', 'host', 'failed', 0) == (b'', 0)
+    with pytest.raises(Exception):
+        service.read_log_chunk('a', 'host', 'finished', 0)  # Finished simulations must have their logs
+
+def default_simulation(**attributes):
+    return {
+        'id': 'a',
+        'name': 'Jupiter "test"',
+        'simulation_type': 'default',
+        'cores': 1,
+        'integrator': 'whfast',
+        'timestep': 0.01,
+        'years': 1,
+        'num_logs': 1,
+        'ejection_max_distance': 100,
+        'particles': [{'m': 1.0}, {'m': 9.55e-4, 'a': 5.2, 'e': 0.048}],
+        **attributes,
+    }
+
+def test_build_bundle(root):
+    with tarfile.open(fileobj=io.BytesIO(service.build_bundle(default_simulation())), mode='r:gz') as tar:
+        names = tar.getnames()
+        assert json.loads(tar.extractfile('meta.json').read()) == default_simulation()
+        assert tar.getmember('run.sh').mode == 0o755
+    assert set(service.BOILERPLATE_FILES) <= set(names)
+
+def database_item(simulation):
+    ''' Simulation as read back from DynamoDB, every number is a decimal. '''
+    serialized = TypeSerializer().serialize(service.to_item(simulation))
+    return TypeDeserializer().deserialize(serialized)
+
+def test_from_item_converts_decimals():
+    item = database_item(default_simulation())
+    assert isinstance(item['years'], Decimal)
+    simulation = service.from_item(item)
+    assert simulation['years'] == 1 and isinstance(simulation['years'], int)
+    assert simulation['timestep'] == 0.01 and isinstance(simulation['timestep'], float)
+    assert simulation['particles'][1]['a'] == 5.2
+
+def test_build_bundle_writes_numbers(root):
+    simulation = service.from_item(database_item(default_simulation()))
+    with tarfile.open(fileobj=io.BytesIO(service.build_bundle(simulation)), mode='r:gz') as tar:
+        meta = json.loads(tar.extractfile('meta.json').read())
+    assert (meta['years'], meta['timestep'], meta['particles'][1]['a']) == (1, 0.01, 5.2)
+
+def test_build_bundle_rejects_decimals(root):
+    with pytest.raises(TypeError):
+        service.build_bundle({'id': 'a', 'years': Decimal('20')})
+
+def test_deploy_simulation(root, tmp_path):
+    process_id = service.deploy_simulation(LocalShell(tmp_path), default_simulation())
+    folder = tmp_path / 'rebound-ctrl' / 'simulations' / 'a'
+    assert (folder / 'pid.txt').read_text().strip() == str(process_id)
+    assert json.loads((folder / 'meta.json').read_text())['name'] == 'Jupiter "test"'
+    assert (folder / 'logs.txt').read_text()
+    for _ in range(300):                            # Let the simulation finish before the folder is removed
+        if(not os.path.exists(f'/proc/{process_id}')):
+            break
+        time.sleep(0.1)
+
+def test_deploy_simulation_that_exits_on_start(root, tmp_path, monkeypatch):
+    monkeypatch.setattr(service, 'BOILERPLATE_FILES', ['README.md'])  # problem.py is missing
+    with pytest.raises(Exception, match='Simulation exited on start'):
+        service.deploy_simulation(LocalShell(tmp_path), default_simulation())
+
+def capacity(cores, free_cores, free_memory_mb=4096):
+    return {'cores': cores, 'free_cores': free_cores, 'free_memory_mb': free_memory_mb}
+
+def test_fetch_host_capacity(tmp_path):
+    capacity = service.fetch_host_capacity(LocalShell(tmp_path))
+    assert capacity['cores'] == os.cpu_count()
+    assert 0 <= capacity['free_cores'] <= capacity['cores']
+    assert capacity['free_memory_mb'] > 0
+    assert capacity['jobs'] == 0
+
+@pytest.mark.parametrize('host_capacity, cores, fits', [
+    (capacity(8, 7.8), 8, True),                    # Light load on an idle host
+    (capacity(1, 0.66), 1, True),
+    (capacity(1, 0.4), 1, False),                   # The only core is mostly used
+    (capacity(8, 3.0), 4, False),
+    (capacity(8, 8.0, free_memory_mb=100), 1, False),
+])
+def test_fits(host_capacity, cores, fits):
+    assert service.fits(host_capacity, cores) == fits
+
+def test_pick_host_with_most_free_cores():
+    capacities = {'h1': capacity(8, 3.0), 'h2': capacity(16, 10.0), 'h3': capacity(32, 0.5)}
+    assert service.pick_host(capacities, 2) == 'h2'
+    assert service.pick_host(capacities, 12) is None
+
+@pytest.fixture
+def hosts(monkeypatch):
+    ''' Hosts h1 and h2 with the given capacities, probes are counted. '''
+    capacities = {'h1': capacity(8, 0.0), 'h2': capacity(8, 0.0)}
+    probes = []
+    class Connection():
+        def __init__(self, host):
+            self.host = host
+        def __enter__(self):
+            probes.append(self.host)
+            return self
+        def __exit__(self, *exception):
+            return False
+    monkeypatch.setattr(service, 'host_capacity', {})
+    monkeypatch.setattr(service, 'fetch_hosts', lambda: list(capacities))
+    monkeypatch.setattr(service, 'connect', Connection)
+    monkeypatch.setattr(service, 'fetch_host_capacity', lambda ssh: dict(capacities[ssh.host]))
+    monkeypatch.setattr(service, 'deploy_simulation', lambda ssh, simulation: 1234)
+    return capacities, probes
+
+def test_host_capacity_is_probed_once_a_minute(hosts, monkeypatch):
+    capacities, probes = hosts
+    now = [1000.0]
+    monkeypatch.setattr(service.time, 'time', lambda: now[0])
+    service.fetch_hosts_capacity(['h1', 'h2'])
+    service.fetch_hosts_capacity(['h1'])
+    assert probes == ['h1', 'h2']
+    now[0] += 61
+    assert service.fetch_hosts_capacity(['h1'])['h1']['checked_at'] == now[0]
+    assert probes == ['h1', 'h2', 'h1']
+
+def test_busy_hosts_queue_simulations(simulations_table, hosts):
+    simulation = service.create_simulation(default_simulation(cores=2))
+    assert simulation['status'] == 'queued'
+    assert service.dispatch_queued_simulations() == []
+
+def test_dispatch_starts_queued_simulations_on_free_hosts(simulations_table, hosts):
+    capacities, probes = hosts
+    first = service.create_simulation(default_simulation(cores=2))
+    pinned = service.create_simulation(default_simulation(cores=2, host='h1'))
+    capacities['h2'] = capacity(8, 3.0)
+    service.host_capacity.clear()
+    assert service.dispatch_queued_simulations() == [first['id']]  # The pinned one waits for h1, h2 has no cores left
+    started = repository.get_batch([first['id']])[0]
+    assert (started.status, started.host, started.process_id) == ('running', 'h2', '1234')
+    assert repository.get_batch([pinned['id']])[0].status == 'queued'
+
+def test_fetch_progress(tmp_path):
+    simulation_folder(tmp_path, 'running')
+    (tmp_path / 'rebound-ctrl' / 'simulations' / 'running' / 'results' / 'progress.json').write_text(json.dumps({'status': 'running', 'done': 3}, indent=4))
+    simulation_folder(tmp_path, 'starting')
+    progress = service.fetch_progress(LocalShell(tmp_path), ['running', 'starting', 'missing'])
+    assert list(progress) == ['running']
+    assert progress['running']['done'] == 3
+    assert 0 <= progress['running']['age_seconds'] < 60
+
+def shard_progress(status, done, total, eta, age=1, stalled=False):
+    return {'status': status, 'done': done, 'total': total, 'failures': 1, 'cells_per_second': 2.0, 'eta_seconds': eta, 'age_seconds': age, 'stalled': stalled}
+
+def test_combine_progress():
+    progress = service.combine_progress([shard_progress('running', 10, 40, 15.0), shard_progress('running', 30, 60, 30.0, age=5), None])
+    assert progress['status'] == 'running'
+    assert (progress['done'], progress['total'], progress['percent']) == (40, 100, 40.0)
+    assert (progress['failures'], progress['cells_per_second'], progress['eta_seconds']) == (2, 4.0, 30.0)
+    assert (progress['age_seconds'], progress['stalled'], progress['shards']) == (5, False, 2)
+    assert service.combine_progress([shard_progress('finished', 40, 40, 0.0), shard_progress('running', 1, 60, None, stalled=True)])['eta_seconds'] is None
+    assert service.combine_progress([shard_progress('finished', 40, 40, 0.0), shard_progress('failed', 1, 60, 0.0)])['status'] == 'failed'
+    assert service.combine_progress([None]) is None
+
+def test_fetch_simulations_progress(simulations_table, monkeypatch):
+    save('a', host='h1')
+    save('b', host='h1', status='finished')
+    save('c', host='h1,h2', shards=['c0', 'c1'])
+    save('c0', host='h1', parent_id='c')
+    save('c1', host='h2', parent_id='c')
+    progress = {'a': shard_progress('running', 1, 2, 1.0, age=120), 'c0': shard_progress('running', 1, 2, 1.0), 'c1': shard_progress('finished', 2, 2, 0.0)}
+    def fetch_host_progress(host, ids):
+        if(host == 'h2'):
+            raise Exception('h2 is down.')
+        return {id: dict(progress[id]) for id in ids if id in progress}
+    monkeypatch.setattr(service, 'fetch_host_progress', fetch_host_progress)
+    response = {item['id']: item for item in service.fetch_simulations_progress(['a', 'b', 'c'])}
+    assert response['a']['progress']['stalled']
+    assert response['b']['progress'] is None
+    assert response['c']['progress']['shards'] == 1   # The shard of h2 could not be read
+
+def test_create_rejects_more_cores_than_any_host(simulations_table, hosts):
+    with pytest.raises(Exception, match='No host has 16 cores'):
+        service.create_simulation(default_simulation(cores=16))
+
+def test_create_raises_when_pinned_host_can_not_be_probed(simulations_table, hosts, monkeypatch):
+    def connect(host):
+        raise Exception(f'Credentials not found for host {host}.')
+    monkeypatch.setattr(service, 'connect', connect)
+    with pytest.raises(Exception, match='Credentials not found'):
+        service.create_simulation(default_simulation(host='unknown'))
+
+def test_dispatch_deploys_numbers(simulations_table, hosts, monkeypatch):
+    capacities, probes = hosts
+    deployed = []
+    monkeypatch.setattr(service, 'deploy_simulation', lambda ssh, simulation: deployed.append(simulation) or 1234)
+    service.create_simulation(default_simulation())
+    capacities['h1'] = capacity(8, 8.0)
+    service.host_capacity.clear()
+    assert len(service.dispatch_queued_simulations()) == 1
+    assert isinstance(deployed[0]['years'], int) and isinstance(deployed[0]['timestep'], float)
+
+def sharded_simulation():
+    grid = {'N': 4, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}}
+    return default_simulation(simulation_type='grid', cores=2, hosts=['h1', 'h2'], grid=grid)
+
+def test_create_sharded_simulation(simulations_table, hosts):
+    simulation = service.create_simulation(sharded_simulation())
+    shards = repository.get_batch(simulation['shards'])
+    assert [(shard.host, shard.grid['rows'], shard.status) for shard in shards] == [('h1', [0, 2], 'running'), ('h2', [2, 4], 'running')]
+    assert repository.fetch_statuses([simulation['id']]) == {simulation['id']: 'running'}
+
+def test_failed_shard_deploy_stops_the_started_shards(simulations_table, hosts, monkeypatch):
+    stopped = []
+    def deploy_simulation(ssh, simulation):
+        if(ssh.host == 'h2'):
+            raise Exception('Simulation exited on start: h2 is broken.')
+        return 1234
+    monkeypatch.setattr(service, 'deploy_simulation', deploy_simulation)
+    monkeypatch.setattr(service, 'stop_simulation', lambda ssh, simulation: stopped.append((ssh.host, simulation['process_id'])))
+    with pytest.raises(Exception, match='h2 is broken'):
+        service.create_simulation(sharded_simulation())
+    assert stopped == [('h1', '1234')]
+    assert list(simulations_table.scan()) == []      # Neither the parent nor the shards are saved
+
+def test_stop_simulation(tmp_path):
+    simulation_folder(tmp_path, 'a')
+    shell = LocalShell(tmp_path)
+    pid = int(shell.cmd('nohup bash -c "sleep 60; true" > /dev/null 2>&1 & echo $!')[0])
+    time.sleep(0.2)
+    child = int(shell.cmd(f'pgrep -P {pid}')[0])
+    service.stop_simulation(shell, {'id': 'a', 'process_id': str(pid)})
+    for _ in range(50):
+        if(not os.path.exists(f'/proc/{pid}') and not os.path.exists(f'/proc/{child}')):
+            break
+        time.sleep(0.1)
+    assert not os.path.exists(f'/proc/{pid}') and not os.path.exists(f'/proc/{child}')
+    assert not (tmp_path / 'rebound-ctrl' / 'simulations' / 'a').exists()
+
+def upload_shard(tmp_path, id, rows, megno):
+    ''' Harvested shard: results.tar.gz with a 2 column grid of the given rows, and its logs. '''
+    folder = tmp_path / id
+    (folder / 'results').mkdir(parents=True)
+    np.save(folder / 'results' / 'megno.npy', megno)
+    (folder / 'results' / 'grid.json').write_text(json.dumps({'quantities': ['megno'], 'shape': list(megno.shape), 'rows': rows, 'y_range': rows}))
+    (folder / 'results' / 'results.json').write_text(json.dumps({'start_time': 0, 'end_time': 1, 'duration_time': 1, 'num_simulations': megno.size}))
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        tar.add(folder, arcname='.')
+    s3_adapter.upload_file('rebound-ctrl-test-files', f'simulations/{id}/results.tar.gz', archive)
+    s3_adapter.save_to_s3('rebound-ctrl-test-files', f'simulations/{id}/logs.txt', f'{id} logs')
+
+def test_merge_simulation(s3, simulations_table, tmp_path):
+    grid = {'N': 3, 'particle': {'m': 0.0, 'a': [1.0, 4.0], 'e': [0.0, 0.3]}}
+    save('a', host='h1,h2', status='harvesting', shards=['a0', 'a1'], years=20, timestep=0.01, grid=grid)
+    save('a0', host='h1', status='finished', parent_id='a', grid={**grid, 'rows': [0, 1]})
+    save('a1', host='h2', status='finished', parent_id='a', grid={**grid, 'rows': [1, 3]})
+    upload_shard(tmp_path, 'a1', [1, 3], np.full((2, 3), 8.0))
+    upload_shard(tmp_path, 'a0', [0, 1], np.full((1, 3), 2.0))
+    service.process_job({'type': 'merge', 'id': 'a'})
+    assert repository.fetch_statuses(['a']) == {'a': 'finished'}
+
+    archive = io.BytesIO(s3_adapter.download_file('rebound-ctrl-test-files', 'simulations/a/results.tar.gz'))
+    with tarfile.open(fileobj=archive, mode='r:gz') as tar:
+        meta = json.loads(tar.extractfile('./meta.json').read())
+        megno = np.load(io.BytesIO(tar.extractfile('./results/megno.npy').read()))
+    assert (meta['years'], meta['timestep'], meta['grid']['N']) == (20, 0.01, 3)
+    assert megno[:, 0].tolist() == [2.0, 8.0, 8.0]
+    assert s3_adapter.download_file('rebound-ctrl-test-files', 'simulations/a/logs.txt') == b'[h1]\na0 logs\n[h2]\na1 logs\n'
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    ''' Every host is a local folder. '''
+    monkeypatch.setattr(service, 'connect', lambda host: nullcontext(LocalShell(tmp_path)))
+    return tmp_path / 'rebound-ctrl' / 'simulations'
+
+def files(s3, id):
+    return sorted(file['Key'] for file in s3_adapter.list_files('rebound-ctrl-test-files', f'simulations/{id}'))
+
+@pytest.mark.parametrize('status', ['finished', 'running'])
+def test_process_job_skips_simulations_that_are_not_harvesting(simulations_table, monkeypatch, status):
+    harvested = []
+    monkeypatch.setattr(service, 'harvest_simulation', lambda simulation: harvested.append(simulation.id))
+    save('a', status=status)
+    service.process_job({'type': 'harvest', 'id': 'a'})
+    service.process_job({'type': 'merge', 'id': 'deleted'})
+    assert harvested == []
+
+def test_delete_harvesting_simulation(s3, simulations_table, host):
+    save('a', status='harvesting')
+    simulation_folder(host.parents[1], 'a')
+    s3_adapter.save_to_s3('rebound-ctrl-test-files', 'simulations/a/results.tar.gz', 'saved by the harvest')
+    service.delete_simulation('a')
+    assert not (host / 'a').exists()
+    assert files(s3, 'a') == []
+    assert repository.get_batch(['a']) == []
+
+def test_harvest_of_deleted_simulation_removes_its_files(s3, simulations_table):
+    save('a', status='harvesting')
+    for id in ('a', 'b'):                            # b was deleted while its results were saved
+        s3_adapter.save_to_s3('rebound-ctrl-test-files', f'simulations/{id}/logs.txt', 'logs')
+        service.finish_harvest(id)
+    assert repository.fetch_statuses(['a']) == {'a': 'finished'}
+    assert files(s3, 'a') == ['simulations/a/logs.txt']
+    assert files(s3, 'b') == []
+
+@pytest.mark.parametrize('status, on_host, in_s3', [
+    ('queued', False, False),
+    ('starting', True, False),
+    ('running', True, False),
+    ('harvesting', True, True),
+    ('finished', False, True),
+])
+def test_delete_simulation(simulations_table, tmp_path, monkeypatch, status, on_host, in_s3):
+    connections, deleted_files = [], []
+    monkeypatch.setattr(service, 'connect', lambda host: connections.append(host) or nullcontext(LocalShell(tmp_path)))
+    monkeypatch.setattr(service, 'delete_simulation_files', deleted_files.append)
+    save('a', status=status)
+    service.delete_simulation('a')
+    assert connections == (['h1'] if on_host else [])
+    assert deleted_files == (['a'] if in_s3 else [])
+    assert repository.get_batch(['a']) == []
+
+def test_dispatch_stops_simulations_deleted_while_starting(simulations_table, hosts, monkeypatch):
+    capacities, probes = hosts
+    stopped = []
+    def deploy_simulation(ssh, simulation):
+        service.delete_simulation(simulation['id'])  # Deleted while it was being deployed
+        return 1234
+    monkeypatch.setattr(service, 'deploy_simulation', deploy_simulation)
+    monkeypatch.setattr(service, 'stop_simulation', lambda ssh, simulation: stopped.append((ssh.host, simulation['process_id'])))
+    simulation = service.create_simulation(default_simulation())
+    capacities['h1'] = capacity(8, 8.0)
+    service.host_capacity.clear()
+    assert service.dispatch_queued_simulations() == []
+    assert stopped == [('h1', 1234)]
+    assert repository.get_batch([simulation['id']]) == []
\ No newline at end of file
@@ -0,0 +1,89 @@
+import pytest
+from src.app import service
+
+def save(id, created_at, status='finished', host='h1', **attributes):
+    service.save_simulation({'id': id, 'name': id, 'status': status, 'host': host, 'created_at': created_at, 'particles': [{'m': 1.0}], **attributes})
+
+@pytest.fixture
+def simulations(simulations_table):
+    save('a', '2026-01-01', status='finished')
+    save('b', '2026-01-02', status='running', host='h2')
+    save('c', '2026-01-03', status='running')
+    save('c0', '2026-01-03', status='running', parent_id='c')
+    save('d', '2026-01-04', status='failed', host='h2')
+    return simulations_table
+
+def ids(simulations):
+    return [simulation['id'] for simulation in simulations]
+
+def test_newest_simulations_first(simulations):
+    page, cursor = service.list_simulations()
+    assert ids(page) == ['d', 'c', 'b', 'a']
+    assert cursor is None
+    assert 'particles' not in page[0]
+    assert page[0]['kind'] == 'simulation'
+
+def test_pages_follow_the_cursor(simulations):
+    page, cursor = service.list_simulations(limit=3)
+    assert ids(page) == ['d', 'c', 'b']
+    page, cursor = service.list_simulations(limit=3, cursor=cursor)
+    assert ids(page) == ['a']
+
+def test_invalid_cursor(simulations):
+    with pytest.raises(Exception, match='Invalid cursor'):
+        service.list_simulations(cursor='not a cursor')
+
+def test_filters(simulations):
+    assert ids(service.list_simulations(status='running')[0]) == ['c0', 'c', 'b']
+    assert ids(service.list_simulations(status='running', kind='simulation')[0]) == ['c', 'b']
+    assert ids(service.list_simulations(host='h2')[0]) == ['d', 'b']
+    assert ids(service.list_simulations(host='h1', status='running')[0]) == ['c']  # c0 is listed as its parent
+    assert ids(service.list_simulations(host='h1', status='running', kind='shard')[0]) == ['c0']
+    assert ids(service.list_simulations(kind='shard')[0]) == ['c0']
+
+def test_host_lists_sharded_simulations(simulations):
+    save('e', '2026-01-05', status='running', host='h1,h3', hosts=['h1', 'h3'], shards=['e0', 'e1'])
+    save('e0', '2026-01-05', status='finished', host='h1', parent_id='e')
+    save('e1', '2026-01-05', status='running', host='h3', parent_id='e')
+    assert ids(service.list_simulations(host='h3')[0]) == ['e']
+    assert ids(service.list_simulations(host='h1')[0]) == ['e', 'c', 'a']
+    assert ids(service.list_simulations(host='h1', status='running')[0]) == ['e', 'c']  # Status of the parent
+    assert ids(service.list_simulations(host='h1', kind='shard')[0]) == ['e0', 'c0']
+
+def test_filtered_pages_are_full(simulations):
+    for i in range(10):
+        save(f's{i}', f'2026-02-{i + 1:02}', status='running', parent_id='x')  # Newer shards, read first and filtered out
+    page, cursor = service.list_simulations(status='running', kind='simulation', limit=1)
+    assert ids(page) == ['c']
+    assert ids(service.list_simulations(status='running', kind='simulation', limit=1, cursor=cursor)[0]) == ['b']
+
+def test_pages_that_read_past_the_limit_continue_after_it(simulations):
+    save('f', '2026-01-06', status='running')
+    save('e', '2026-01-05', status='running', parent_id='x')
+    save('g', '2026-01-04T12', status='running')
+    save('h', '2026-01-04T06', status='running')
+    page, cursor = service.list_simulations(status='running', kind='simulation', limit=2)
+    assert ids(page) == ['f', 'g']                   # The second read returns g and h
+    page, cursor = service.list_simulations(status='running', kind='simulation', limit=2, cursor=cursor)
+    assert ids(page) == ['h', 'c']
+
+def test_full_simulations(simulations):
+    page, cursor = service.list_simulations(limit=1, full=True)
+    assert page[0]['id'] == 'd'
+    assert page[0]['particles'] == [{'m': 1.0}]
+
+def test_backfill_simulation_kinds(simulations):
+    simulations(id='e', name='e', status='finished', host='h1', created_at='2026-01-05').save()  # Saved before kind existed
+    assert ids(service.list_simulations()[0]) == ['d', 'c', 'b', 'a']
+    assert service.backfill_simulation_kinds() == 1
+    assert ids(service.list_simulations()[0]) == ['e', 'd', 'c', 'b', 'a']
+    assert service.backfill_simulation_kinds() == 0
+
+def test_list_endpoint(simulations):
+    from src.index import app
+    client = app.test_client()
+    response = client.get('/simulations?limit=2&status=running').get_json()
+    assert ids(response['data']) == ['c0', 'c']
+    assert ids(client.get(f'/simulations?limit=2&status=running&cursor={response["cursor"]}').get_json()['data']) == ['b']
+    assert client.get('/simulations/a').get_json()['data']['name'] == 'a'
+    assert client.get('/simulations/x').status_code == 404
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import socket
+import threading
+import pytest
+
+paramiko = pytest.importorskip('paramiko')
+from src.lib.adapters import ssh_adapter
+from src.lib.adapters.ssh_adapter import SSHClient, SSHConnectionPool
+
+class Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+class Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+def sftp_interface(root):
+    ''' Read only SFTP server of the files in root. '''
+    class Interface(paramiko.SFTPServerInterface):
+        def path(self, path):
+            return os.path.join(root, path.lstrip('/'))
+
+        def stat(self, path):
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.path(path)))
+
+        lstat = stat
+
+        def open(self, path, flags, attr):
+            handle = Handle(flags)
+            handle.filename = self.path(path)
+            handle.readfile = open(handle.filename, 'rb')
+            return handle
+    return Interface
+
+class FakeClient():
+    ''' SSH client that only records whether it is connected. '''
+    def __init__(self, host, username, password, port, keepalive=30):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.alive = False
+
+    def connect(self):
+        self.alive = True
+        return self
+
+    def disconnect(self):
+        self.alive = False
+
+    def is_alive(self):
+        return self.alive
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ssh_adapter, 'SSHClient', FakeClient)
+    return SSHConnectionPool(max_sessions=2, idle_timeout=60, wait_timeout=0.1)
+
+def test_connections_are_reused(pool):
+    with pool.connection('h1', 'user', 'pass', 22) as client:
+        pass
+    with pool.connection('h1', 'user', 'pass', 22) as reused:
+        assert reused is client
+    with pool.connection('h2', 'user', 'pass', 22) as other:
+        assert other is not client
+
+def test_broken_connections_are_replaced(pool):
+    with pool.connection('h1', 'user', 'pass', 22) as client:
+        pass
+    client.alive = False
+    with pool.connection('h1', 'user', 'pass', 22) as replaced:
+        assert replaced is not client
+    assert pool.open[('h1', 'user', 22, 'pass')] == 1
+
+def test_failed_blocks_discard_dead_connections(pool):
+    with pytest.raises(Exception, match='command failed'):
+        with pool.connection('h1', 'user', 'pass', 22) as client:
+            client.alive = False
+            raise Exception('command failed')
+    assert pool.open[('h1', 'user', 22, 'pass')] == 0
+    assert not pool.idle.get(('h1', 'user', 22, 'pass'))
+
+def test_idle_connections_are_evicted(pool, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ssh_adapter.time, 'time', lambda: now[0])
+    with pool.connection('h1', 'user', 'pass', 22) as client:
+        pass
+    now[0] += 61
+    with pool.connection('h1', 'user', 'pass', 22) as new:
+        assert new is not client
+    assert not client.alive
+
+def test_max_sessions_per_host(pool):
+    first = pool.acquire('h1', 'user', 'pass', 22)
+    second = pool.acquire('h1', 'user', 'pass', 22)
+    with pytest.raises(Exception, match='no free SSH connection'):
+        pool.acquire('h1', 'user', 'pass', 22)
+    pool.acquire('h2', 'user', 'pass', 22).disconnect()  # Other hosts have their own limit
+    pool.release(first)
+    assert pool.acquire('h1', 'user', 'pass', 22) is first
+    pool.release(second, discard=True)
+    assert not second.alive
+    assert pool.acquire('h1', 'user', 'pass', 22) is not second
+
+@pytest.fixture
+def sftp_server(tmp_path):
+    ''' Local SFTP server, yields the port and the folder it serves. '''
+    key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    transports = []
+
+    def serve():
+        while(True):
+            try:
+                connection, address = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, sftp_interface(str(tmp_path)))
+            transport.start_server(server=Server())
+            transports.append(transport)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()[1], tmp_path
+    listener.close()
+    for transport in transports:
+        transport.close()
+
+@pytest.fixture
+def client(sftp_server):
+    port, folder = sftp_server
+    client = SSHClient('127.0.0.1', 'user', 'password', port, keepalive=0).connect()
+    yield client
+    client.disconnect()
+
+def test_stream_yields_the_file_in_blocks(client, sftp_server):
+    data = os.urandom(2 * 1024 * 1024 + 12345)
+    (sftp_server[1] / 'results.tar.gz').write_bytes(data)
+    blocks = list(client.stream('results.tar.gz', chunk_size=1024 * 1024))
+    assert [len(block) for block in blocks] == [1024 * 1024, 1024 * 1024, 12345]
+    assert b''.join(blocks) == data
+
+def test_stream_empty_file(client, sftp_server):
+    (sftp_server[1] / 'empty.txt').write_bytes(b'')
+    assert list(client.stream('empty.txt')) == []
+
+def test_read_from_offset(client, sftp_server):
+    (sftp_server[1] / 'logs.txt').write_bytes(b'line 1\nline 2\n')
+    assert client.read('logs.txt', 7) == (b'line 2\n', 14)
+    assert client.read('logs.txt', 0, 4) == (b'line', 14)
+    assert client.read('logs.txt', 14) == (b'', 14)
\ No newline at end of file